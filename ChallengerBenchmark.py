@@ -0,0 +1,656 @@
+'''
+Benchmarks for the parser.
+
+Each case pairs one of the test definitions (see ChallengerTest.py) with a generator
+of synthetic input in the same format, so the size can be scaled well beyond the
+files in testfiles/. Every case reports throughput (lines/s and MB/s) and the peak
+memory of the parse, and can be compared against a stored baseline:
+
+    python ChallengerBenchmark.py                   # run and compare to the baseline
+    python ChallengerBenchmark.py --update          # run and store as the baseline
+    python ChallengerBenchmark.py --lines 5000 grid # run one case at another size
+    python ChallengerBenchmark.py --compressed gzip # streamed against decompress then parse
+    python ChallengerBenchmark.py --server          # per request latency, server against new process
+    python ChallengerBenchmark.py --munch 4         # greedy munches on a 4MB line
+    python ChallengerBenchmark.py --validate        # Input.validate against parse
+    python ChallengerBenchmark.py --shared          # parse_many outputs pickled against shared memory
+    python ChallengerBenchmark.py --numeric         # numeric sections loaded by numpy against line by line
+    python ChallengerBenchmark.py --stack           # the stack executor against recursive blocks
+    python ChallengerBenchmark.py --stats           # parse against parse gathering ParseStats
+
+A case whose throughput drops, or whose peak memory grows, by more than the
+tolerance against the baseline is reported as a regression and the exit code is 1.
+'''
+import io
+import os
+import re
+import sys
+import bz2
+import gzip
+import lzma
+import shutil
+import tempfile
+import json
+import pickle
+import time
+import random
+import argparse
+import statistics
+import subprocess
+import threading
+import tracemalloc
+
+import ChallengerParser as parser
+
+BASELINE = "ChallengerBenchmark.json"
+TOLERANCE = 0.3
+LINES = 20000
+REPEAT = 3
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+COLOURS = ["light red", "dark orange", "bright white", "muted yellow", "shiny gold",
+    "dark olive", "vibrant plum", "faded blue", "dotted black", "pale teal"]
+DIRECTIONS = ["e", "se", "sw", "w", "nw", "ne"]
+FIELDS = ["byr", "iyr", "eyr", "hgt", "hcl", "ecl", "pid", "cid"]
+
+def word(rand, n):
+    return "".join(rand.choice(LETTERS) for i in range(n))
+
+def bagParse(b):
+    if b == " no other bags.":
+        return None
+    sR = {}
+    for l in b.split(','):
+        bM = re.match(r"[\s]*(\d+) (.+) bag[s]{0,1}", l)
+        sR[bM.group(2)] = int(bM.group(1))
+    return sR
+
+def isDir(d):
+    if d in DIRECTIONS:
+        return parser.GACCEPT
+    return parser.GCONTINUE
+
+class BenchCase:
+    '''
+    A definition and a generator of about n lines of matching input
+    '''
+    def __init__(self, name, notation, generate, functions=None):
+        self.name = name
+        self.notation = notation
+        self.generate = generate
+        self.functions = functions or {}
+
+    def definition(self):
+        definition = parser.InputDefinition()
+        for (name, f) in self.functions.items():
+            definition.addFunction(name, f)
+        definition.buildersFromStr(self.notation)
+        return definition
+
+def genList(rand, n):
+    return "".join("%d\n" % rand.randint(0, 100000) for i in range(n))
+
+def genMultiBlock(rand, n):
+    out = []
+    for i in range(n):
+        lo = rand.randint(1, 9)
+        out.append("%d-%d %s: %s\n" % (lo, lo + rand.randint(1, 9), rand.choice(LETTERS), word(rand, rand.randint(5, 15))))
+    return "".join(out)
+
+def genGrid(rand, n):
+    return "".join("".join(rand.choice(".#") for j in range(31)) + "\n" for i in range(n))
+
+def genRows(rand, n):
+    return "".join(" ".join(str(rand.randint(-1000, 1000)) for j in range(12)) + "\n" for i in range(n))
+
+def genDigits(rand, n):
+    return "".join("".join(rand.choice("0123456789") for j in range(40)) + "\n" for i in range(n))
+
+def genHashLines(rand, n):
+    out = []
+    while len(out) < n:
+        fields = ["%s:%s" % (f, word(rand, rand.randint(2, 9))) for f in FIELDS]
+        split = rand.randint(1, len(fields) - 1)
+        out.append(" ".join(fields[:split]) + "\n")
+        out.append(" ".join(fields[split:]) + "\n")
+        out.append("\n")
+    return "".join(out)
+
+def genSeats(rand, n):
+    return "".join("".join(rand.choice("FB") for j in range(7)) + "".join(rand.choice("LR") for j in range(3)) + "\n" for i in range(n))
+
+def genSets(rand, n):
+    out = []
+    while len(out) < n:
+        for i in range(rand.randint(1, 4)):
+            out.append(word(rand, rand.randint(1, 10)) + "\n")
+        out.append("\n")
+    return "".join(out)
+
+def genBags(rand, n):
+    out = []
+    for i in range(n):
+        outer = "%s %d" % (rand.choice(COLOURS), i)
+        if rand.random() < 0.2:
+            out.append("%s bags contain no other bags.\n" % outer)
+        else:
+            inner = ["%d %s bag%s" % (c, rand.choice(COLOURS), "s" if c > 1 else "") for c in [rand.randint(1, 5) for j in range(rand.randint(1, 4))]]
+            out.append("%s bags contain %s.\n" % (outer, ", ".join(inner)))
+    return "".join(out)
+
+def genPairs(rand, n):
+    return "".join("%s %+d\n" % (rand.choice(["nop", "acc", "jmp"]), rand.randint(-500, 500)) for i in range(n))
+
+def genTickets(rand, n):
+    out = []
+    for i in range(20):
+        out.append("field %s: %d-%d or %d-%d\n" % (word(rand, 4), rand.randint(1, 50), rand.randint(51, 400), rand.randint(401, 600), rand.randint(601, 999)))
+    out.append("\nyour ticket:\n")
+    out.append(",".join(str(rand.randint(1, 999)) for i in range(20)) + "\n")
+    out.append("\nnearby tickets:\n")
+    for i in range(max(1, n - len(out))):
+        out.append(",".join(str(rand.randint(1, 999)) for i in range(20)) + "\n")
+    return "".join(out)
+
+def genOrRules(rand, n):
+    rules = max(2, n // 2)
+    out = []
+    for i in range(rules):
+        r = rand.random()
+        if r < 0.1:
+            out.append("%d: \"%s\"\n" % (i, rand.choice("ab")))
+        elif r < 0.5:
+            out.append("%d: %s\n" % (i, " ".join(str(rand.randrange(rules)) for j in range(rand.randint(1, 3)))))
+        else:
+            out.append("%d: %s | %s\n" % (i,
+                " ".join(str(rand.randrange(rules)) for j in range(rand.randint(1, 3))),
+                " ".join(str(rand.randrange(rules)) for j in range(rand.randint(1, 3)))))
+    out.append("\n")
+    for i in range(n - rules):
+        out.append(word(rand, rand.randint(5, 30)).replace("c", "a") + "\n")
+    return "".join(out)
+
+def genTiles(rand, n):
+    out = []
+    while len(out) < n:
+        out.append("Tile %d:\n" % rand.randint(1000, 9999))
+        out.extend("".join(rand.choice(".#") for j in range(10)) + "\n" for i in range(10))
+        out.append("\n")
+    return "".join(out[:-1])
+
+def genFoods(rand, n):
+    allergens = ["dairy", "fish", "soy", "nuts", "eggs", "wheat"]
+    out = []
+    for i in range(n):
+        out.append("%s (contains %s)\n" % (
+            " ".join(word(rand, 7) for j in range(rand.randint(2, 10))),
+            ", ".join(rand.sample(allergens, rand.randint(1, 3)))))
+    return "".join(out)
+
+def genDecks(rand, n):
+    half = max(1, n // 2 - 2)
+    return "Player 1:\n" + genList(rand, half) + "\nPlayer 2:\n" + genList(rand, half)
+
+def genDirections(rand, n):
+    return "".join("".join(rand.choice(DIRECTIONS) for j in range(rand.randint(10, 30))) + "\n" for i in range(n))
+
+CASES = [
+    BenchCase("list", '''[[
+#int#
+]]''', genList),
+    BenchCase("rows", '''[[
+[int ' ']
+]]''', genRows),
+    BenchCase("digits", '''[[
+[int None]
+]]''', genDigits),
+    BenchCase("multiblock", '''[[
+([int '-'] #endTrim# #str# ' ')
+]]''', genMultiBlock, {'endTrim': lambda s: s[:-1]}),
+    BenchCase("grid", '''[[
+[str None]
+]]''', genGrid),
+    BenchCase("hashline", '''[[
+{{
+{*str str ':' ' '}
+}}
+]]''', genHashLines),
+    BenchCase("literalfunc", '''[[
+#seat#
+]]''', genSeats, {'seat': lambda v: int(parser.tr(v, 'BFRL', '1010'), 2)}),
+    BenchCase("sets", '''[[
+[[
+[<str None]
+]]
+]]''', genSets),
+    BenchCase("hashpair", '''{{
+{str bagParse "bags contain"}
+}}''', genBags, {'bagParse': bagParse}),
+    BenchCase("pairs", '''[[
+(#str# #int# ' ')
+]]''', genPairs),
+    BenchCase("tickets", '''{{
+{str ([int '-'] [int '-'] ' or ') ':'}
+}}
+((
+    #"your ticket:"#
+    [int ',']
+))
+((
+    #"nearby tickets:"#
+    [[
+        [int ',']
+    ]]
+))''', genTickets),
+    BenchCase("intervals", '''{{
+{str [-< int '-' ' or '] ':'}
+}}
+((
+    #"your ticket:"#
+    [int ',']
+))
+((
+    #"nearby tickets:"#
+    [[
+        [int ',']
+    ]]
+))''', genTickets),
+    BenchCase("orrules", '''{{
+{int ([int ' '] or #quoteTrim# [int ' '] ' | ') ': '}
+}}
+[[
+[str None]
+]]''', genOrRules, {'quoteTrim': lambda s: s[1]}),
+    BenchCase("tiles", '''[[
+((
+    (#"Tile"# #tileId# ' ')
+    [[
+        [str None]
+    ]]
+))
+]]''', genTiles, {'tileId': lambda s: int(s[:-1])}),
+    BenchCase("encap", '''[[
+{< rev [<str ' '] >[str ', '] endTrim< ' (contains ' }
+]]''', genFoods, {'endTrim': lambda s: s[:-1]}),
+    BenchCase("multibuilder", '''((
+    ##
+    [[
+        #int#
+    ]]
+))''', genDecks),
+    BenchCase("munch", '''[[
+[* str isDir None]
+]]''', genDirections, {'isDir': isDir}),
+    BenchCase("vocabulary", '''[[
+[*= str ('e' 'se' 'sw' 'w' 'nw' 'ne') None]
+]]''', genDirections),
+    ]
+
+def measure(case, lines=LINES, repeat=REPEAT, seed=0):
+    text = case.generate(random.Random(seed), lines)
+    nlines = text.count("\n")
+    nbytes = len(text.encode())
+    definition = case.definition()
+
+    best = timeBest(lambda: parser.Input(io.StringIO(text), definition).parse(), repeat)
+
+    # Timing and memory are separate runs, tracemalloc slows the parse down
+    infile = io.StringIO(text)
+    tracemalloc.start()
+    parser.Input(infile, definition).parse()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'lines': nlines,
+        'bytes': nbytes,
+        'seconds': best,
+        'lines_per_s': nlines / best,
+        'mb_per_s': nbytes / best / 1e6,
+        'peak_kib': peak / 1024,
+        }
+
+COMPRESSORS = {
+    'gzip': gzip.open,
+    'xz': lzma.open,
+    'bz2': bz2.open,
+    }
+
+def timeBest(run, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def measureCompressed(case, kind, lines=LINES, repeat=REPEAT, seed=0):
+    '''
+    Time parsing the case's input stored compressed: decompressed to a temporary
+    file which is then parsed, against streamed through Input.from_path as text
+    and as bytes
+    '''
+    text = case.generate(random.Random(seed), lines)
+    definition = case.definition()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "input")
+        with COMPRESSORS[kind](path, "wb") as f:
+            f.write(text.encode())
+
+        def decompressThenParse():
+            plain = os.path.join(tmp, "plain")
+            with COMPRESSORS[kind](path, "rb") as f, open(plain, "wb") as out:
+                shutil.copyfileobj(f, out)
+            with open(plain) as f:
+                parser.Input(f, definition).parse()
+            os.remove(plain)
+
+        def stream(binary):
+            with parser.Input.from_path(path, definition, binary=binary) as inp:
+                inp.parse()
+
+        return {
+            'lines': text.count("\n"),
+            'compressed_bytes': os.path.getsize(path),
+            'decompress_then_parse': timeBest(decompressThenParse, repeat),
+            'stream': timeBest(lambda: stream(False), repeat),
+            'stream_binary': timeBest(lambda: stream(True), repeat),
+            }
+
+COLD = '''
+import sys
+import ChallengerBenchmark as bench
+import ChallengerParser as parser
+case = [c for c in bench.CASES if c.name == sys.argv[1]][0]
+with open(sys.argv[2]) as f:
+    parser.Input(f, case.definition()).parse()
+'''
+
+def measureServer(case, lines=LINES, repeat=REPEAT, seed=0, requests=20):
+    '''
+    Median latency of parsing the case's input through a warm ChallengerServer,
+    against starting a new python process which imports the parser, builds the
+    definition and parses
+    '''
+    import ChallengerServer as server
+
+    text = case.generate(random.Random(seed), lines)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "input")
+        with open(path, "w") as f:
+            f.write(text)
+        socketPath = os.path.join(tmp, "parser.sock")
+
+        with server.ParseServer(socketPath, {case.name: case.definition()}, 1) as s:
+            thread = threading.Thread(target=s.serve_forever, daemon=True)
+            thread.start()
+            warm = []
+            with server.ParseClient(socketPath) as client:
+                for i in range(requests):
+                    start = time.perf_counter()
+                    client.parse(case.name, path)
+                    warm.append(time.perf_counter() - start)
+            s.shutdown()
+
+        here = os.path.dirname(os.path.abspath(__file__))
+        cold = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", COLD, case.name, path], check=True, cwd=here)
+            cold.append(time.perf_counter() - start)
+
+    return {
+        'lines': text.count("\n"),
+        'warm_ms': statistics.median(warm) * 1000,
+        'cold_ms': statistics.median(cold) * 1000,
+        }
+
+def measureValidate(case, lines=LINES, repeat=REPEAT, seed=0):
+    # Time Input.validate against a full parse of the case's input
+    text = case.generate(random.Random(seed), lines)
+    definition = case.definition()
+    errors = parser.Input(io.StringIO(text), definition).validate()
+    if errors:
+        raise AssertionError("%s input is not valid: %s" % (case.name, errors[0]))
+
+    return {
+        'lines': text.count("\n"),
+        'parse': timeBest(lambda: parser.Input(io.StringIO(text), definition).parse(), repeat),
+        'validate': timeBest(lambda: parser.Input(io.StringIO(text), definition).validate(), repeat),
+        }
+
+def measureShared(case, lines=LINES, repeat=REPEAT, seed=0, chunk=4):
+    '''
+    Time sending a parse_many chunk of the case's outputs back from a worker
+    pickled against through shared memory, the worker's side and the parent's
+    '''
+    text = case.generate(random.Random(seed), lines)
+    outputs = [parser.Input(io.StringIO(text), case.definition()).parse() for i in range(chunk)]
+    pickled = pickle.dumps(outputs, pickle.HIGHEST_PROTOCOL)
+
+    def sharedSend():
+        return pickle.dumps(parser.shareOutputs(outputs), pickle.HIGHEST_PROTOCOL)
+    descriptors = sharedSend()
+    if parser.unshare(parser.sharedOutputs(pickle.loads(descriptors))) != outputs:
+        raise AssertionError("%s outputs differ through shared memory" % case.name)
+
+    # Every send writes a segment, only attaching it in a receive frees it
+    sends = []
+    def sharedSendKept():
+        sends.append(sharedSend())
+    sharedSendTime = timeBest(sharedSendKept, repeat)
+    receive = None
+    for sent in sends:
+        start = time.perf_counter()
+        parser.sharedOutputs(pickle.loads(sent))
+        elapsed = time.perf_counter() - start
+        receive = elapsed if receive is None else min(receive, elapsed)
+
+    return {
+        'lines': text.count("\n") * chunk,
+        'pickle_send': timeBest(lambda: pickle.dumps(outputs, pickle.HIGHEST_PROTOCOL), repeat),
+        'pickle_receive': timeBest(lambda: pickle.loads(pickled), repeat),
+        'pickle_bytes': len(pickled),
+        'shared_send': sharedSendTime,
+        'shared_receive': receive,
+        'shared_bytes': len(descriptors),
+        }
+
+def measureNumeric(case, lines=LINES, repeat=REPEAT, seed=0):
+    # Time the case's parse with numeric sections loaded by numpy and line by line
+    text = case.generate(random.Random(seed), lines)
+    definition = case.definition()
+    loaded = parser.Input(io.StringIO(text), definition).parse()
+    numpyMin = parser.NUMPYMIN
+    parser.NUMPYMIN = float('inf')
+    try:
+        if parser.Input(io.StringIO(text), definition).parse() != loaded:
+            raise AssertionError("%s outputs differ when loaded by numpy" % case.name)
+        python = timeBest(lambda: parser.Input(io.StringIO(text), definition).parse(), repeat)
+    finally:
+        parser.NUMPYMIN = numpyMin
+
+    return {
+        'lines': text.count("\n"),
+        'python': python,
+        'numpy': timeBest(lambda: parser.Input(io.StringIO(text), definition).parse(), repeat),
+        }
+
+def measureStack(case, lines=LINES, repeat=REPEAT, seed=0):
+    # Time the case's parse by recursive blocks against its flattened StackProgram
+    text = case.generate(random.Random(seed), lines)
+    recursive = case.definition()
+    stack = case.definition()
+    stack.setExecutor('stack')
+    if parser.Input(io.StringIO(text), stack).parse() != parser.Input(io.StringIO(text), recursive).parse():
+        raise AssertionError("%s outputs differ on the stack executor" % case.name)
+
+    return {
+        'lines': text.count("\n"),
+        'recursive': timeBest(lambda: parser.Input(io.StringIO(text), recursive).parse(), repeat),
+        'stack': timeBest(lambda: parser.Input(io.StringIO(text), stack).parse(), repeat),
+        }
+
+def measureStats(case, lines=LINES, repeat=REPEAT, seed=0):
+    # Time the case's parse alone against the parse gathering ParseStats
+    text = case.generate(random.Random(seed), lines)
+    definition = case.definition()
+    (out, stats) = parser.Input(io.StringIO(text), definition).parse_stats()
+    if out != parser.Input(io.StringIO(text), definition).parse():
+        raise AssertionError("%s outputs differ when gathering stats" % case.name)
+
+    return {
+        'lines': text.count("\n"),
+        'parse': timeBest(lambda: parser.Input(io.StringIO(text), definition).parse(), repeat),
+        'stats': timeBest(lambda: parser.Input(io.StringIO(text), definition).parse_stats(), repeat),
+        }
+
+def measureMunch(megabytes=1, repeat=REPEAT, seed=0):
+    '''
+    Time splitting one line of directions megabytes long with the evaluator driven
+    ListElementMunch against the VocabularyMunch of the same directions
+    '''
+    rand = random.Random(seed)
+    size = int(megabytes * 1e6)
+    line = "".join(rand.choice(DIRECTIONS) for i in range(size))[:size]
+    evaluator = parser.ListElementMunch(isDir, str, None)
+    vocabulary = parser.VocabularyMunch(DIRECTIONS, str, None)
+    if evaluator.parse(line) != vocabulary.parse(line):
+        raise AssertionError("Munches disagree")
+
+    return {
+        'bytes': len(line),
+        'evaluator': timeBest(lambda: evaluator.parse(line), repeat),
+        'vocabulary': timeBest(lambda: vocabulary.parse(line), repeat),
+        }
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    # Returns a message per regression, cases missing from the baseline are skipped
+    regressions = []
+    for (name, r) in results.items():
+        if name not in baseline:
+            continue
+        b = baseline[name]
+        if r['lines_per_s'] < b['lines_per_s'] * (1 - tolerance):
+            regressions.append("%s: throughput %.0f lines/s against baseline %.0f lines/s" % \
+                (name, r['lines_per_s'], b['lines_per_s']))
+        if r['peak_kib'] > b['peak_kib'] * (1 + tolerance):
+            regressions.append("%s: peak memory %.0f KiB against baseline %.0f KiB" % \
+                (name, r['peak_kib'], b['peak_kib']))
+    return regressions
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description="Run the parser benchmarks")
+    args.add_argument("cases", nargs="*", help="cases to run, all by default")
+    args.add_argument("--lines", type=int, default=LINES, help="approximate input lines per case")
+    args.add_argument("--repeat", type=int, default=REPEAT, help="timed runs per case, the best is kept")
+    args.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed relative regression")
+    args.add_argument("--baseline", default=BASELINE, help="baseline file")
+    args.add_argument("--update", action="store_true", help="store the results as the baseline")
+    args.add_argument("--compressed", choices=sorted(COMPRESSORS),
+        help="compare streaming compressed input against decompressing it first")
+    args.add_argument("--server", action="store_true",
+        help="compare request latency through a parse server against a new process")
+    args.add_argument("--validate", action="store_true",
+        help="compare validating the input against parsing it")
+    args.add_argument("--shared", action="store_true",
+        help="compare sending parse_many outputs pickled and through shared memory")
+    args.add_argument("--numeric", action="store_true",
+        help="compare loading numeric sections with numpy against parsing them line by line")
+    args.add_argument("--stack", action="store_true",
+        help="compare the stack executor against recursive blocks")
+    args.add_argument("--stats", action="store_true",
+        help="compare the parse alone against the parse gathering statistics")
+    args.add_argument("--munch", type=float, metavar="MB",
+        help="compare the evaluator and vocabulary munches on a line of MB megabytes")
+    args = args.parse_args(argv)
+
+    if args.munch:
+        r = measureMunch(args.munch, args.repeat)
+        print("%10d bytes %9.3fs evaluator %9.3fs vocabulary %6.1fx" % \
+            (r['bytes'], r['evaluator'], r['vocabulary'], r['evaluator'] / r['vocabulary']))
+        return 0
+
+    cases = [c for c in CASES if not args.cases or c.name in args.cases]
+    if args.compressed:
+        for case in cases:
+            r = measureCompressed(case, args.compressed, args.lines, args.repeat)
+            print("%-14s %8d lines %9.3fs decompress+parse %9.3fs stream %9.3fs stream bytes" % \
+                (case.name, r['lines'], r['decompress_then_parse'], r['stream'], r['stream_binary']))
+        return 0
+    if args.validate:
+        for case in cases:
+            r = measureValidate(case, args.lines, args.repeat)
+            print("%-14s %8d lines %9.3fs parse %9.3fs validate %6.1fx" % \
+                (case.name, r['lines'], r['parse'], r['validate'], r['parse'] / r['validate']))
+        return 0
+    if args.stack:
+        for case in cases:
+            r = measureStack(case, args.lines, args.repeat)
+            print("%-14s %8d lines %9.3fs recursive %9.3fs stack %6.1fx" % \
+                (case.name, r['lines'], r['recursive'], r['stack'], r['recursive'] / r['stack']))
+        return 0
+    if args.stats:
+        for case in cases:
+            r = measureStats(case, args.lines, args.repeat)
+            print("%-14s %8d lines %9.3fs parse %9.3fs stats %6.1fx" % \
+                (case.name, r['lines'], r['parse'], r['stats'], r['stats'] / r['parse']))
+        return 0
+    if args.numeric:
+        if parser.numpyModule() is None:
+            print("numpy is not installed")
+            return 1
+        for case in cases:
+            r = measureNumeric(case, args.lines, args.repeat)
+            print("%-14s %8d lines %9.3fs line by line %9.3fs numpy %6.1fx" % \
+                (case.name, r['lines'], r['python'], r['numpy'], r['python'] / r['numpy']))
+        return 0
+    if args.shared:
+        for case in cases:
+            r = measureShared(case, args.lines, args.repeat)
+            print("%-14s %8d lines send %8.3fs/%8.3fs receive %8.3fs/%8.3fs %9d/%9d bytes pickle/shared" % \
+                (case.name, r['lines'], r['pickle_send'], r['shared_send'], r['pickle_receive'], r['shared_receive'],
+                r['pickle_bytes'], r['shared_bytes']))
+        return 0
+    if args.server:
+        for case in cases:
+            r = measureServer(case, args.lines, args.repeat)
+            print("%-14s %8d lines %9.1fms server %9.1fms new process %6.1fx" % \
+                (case.name, r['lines'], r['warm_ms'], r['cold_ms'], r['cold_ms'] / r['warm_ms']))
+        return 0
+
+    results = {}
+    for case in cases:
+        r = measure(case, args.lines, args.repeat)
+        results[case.name] = r
+        print("%-14s %8d lines %10.0f lines/s %7.2f MB/s %10.0f KiB peak" % \
+            (case.name, r['lines'], r['lines_per_s'], r['mb_per_s'], r['peak_kib']))
+
+    if args.update:
+        try:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            baseline = {}
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+        return 0
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print("No baseline at %s, run with --update to create one" % args.baseline)
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for r in regressions:
+        print("REGRESSION %s" % r)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,6 +18,7 @@ builderstart
     | multibuilderstart
     | listbuilderstart
     | hashbuilderstart
+    | graphbuilderstart
     ;
 
 builderend
@@ -25,6 +26,7 @@ builderend
     | multibuilderend
     | listbuilderend
     | hashbuilderend
+    | graphbuilderend
     ;
 
 multibuilderstart
@@ -34,7 +36,7 @@ multibuilderstart
 
 multibuilderend
     =
-    '))' [quotedstring] ['/' functionName]
+    '))' [quotedstring] ['/' functionName] ['->' functionName]
     ;
 
 listbuilderstart
@@ -44,7 +46,7 @@ listbuilderstart
 
 listbuilderend
     =
-    ']]' [quotedstring] ['/' functionName]
+    ']]' [quotedstring] ['/' functionName] ['->' functionName]
     ;
 
 hashbuilderstart
@@ -54,7 +56,17 @@ hashbuilderstart
 
 hashbuilderend
     =
-    '}}' [quotedstring] ['/' functionName]
+    '}}' [quotedstring] ['/' functionName] ['->' functionName]
+    ;
+
+graphbuilderstart
+    =
+    '<<'
+    ;
+
+graphbuilderend
+    =
+    '>>' [quotedstring] ['/' functionName] ['->' functionName]
     ;
 
 quotedstring
@@ -74,12 +86,16 @@ block
     | encapblock
     | literalblock
     | listblock
+    | vocabularymunch
     | greedylistblock
     | setblock
+    | intervalblock
+    | rangeblock
     | hashpairblock
     | hashpairdistribute
     | hashlineblock
     | multiblock
+    | regexblock
     ;
 
 orblock
@@ -114,33 +130,50 @@ greedylistblock
     '[*' functionName functionName (quotedstring|none) ['/' functionName] ']'
     ;
 
+vocabularymunch
+    =
+    '[*=' functionName '(' {quotedstring}+ ')' (quotedstring|none) ['/' functionName] ']'
+    ;
+
 setblock
     =
     '[<' functionName (quotedstring|none) ['/' functionName] ']'
     ;
 
+rangeblock
+    =
+    '[-' functionName quotedstring ['/' functionName] ']'
+    ;
+
+intervalblock
+    =
+    '[-<' functionName quotedstring quotedstring ['/' functionName] ']'
+    ;
+
 hashableblock
     =
     | literalblock
     | listblock
     | greedylistblock
     | setblock
+    | intervalblock
+    | rangeblock
     | hashableencapblock
     ;
 
 hashpairblock
     =
-    '{' ['rev'] (functionName|hashableblock) (functionName|block) quotedstring ['/' functionName] '}'
+    '{' ['rev'] ['intern'] (functionName|hashableblock) (functionName|block) quotedstring ['/' functionName] '}'
     ;
 
 hashpairdistribute
     =
-    '{<' ['rev'] (functionName|hashableblock) (functionName|block) quotedstring ['/' functionName] '}'
+    '{<' ['rev'] ['intern'] (functionName|hashableblock) (functionName|block) quotedstring ['/' functionName] '}'
     ;
 
 hashlineblock
     =
-    '{*' ['rev'] (functionName|hashableblock) (functionName|block) quotedstring quotedstring ['/' functionName] '}'
+    '{*' ['rev'] ['intern'] (functionName|hashableblock) (functionName|block) quotedstring quotedstring ['/' functionName] '}'
     ;
 
 multiblock
@@ -148,6 +181,16 @@ multiblock
     '(' {block}+ quotedstring ['/' functionName] ')'
     ;
 
+regexblock
+    =
+    regexpattern ['(' {functionName|block}+ ['/' functionName] ')']
+    ;
+
+regexpattern
+    =
+    /\\/(?:\\\\.|[^\\/\\\\])+\\//
+    ;
+
 functionName
     =
     /[a-zA-Z]+[a-zA-Z0-9_.]+/
@@ -1,6 +1,29 @@
+import io
+import os
 import sys
+import gzip
+import bz2
+import lzma
+import zlib
 import re
+import copy
+import codecs
+import operator
+import json
+import math
+import time
+import marshal
+import struct
+import array
+import bisect
+import mmap
+import itertools
+import collections
 import logging
+import threading
+import multiprocessing
+import concurrent.futures
+from multiprocessing import shared_memory, resource_tracker
 import tatsu
 import ChallengerGrammar
 
@@ -19,13 +42,196 @@ def tr(inS, i, s):
 def CharIgnore(inp):
     return ""
 
+class MemoFunction:
+    '''
+    Wraps a pure parser function (one whose result depends only on its input) with a
+    bounded least recently used cache. Repeated tokens skip the call and get back the
+    same result object, so mutable results are shared between everything using them.
+    Inputs which cannot be hashed are passed straight through.
+    '''
+    def __init__(self, func, maxsize=4096):
+        self.func = func
+        self.maxsize = maxsize
+        self.cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if not callable(func):
+            raise TypeError("MemoFunction needs a callable")
+
+        if maxsize < 1:
+            raise ValueError("MemoFunction maxsize must be at least 1")
+
+    def __deepcopy__(self, memo):
+        # Copies of a definition share the cache
+        return self
+
+    def __call__(self, value):
+        try:
+            out = self.cache[value]
+        except KeyError:
+            self.misses += 1
+            out = self.func(value)
+            self.cache[value] = out
+            if len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+                self.evictions += 1
+            return out
+        except TypeError:
+            return self.func(value)
+
+        self.hits += 1
+        self.cache.move_to_end(value)
+        return out
+
+    def cacheInfo(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self.cache),
+            'maxsize': self.maxsize,
+            }
+
+    def cacheClear(self):
+        self.cache.clear()
+
+# Attributes blocks use as scratch space while parsing, these are not copied
+SCRATCHATTRS = ['list', 'hash', 'items', 'value', 'key']
+
+def recordStops(count, record, limit, stop_when):
+    return (limit is not None and count >= limit) or \
+        (stop_when is not None and stop_when(record))
+
+# Read size when skipping to an end value
+SKIPCHUNK = 1 << 16
+
+def skipPast(infile, endvalue):
+    '''
+    Move infile to just after the next line equal to endvalue once stripped, or to
+    its end, scanning large chunks rather than reading line by line. Each chunk
+    is read again up to where the scan stopped, so only files over a file
+    descriptor or in memory are scanned. Returns False, without reading, for the
+    others (a decompressing stream seeking back starts again from its beginning).
+    '''
+    if not isinstance(infile, io.IOBase) or not infile.seekable():
+        return False
+    raw = getattr(infile, 'buffer', infile)
+    raw = getattr(raw, 'raw', raw)
+    if not isinstance(raw, (io.FileIO, io.BytesIO, io.StringIO)):
+        return False
+    nl = "\n" if isinstance(endvalue, str) else b"\n"
+    trail = "[^\\S\\n]*\\n" if isinstance(endvalue, str) else b"[^\\S\\n]*\\n"
+    # The end line at the start of the chunk, or after a line end, which gives
+    # the search a literal prefix to look for
+    first = re.compile(re.escape(endvalue) + trail)
+    later = re.compile(re.escape(nl + endvalue) + trail)
+    # Text file positions are opaque, so the file is moved by reading from a position
+    opaque = isinstance(infile, io.TextIOWrapper)
+
+    lineStart = True
+    while True:
+        pos = infile.tell()
+        data = infile.read(SKIPCHUNK)
+        if not data:
+            return True
+        begin = 0
+        if not lineStart:
+            begin = data.find(nl) + 1
+            if begin == 0:
+                continue
+
+        m = first.match(data, begin) or later.search(data, begin)
+        last = data.rfind(nl) + 1
+        end = None
+        if m is not None:
+            end = m.end()
+        elif not data.endswith(nl) and last > 0:
+            # The last line starts here and continues in the next chunk, so is
+            # scanned again from its start (begin, if it is the only one)
+            end = last
+        if end is not None:
+            if opaque:
+                infile.seek(pos)
+                infile.read(end)
+            else:
+                infile.seek(pos + end)
+            if m is not None:
+                return True
+            lineStart = True
+        else:
+            lineStart = data.endswith(nl)
+
+def blockDeepcopy(block, memo):
+    # Every block of the tree is copied and in memo before any attribute is, so
+    # deepcopy finds the nested blocks there rather than recursing into them
+    copies = []
+    todo = [block]
+    while todo:
+        b = todo.pop()
+        if id(b) in memo:
+            continue
+        new = copy.copy(b)
+        memo[id(b)] = new
+        copies.append((b, new))
+        todo.extend(c for (a, i, c) in blockChildren(b))
+
+    for (b, new) in copies:
+        for (k, v) in b.__dict__.items():
+            if k in SCRATCHATTRS:
+                delattr(new, k)
+            else:
+                setattr(new, k, copy.deepcopy(v, memo))
+    return memo[id(block)]
+
+class FrozenDict(dict):
+    '''
+    Read only dict built by frozen definitions, hashable when its values are
+    '''
+    __slots__ = ()
+
+    def readonly(self, *args, **kwargs):
+        raise TypeError("FrozenDict is read only")
+
+    __setitem__ = __delitem__ = readonly
+    clear = pop = popitem = setdefault = update = __ior__ = readonly
+
+    def __hash__(self):
+        return hash(frozenset(self.items()))
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+    def __repr__(self):
+        return "FrozenDict(%s)" % dict.__repr__(self)
+
+def thaw(out):
+    # Frozen output back to lists, sets and dicts
+    if isinstance(out, tuple):
+        return [thaw(o) for o in out]
+    if isinstance(out, frozenset):
+        # Set items are hashable, so are left as they are
+        return set(out)
+    if isinstance(out, FrozenDict):
+        return {k: thaw(v) for (k, v) in out.items()}
+    return out
+
 class SingleBlock:
+    # Set on the bytes copy of a definition (see InputDefinition.binary)
+    encoding = None
+    # Frozen blocks build tuples, frozensets and FrozenDicts (see InputDefinition)
+    frozen = False
+
     def __init__(self):
         return
 
     def parse(self, inp):
         return inp
 
+    def __deepcopy__(self, memo):
+        return blockDeepcopy(self, memo)
+
 class OrBlock(SingleBlock):
     def __init__(self, parsers):
         self.parsers = parsers
@@ -118,12 +324,180 @@ class MultiBlockLine(SingleBlock):
 
         if len(self.items) == 1:
             self.items = self.items[0]
+        elif self.frozen:
+            self.items = tuple(self.items)
 
         if self.callback is not None:
                 return self.callback(self.items)
         return self.items
 
+class RegexBlock(SingleBlock):
+    def __init__(self, pattern, parsers=None, callback=None):
+        if isinstance(pattern, str):
+            self.regex = re.compile(pattern, re.S)
+        else:
+            self.regex = pattern
+        self.callback = callback
+
+        if parsers is None:
+            parsers = [str] * self.regex.groups
+        self.parsers = parsers
+
+        if callback is not None and not callable(callback):
+            raise TypeError("Callback must be callable")
+
+        if len(self.parsers) != self.regex.groups:
+            raise ValueError("RegexBlock needs one parser per capture group")
+
+        for p in self.parsers:
+            if not callable(p) and not isinstance(p, SingleBlock):
+                raise TypeError("RegexBlock parsers must be callable or SingleBlock")
+
+    def parse(self, inp):
+        logging.debug("inp: \"%s\"" % inp)
+        m = self.regex.fullmatch(inp)
+        if m is None:
+            raise ValueError("RegexBlock pattern did not match \"%s\"" % inp)
+
+        self.items = []
+        for (g, p) in zip(m.groups(), self.parsers):
+            # Groups that did not take part in the match are skipped
+            if g is None:
+                continue
+            if isinstance(p, SingleBlock):
+                bout = p.parse(g)
+            else:
+                bout = p(g)
+            if bout is not None:
+                self.items.append(bout)
+
+        if len(self.items) == 1:
+            self.items = self.items[0]
+        elif self.frozen:
+            self.items = tuple(self.items)
+
+        if self.callback is not None:
+            return self.callback(self.items)
+        return self.items
+
+class CompiledLineBlock(RegexBlock):
+    '''
+    A MultiBlockLine tree flattened into one regular expression. Each LiteralBlock
+    and list field leaf is a capture group (a list field is split by its own block),
+    the original tree is kept to rebuild the nested output
+    and as a fallback for lines the expression does not match (fewer fields than
+    blocks, mismatching absolute literals), so errors are exactly those of the tree.
+    '''
+    def __init__(self, source, pattern, layout):
+        self.source = source
+        self.regex = re.compile(pattern, re.S)
+        self.layout = layout
+        self.callback = None
+        self.parsers = []
+
+    def assemble(self, layout, groups):
+        # Layout nodes are (MultiBlockLine, [children]), (LiteralBlock, group),
+        # (list field block, group) or (LiteralNoParse, None), matching the source tree
+        node, sub = layout
+        if isinstance(node, LiteralBlock):
+            if node.callback is not None:
+                return node.callback(node.parser(groups[sub]))
+            return node.parser(groups[sub])
+        elif isinstance(node, LiteralNoParse):
+            return None
+        elif isinstance(node, FIELDBLOCKS):
+            return node.parse(groups[sub])
+
+        items = []
+        for l in sub:
+            bout = self.assemble(l, groups)
+            if bout is not None:
+                items.append(bout)
+
+        if len(items) == 1:
+            items = items[0]
+        elif node.frozen:
+            items = tuple(items)
+
+        if node.callback is not None:
+            return node.callback(items)
+        return items
+
+    def parse(self, inp):
+        logging.debug("inp: \"%s\"" % inp)
+        m = self.regex.fullmatch(inp)
+        if m is None:
+            return self.source.parse(inp)
+        return self.assemble(self.layout, m.groups())
+
+def regexField(forbidden):
+    # Pattern for a split field: any text not containing one of the delimiters
+    if len(forbidden) == 0:
+        return ".*"
+    if all(len(d) == 1 for d in forbidden):
+        return "[^%s]*" % "".join(re.escape(d) for d in forbidden)
+    return "(?:(?!%s).)*" % "|".join(re.escape(d) for d in forbidden)
+
+# MultiBlockLines nested deeper than this are left to their blocks
+REGEXDEPTH = 32
+
+def regexCompile_helper(block, forbidden, groups):
+    # Returns (pattern, layout) for block, or None if it is not just fixed
+    # delimiters and literals. forbidden are the enclosing delimiters which
+    # str.split would have cut at, groups counts capture groups so far
+    if len(forbidden) > REGEXDEPTH:
+        return None
+    if isinstance(block, LiteralBlock):
+        groups[0] += 1
+        return "(%s)" % regexField(forbidden), (block, groups[0] - 1)
+    elif isinstance(block, FIELDBLOCKS):
+        # The field is the text the enclosing splits would give the list, which
+        # splits it itself
+        groups[0] += 1
+        return "(%s)" % regexField(forbidden), (block, groups[0] - 1)
+    elif isinstance(block, LiteralNoParse):
+        if block.absolute is None:
+            return regexField(forbidden), (block, None)
+        if set(block.absolute) & set("".join(forbidden)):
+            return None
+        return re.escape(block.absolute), (block, None)
+    elif type(block) is MultiBlockLine:
+        if not isinstance(block.delimiter, str) or block.delimiter == "":
+            return None
+        # Nested delimiters sharing characters could split differently
+        if set(block.delimiter) & set("".join(forbidden)):
+            return None
+        inner = forbidden + [block.delimiter]
+        patterns = []
+        layouts = []
+        for b in block.blocks:
+            compiled = regexCompile_helper(b, inner, groups)
+            if compiled is None:
+                return None
+            patterns.append(compiled[0])
+            layouts.append(compiled[1])
+        # str.split keeps going past the last block, zip drops the extra fields
+        pattern = re.escape(block.delimiter).join(patterns) + \
+            "(?:%s%s)?" % (re.escape(block.delimiter), regexField(forbidden))
+        return pattern, (block, layouts)
+    return None
+
+def regexCompile(block):
+    '''
+    Compile a MultiBlockLine made only of fixed delimiters, LiteralBlocks, list
+    fields (see FIELDBLOCKS) and LiteralNoParse (nesting allowed) into a
+    CompiledLineBlock, None otherwise
+    '''
+    if type(block) is not MultiBlockLine:
+        return None
+    compiled = regexCompile_helper(block, [], [0])
+    if compiled is None:
+        return None
+    return CompiledLineBlock(block, compiled[0], compiled[1])
+
 class ListBlock(SingleBlock):
+    frozenType = tuple
+
     def __init__(self, elementParser, delimiter, callback=None):
         self.elementParser = elementParser
         self.delimiter = delimiter
@@ -139,6 +513,9 @@ class ListBlock(SingleBlock):
         self.list = []
         logging.debug("inp: \"%s\"" % inp)
         if self.delimiter is None:
+            # Iterating bytes gives ints, so characters are taken from the text
+            if self.encoding is not None:
+                inp = inp.decode(self.encoding)
             for i in inp:
                 eparse = self.elementParser(i)
                 if eparse is not None:
@@ -149,6 +526,11 @@ class ListBlock(SingleBlock):
                 if eparse is not None:
                     self.list.append(eparse)
 
+        if isinstance(self.elementParser, Categorical):
+            self.list = self.elementParser.packed(self.list)
+        if self.frozen:
+            self.list = self.frozenType(self.list)
+
         if self.callback is not None:
             return self.callback(self.list)
 
@@ -174,14 +556,17 @@ class ListElementMunch(SingleBlock):
         if not callable(elementParser):
             raise TypeError("List elementParser must be callable")
 
-    def elementTester_helper(self, cand, remaining):
+    def elementTester_helper(self, cand, remaining, parser=None):
         if self.delimiter == None:
             delim = ''
         else:
             delim = self.delimiter
+        if parser is None:
+            parser = self.elementParser
 
-        cand.append(remaining.pop(0))
-        eparse = self.elementParser(delim.join(cand))
+        # remaining is reversed, so taking the next value is a pop from the end
+        cand.append(remaining.pop())
+        eparse = parser(delim.join(cand))
         accept = self.elementEvaluator(eparse)
         if accept == GACCEPT:
             self.list.append(eparse)
@@ -190,63 +575,410 @@ class ListElementMunch(SingleBlock):
             # When rejecting we throw away the first character and continue
             # searching
             cand.pop(0)
-            remaining[0:0] = cand
+            remaining.extend(reversed(cand))
+            cand = []
 
         return cand, remaining
 
-    def parse(self, inp):
+    def munch(self, inp):
+        # The accepted elements, not yet coded when the parser is categorical
         self.list = []
-        logging.debug("inp: \"%s\"" % inp)
         if self.delimiter is None:
+            if self.encoding is not None:
+                inp = inp.decode(self.encoding)
             remaining = [c for c in inp]
         else:
             remaining = inp.split(self.delimiter)
+        remaining.reverse()
+
+        parser = self.elementParser
+        if isinstance(parser, Categorical):
+            # Candidates are evaluated as values, only accepted elements are coded
+            parser = parser.func
 
         cand = []
         while len(remaining) > 0:
-            cand, remaining = self.elementTester_helper(cand, remaining)
+            cand, remaining = self.elementTester_helper(cand, remaining, parser)
+        return self.list
+
+    def parse(self, inp):
+        logging.debug("inp: \"%s\"" % inp)
+        self.munch(inp)
+
+        if isinstance(self.elementParser, Categorical):
+            code = self.elementParser.vocabulary.code
+            self.list = self.elementParser.packed([code(e) for e in self.list])
+        if self.frozen:
+            self.list = tuple(self.list)
 
         if self.callback is not None:
             return self.callback(self.list)
 
         return self.list
 
+def vocabularyPrefixes(vocabulary, delimiter):
+    # The proper prefixes of the tokens, in characters or in delimited fields
+    prefixes = set()
+    for t in vocabulary:
+        if delimiter is None:
+            prefixes.update(t[:i] for i in range(len(t)))
+        else:
+            fields = t.split(delimiter)
+            prefixes.update(delimiter.join(fields[:i]) for i in range(len(fields)))
+    return prefixes
+
+def vocabularyPattern(vocabulary, longest=False):
+    # A regular expression of the tokens shaped as their trie, so each position is
+    # tried one character at a time rather than against every token in turn
+    trie = {}
+    for t in vocabulary:
+        node = trie
+        for c in t:
+            node = node.setdefault(c, {})
+        node[''] = None
+
+    def pattern(node):
+        leaves = sorted(c for (c, child) in node.items() if c and list(child) == [''])
+        alts = [re.escape(c) + pattern(child) for (c, child) in sorted(node.items()) \
+            if c and list(child) != ['']]
+        if len(leaves) == 1:
+            alts.append(re.escape(leaves[0]))
+        elif leaves:
+            alts.append("[%s]" % "".join(re.escape(c) for c in leaves))
+        body = alts[0] if len(alts) == 1 else "(?:%s)" % "|".join(alts)
+        if '' in node:
+            # A token ends here, lazily taken before longer ones unless longest
+            body = "(?:%s)%s" % (body, "?" if longest else "??")
+        return body
+
+    return pattern(trie)
+
+def vocabularyEvaluator(vocabulary, delimiter=None):
+    # The ListElementMunch evaluator splitting the tokens of a vocabulary
+    tokens = set(vocabulary)
+    prefixes = vocabularyPrefixes(vocabulary, delimiter)
+    def evaluate(cand):
+        if cand in tokens:
+            return GACCEPT
+        if cand in prefixes:
+            return GCONTINUE
+        return GREJECT
+    return evaluate
+
+class VocabularyMunch(SingleBlock):
+    '''
+    Greedy list over a fixed vocabulary of tokens, split in one pass by a
+    precompiled regular expression rather than calling an evaluator on every
+    growing candidate. The output is that of a ListElementMunch with
+    vocabularyEvaluator: the shortest token at each position is taken, anything
+    else is skipped. With longest the longest token is taken instead.
+    '''
+    def __init__(self, vocabulary, elementParser, delimiter, callback=None, longest=False):
+        self.vocabulary = list(vocabulary)
+        self.elementParser = elementParser
+        self.delimiter = delimiter
+        self.callback = callback
+        self.longest = longest
+
+        if len(self.vocabulary) == 0 or \
+            not all(isinstance(t, str) and t != "" for t in self.vocabulary):
+            raise TypeError("Vocabulary must be non empty strs")
+
+        if not callable(elementParser):
+            raise TypeError("List elementParser must be callable")
+
+        if callback is not None and not callable(callback):
+            raise TypeError("Callback must be callable")
+
+        pattern = vocabularyPattern(self.vocabulary, longest)
+        if delimiter is not None:
+            # Tokens are whole fields
+            d = re.escape(delimiter)
+            pattern = "(?:\\A|(?<=%s))(?:%s)(?=%s|\\Z)" % (d, pattern, d)
+        self.regex = re.compile(pattern, re.S)
+        self.prefixes = vocabularyPrefixes(self.vocabulary, delimiter)
+        self.maxlen = max(len(t) for t in self.vocabulary)
+
+    def tokenStarts(self, inp, start, end):
+        # The positions between start and end a ListElementMunch would try
+        if self.delimiter is None:
+            return range(start, end)
+        starts = []
+        i = start
+        while i < end:
+            if i == 0 or inp.startswith(self.delimiter, i - len(self.delimiter)):
+                starts.append(i)
+            i += 1
+        return starts
+
+    def tokens(self, inp):
+        # Tokens are text, so bytes are split once decoded
+        if self.encoding is not None:
+            inp = inp.decode(self.encoding)
+
+        # Only a position within a token's length of the end can start a candidate
+        # which is still a prefix when the input ends. A ListElementMunch stops there,
+        # so tokens the expression finds after it are dropped.
+        tail = len(inp) - self.maxlen
+        if self.longest or \
+            not any(inp[p:] in self.prefixes for p in self.tokenStarts(inp, max(0, tail), len(inp))):
+            tokens = self.regex.findall(inp)
+        else:
+            tokens = []
+            last = 0
+            for m in self.regex.finditer(inp):
+                if m.start() > tail and \
+                    any(inp[p:] in self.prefixes for p in self.tokenStarts(inp, max(last, tail), m.start())):
+                    break
+                tokens.append(m.group())
+                last = m.end()
+        return tokens
+
+    def parse(self, inp):
+        logging.debug("inp: \"%s\"" % inp)
+        self.list = list(map(self.elementParser, self.tokens(inp)))
+        if isinstance(self.elementParser, Categorical):
+            self.list = self.elementParser.packed(self.list)
+        if self.frozen:
+            self.list = tuple(self.list)
+
+        if self.callback is not None:
+            return self.callback(self.list)
+        return self.list
+
 class SetBlock(ListBlock):
+    # Built straight into a frozenset rather than through a tuple
+    frozenType = frozenset
+
     def __init__(self, elementParser, delimiter, callback=None):
         super().__init__(elementParser, delimiter, callback)
 
     def parse(self, inp):
         tlist = super().parse(inp)
+        if self.frozen:
+            return tlist
         return set(tlist)
 
+class RangeBlock(SingleBlock):
+    '''
+    Parses an inclusive range 'lo-hi' (or a lone value) into range(lo, hi + 1),
+    which has a constant size and constant time membership whatever its length
+    '''
+    def __init__(self, elementParser, delimiter='-', callback=None):
+        self.elementParser = elementParser
+        self.delimiter = delimiter
+        self.callback = callback
+
+        if not callable(elementParser):
+            raise TypeError("Range elementParser must be callable")
+
+        if not isinstance(delimiter, str) or delimiter == "":
+            raise TypeError("Range delimiter must be a non empty str")
+
+        if callback is not None and not callable(callback):
+            raise TypeError("Callback must be callable")
+
+    def parseRange(self, inp):
+        # Searched from the second character, so the low end may be negative
+        i = inp.find(self.delimiter, 1)
+        if i < 0:
+            lo = hi = self.elementParser(inp)
+        else:
+            lo = self.elementParser(inp[:i])
+            hi = self.elementParser(inp[i + len(self.delimiter):])
+        if hi < lo:
+            raise ValueError("Range \"%s\" ends before it starts" % inp)
+        return range(lo, hi + 1)
+
+    def parse(self, inp):
+        logging.debug("inp: \"%s\"" % inp)
+        self.value = self.parseRange(inp)
+
+        if self.callback is not None:
+            return self.callback(self.value)
+        return self.value
+
+class IntervalSet:
+    '''
+    Set of ints held as sorted, disjoint half open ranges in two packed arrays,
+    overlapping and adjacent ranges are merged as it is built. Membership is a
+    binary search over the starts.
+    '''
+    def __init__(self, ranges=()):
+        spans = []
+        for r in ranges:
+            if r.step != 1:
+                raise ValueError("IntervalSet ranges must have a step of 1")
+            if len(r) > 0:
+                spans.append((r.start, r.stop))
+        spans.sort()
+
+        self.starts = array.array('q')
+        self.stops = array.array('q')
+        for (start, stop) in spans:
+            if len(self.stops) > 0 and start <= self.stops[-1]:
+                if stop > self.stops[-1]:
+                    self.stops[-1] = stop
+            else:
+                self.starts.append(start)
+                self.stops.append(stop)
+
+    @classmethod
+    def union(cls, *sets):
+        return cls(r for s in sets for r in s.ranges())
+
+    def __or__(self, other):
+        return IntervalSet.union(self, other)
+
+    def __contains__(self, value):
+        i = bisect.bisect_right(self.starts, value) - 1
+        return i >= 0 and value < self.stops[i]
+
+    def __len__(self):
+        # The number of ints in the set
+        return sum(self.stops) - sum(self.starts)
+
+    def ranges(self):
+        return [range(a, b) for (a, b) in zip(self.starts, self.stops)]
+
+    def __eq__(self, other):
+        return isinstance(other, IntervalSet) and self.starts == other.starts and \
+            self.stops == other.stops
+
+    def __hash__(self):
+        return hash((tuple(self.starts), tuple(self.stops)))
+
+    def __repr__(self):
+        return "IntervalSet(%s)" % self.ranges()
+
+class IntervalBlock(RangeBlock):
+    '''
+    Parses ranges split by seperator, e.g. '6-11 or 33-44', into one IntervalSet
+    '''
+    def __init__(self, elementParser, delimiter, seperator, callback=None):
+        super().__init__(elementParser, delimiter, callback)
+        self.seperator = seperator
+
+        if not isinstance(seperator, str) or seperator == "":
+            raise TypeError("Interval seperator must be a non empty str")
+
+    def parse(self, inp):
+        logging.debug("inp: \"%s\"" % inp)
+        self.value = IntervalSet([self.parseRange(r) for r in inp.split(self.seperator)])
+
+        if self.callback is not None:
+            return self.callback(self.value)
+        return self.value
+
+# Blocks parsing a whole field by splitting it themselves, compiled lines
+# capture their field and hand it to them
+FIELDBLOCKS = (ListBlock, ListElementMunch, VocabularyMunch, RangeBlock)
+
+class KeyCodes:
+    '''
+    Table giving each distinct key a small int code, in order of first appearance.
+    Passed as the intern option of the hash blocks so their output is keyed by the
+    codes, names[code] gives the key back. One table can be shared between blocks.
+    '''
+    def __init__(self):
+        self.codes = {}
+        self.names = []
+
+    def __deepcopy__(self, memo):
+        # Copies of a definition keep coding into the same table
+        return self
+
+    def code(self, key):
+        c = self.codes.get(key)
+        if c is None:
+            c = len(self.names)
+            self.codes[key] = c
+            self.names.append(key)
+        return c
+
+    def typecode(self):
+        # The smallest array type holding every code so far
+        n = len(self.names)
+        if n <= 1 << 8:
+            return 'B'
+        if n <= 1 << 16:
+            return 'H'
+        return 'L' if n <= 1 << 32 else 'Q'
+
+class Categorical:
+    '''
+    Wraps a parser function to give each distinct output a small int code from a
+    KeyCodes vocabulary, which can be shared. Lists and munches of categorical
+    elements are built as arrays of the codes, vocabulary.names gives the values.
+    '''
+    def __init__(self, func, vocabulary=None):
+        self.func = func
+        if vocabulary is None:
+            vocabulary = KeyCodes()
+        self.vocabulary = vocabulary
+
+        if not callable(func):
+            raise TypeError("Categorical needs a callable")
+
+        if not isinstance(vocabulary, KeyCodes):
+            raise TypeError("Categorical vocabulary must be KeyCodes")
+
+    def __deepcopy__(self, memo):
+        # Copies of a definition keep coding into the same vocabulary
+        return self
+
+    def __call__(self, value):
+        return self.vocabulary.code(self.func(value))
+
+    def packed(self, codes):
+        return array.array(self.vocabulary.typecode(), codes)
 
 class HashPairBlock(SingleBlock):
-    def __init__(self, keyblock, valueblock, seperator, distribute=False, reverse=False, callback=None):
+    def __init__(self, keyblock, valueblock, seperator, distribute=False, reverse=False, callback=None, intern=False):
         self.keyblock = keyblock
         self.valueblock = valueblock
         self.seperator = seperator
         self.distribute = distribute
         self.reverse = reverse
         self.callback = callback
+        self.setIntern(intern)
 
         if callback is not None and not callable(callback):
             raise TypeError("Callback must be callable")
 
         if not callable(self.keyblock) and \
-            not isinstance(self.valueblock, SingleBlock):
+            not isinstance(self.keyblock, SingleBlock):
             raise TypeError("Keyblock must be callable or SinglBlock")
 
         if not callable(self.valueblock) and \
             not isinstance(self.valueblock, SingleBlock):
             raise TypeError("Valueblock must be callable or SinglBlock")
 
-    def parse(self, inp):
-        logging.debug("inp: \"%s\"" % inp)
+    def setIntern(self, intern):
+        # intern is False, True to share one str object per distinct key,
+        # or a KeyCodes table to key the output by small int codes
+        if intern is not False and intern is not True and \
+            not isinstance(intern, KeyCodes):
+            raise TypeError("intern must be a bool or KeyCodes")
+        self.intern = intern
+
+    def internKey(self, key):
+        if self.intern is True:
+            if type(key) is str:
+                return sys.intern(key)
+            return key
+        return self.intern.code(key)
+
+    def split(self, inp):
+        # Only split once, the value (or key when reversed) may contain the seperator
         if not self.reverse:
-            key, value = inp.split(self.seperator)
+            key, value = inp.split(self.seperator, 1)
         else:
-            value, key = inp.split(self.seperator)
+            value, key = inp.rsplit(self.seperator, 1)
+        return key, value
 
+    def parsePair(self, key, value):
+        # The outputs of the key and value blocks for the split text
         if isinstance(self.keyblock, SingleBlock):
             self.key = self.keyblock.parse(key)
         else:
@@ -256,21 +988,42 @@ class HashPairBlock(SingleBlock):
             self.value = self.valueblock.parse(value)
         else:
             self.value = self.valueblock(value)
+        return self.key, self.value
 
+    def parse(self, inp):
+        logging.debug("inp: \"%s\"" % inp)
+        key, value = self.split(inp)
+        self.parsePair(key, value)
+        return self.pairHash(key)
+
+    def pairHash(self, key):
+        # The dict of the pair from the key text and the parsed self.key, self.value
         self.hash = {}
         if self.distribute:
-            for k in self.key:
-                self.hash[k] = self.value
+            if self.intern:
+                for k in self.key:
+                    self.hash[self.internKey(k)] = self.value
+            else:
+                for k in self.key:
+                    self.hash[k] = self.value
         else:
+            # The key is the raw text, so it is decoded in bytes mode
+            if self.encoding is not None:
+                key = key.decode(self.encoding)
+            if self.intern:
+                key = self.internKey(key)
             self.hash[key] = self.value
 
+        if self.frozen:
+            self.hash = FrozenDict(self.hash)
+
         if self.callback is not None:
             return self.callback(self.hash)
 
         return self.hash
 
 class HashLineBlock(SingleBlock):
-    def __init__(self, hashparser, delimiter, callback=None):
+    def __init__(self, hashparser, delimiter, callback=None, intern=False):
         self.hashparser = hashparser
         self.delimiter = delimiter
         self.callback = callback
@@ -281,6 +1034,12 @@ class HashLineBlock(SingleBlock):
         if not isinstance(self.hashparser, HashPairBlock):
             raise TypeError("HashLineBuilder needs HashPairBlock")
 
+        if intern is not False:
+            self.setIntern(intern)
+
+    def setIntern(self, intern):
+        self.hashparser.setIntern(intern)
+
     def parse(self, inp):
         logging.debug("inp: \"%s\"" % inp)
         self.hash = {}
@@ -294,18 +1053,52 @@ class HashLineBlock(SingleBlock):
             if lh is not None:
                 self.hash.update(lh)
 
+        if self.frozen:
+            self.hash = FrozenDict(self.hash)
+
         if self.callback is not None:
             return self.callback(self.hash)
 
         return self.hash
 
 class MuiltiLineBlock:
+    encoding = None
+    frozen = False
+    # Builders taking records stop after limit records or the first one stop_when
+    # is true for, without reading further (see setLimit)
+    limit = None
+    stop_when = None
+    # A builder with a sink passes each record to it rather than keeping it, and
+    # returns None
+    sink = None
+
     def __init__(self):
         return
 
+    def setSink(self, sink):
+        if sink is not None and not callable(sink):
+            raise TypeError("Sink must be callable")
+
+        self.sink = sink
+
+    def setLimit(self, limit=None, stop_when=None):
+        if limit is not None:
+            if not isinstance(limit, int):
+                raise TypeError("Limit must be an int")
+            if limit < 1:
+                raise ValueError("Limit must be at least 1")
+        if stop_when is not None and not callable(stop_when):
+            raise TypeError("stop_when must be callable")
+
+        self.limit = limit
+        self.stop_when = stop_when
+
     def parse(self, inp):
         return inp
 
+    def __deepcopy__(self, memo):
+        return blockDeepcopy(self, memo)
+
 class MultiLineSpanBuilder(MuiltiLineBlock):
     def __init__(self, lineblock, seperator, endvalue, callback=None):
         self.lineblock = lineblock
@@ -319,8 +1112,10 @@ class MultiLineSpanBuilder(MuiltiLineBlock):
         if not issubclass(type(self.lineblock), SingleBlock):
             raise TypeError("SingleLineBuilder needs SingleBlock to build")
 
-    def parse(self, infile, incLine=""):
+    def parse(self, infile, incLine=None):
         logging.debug("inp: \"%s\"" % incLine)
+        if incLine is None:
+            incLine = self.seperator[:0]
         compositeline = incLine
 
         line = infile.readline().rstrip()
@@ -374,15 +1169,18 @@ class SingleLineBuilderThrowToEnd(SingleLineBuilder):
         logging.debug("inp: \"%s\"" % line)
 
         l = super().parse(infile)
-        while infile.readline().rstrip() != self.endvalue:
-            continue
+        if not skipPast(infile, self.endvalue):
+            while infile.readline().rstrip() != self.endvalue:
+                continue
         return l
 
 class MultiBuilderBuilder(MuiltiLineBlock):
-    def __init__(self, blocks, endvalue, callback=None):
+    def __init__(self, blocks, endvalue, callback=None, limit=None, stop_when=None, sink=None):
         self.blocks = blocks
         self.endvalue = endvalue
         self.callback = callback
+        self.setLimit(limit, stop_when)
+        self.setSink(sink)
 
         if callback is not None and not callable(callback):
             raise TypeError("Callback must be callable")
@@ -393,41 +1191,198 @@ class MultiBuilderBuilder(MuiltiLineBlock):
                 raise TypeError("MultiBuilderBuilder combines several multiline blocks")
 
     def parse(self, infile, intLine=None):
+        return self.parseUntil(infile, intLine, self.limit, self.stop_when)
+
+    def parseUntil(self, infile, intLine, limit, stop_when):
         if intLine == None:
             line = infile.readline().rstrip()
         else:
             line = intLine
         logging.debug("inp: \"%s\"" % line)
         self.list = []
-        while line != self.endvalue:
-            blockOut = []
-            for b in self.blocks:
-                if isinstance(b, MultiLineSpanBuilder):
-                    l = b.parse(infile, line)
-                elif isinstance(b, MuiltiLineBlock):
-                    l = b.parse(infile, line)
-                else:
-                    raise Exception("oops")
-
+        self.stopped = False
+        add = self.list.append if self.sink is None else self.sink
+        bounded = limit is not None or stop_when is not None
+        count = 0
+        while line != self.endvalue and not self.stopped:
+            for i in range(len(self.blocks)):
+                l = self.parseRecord(infile, line, i)
                 if l is not None:
-                    blockOut.append(l)
+                    add(l)
+                    count += 1
+                    if bounded and recordStops(count, l, limit, stop_when):
+                        self.stopped = True
+                        break
 
                 line = infile.readline().rstrip()
                 logging.debug("inp: \"%s\"" % line)
-            self.list += blockOut
 
-        if len(self.list) == 1:
-            self.list = self.list[0]
+        self.count = count
+        out = self.complete(self.list)
+        if self.frozen:
+            # The records are kept in the tuple alone
+            self.list = []
+        return out
+
+    def parseRecord(self, infile, line, index):
+        # The output of blocks[index], starting from the line already read
+        b = self.blocks[index]
+        if isinstance(b, MultiLineSpanBuilder):
+            return b.parse(infile, line)
+        elif isinstance(b, MuiltiLineBlock):
+            return b.parse(infile, line)
+        else:
+            raise Exception("oops")
+
+    def complete(self, records):
+        if self.sink is not None:
+            return None
+
+        if len(records) == 1:
+            records = records[0]
+        elif self.frozen:
+            records = tuple(records)
 
         if self.callback is not None:
-            return self.callback(self.list)
-        return self.list
+            return self.callback(records)
+        return records
+
+# Sections of fewer lines are parsed line by line, as numpy's overhead is not
+# worth it for them
+NUMPYMIN = 64
+NUMPY = None
+# 10 ** n for the place of each digit, ints of more digits are left to int()
+POWERS = 18
+
+def numpyModule():
+    # numpy is optional, None when it is not installed
+    global NUMPY
+    if NUMPY is None:
+        try:
+            import numpy
+            NUMPY = numpy
+        except ImportError:
+            NUMPY = False
+    return NUMPY or None
+
+def numericPlan(builder):
+    '''
+    How numericLoad reads the records of a list builder: 'scalar' for lines of one
+    int (#int#), 'row' for ints split on a one character delimiter ([int ' ']),
+    'chars' for digit grids ([int None]). None when the builder is anything else,
+    or numpy is not installed.
+    '''
+    if builder.endvalue not in (EMPTYLINE, b"") or builder.sink is not None:
+        return None
+    line = builder.lineblock
+    if type(line) is not SingleLineBuilder or line.callback is not None:
+        return None
+    block = line.lineblock
+    # An instrumented block is timed per call (see BlockInstrument)
+    if 'parse' in vars(line) or 'parse' in vars(block):
+        return None
+    if type(block) is LiteralBlock:
+        if block.parser is not int or block.callback is not None:
+            return None
+        plan = 'scalar'
+    elif type(block) is ListBlock:
+        if block.elementParser is not int or block.callback is not None:
+            return None
+        if block.delimiter is None:
+            plan = 'chars'
+        elif len(block.delimiter) == 1 and block.delimiter not in ("\n", b"\n", "+", b"+", "-", b"-") and \
+            not block.delimiter.isdigit():
+            plan = 'row'
+        else:
+            return None
+    else:
+        return None
+    return plan if numpyModule() is not None else None
+
+def numericLoad(text, plan, delimiter, check=False):
+    '''
+    The records of a section, each line ending in a newline, or None when it is
+    not plain ascii ints (optionally signed, at most POWERS digits) split as the
+    plan says, so int() is left to parse (or reject) it line by line. With check
+    the records aren't built, True is returned instead.
+    '''
+    np = numpyModule()
+    if isinstance(text, str):
+        if not text.isascii():
+            return None
+        text = text.encode('ascii')
+    data = np.frombuffer(text, np.uint8)
+    digits = data - 48
+    isDigit = digits < 10
+    newline = data == 10
+
+    if plan == 'chars':
+        if not np.all(isDigit | newline):
+            return None
+        if check:
+            return True
+        ends = np.flatnonzero(newline)
+        widths = np.diff(ends, prepend=-1) - 1
+        return splitRows(digits[~newline], widths)
+
+    if plan == 'row':
+        delimiter = delimiter.encode('ascii') if isinstance(delimiter, str) else delimiter
+        separator = newline | (data == delimiter[0])
+    else:
+        separator = newline
+    ends = np.flatnonzero(separator)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    lengths = ends - starts
+    if lengths.min() < 1:
+        return None
+
+    # A sign may only start its token, and be followed by at least one digit
+    first = np.zeros(len(data), bool)
+    first[starts] = True
+    sign = (data == 43) | (data == 45)
+    if np.any(~separator & ~isDigit & ~(sign & first)):
+        return None
+    signed = sign[starts]
+    places = lengths - signed
+    if places.min() < 1 or places.max() > POWERS:
+        return None
+    if check:
+        return True
+
+    # Each digit times 10 to the number of digits after it in its token
+    place = np.repeat(ends, lengths + 1) - np.arange(len(data)) - 1
+    powers = 10 ** np.arange(POWERS, dtype=np.int64)
+    terms = np.where(isDigit, digits, 0).astype(np.int64) * powers[np.clip(place, 0, POWERS - 1)]
+    values = np.add.reduceat(terms, starts)
+    values[data[starts] == 45] *= -1
+
+    if plan == 'scalar':
+        return values.tolist()
+    rowEnds = np.flatnonzero(newline[ends])
+    widths = np.diff(rowEnds, prepend=-1)
+    return splitRows(values, widths)
+
+def splitRows(values, widths):
+    # A numpy array of values cut into lists of the given widths
+    if len(widths) > 0 and widths.min() == widths.max():
+        return values.reshape(len(widths), widths[0]).tolist()
+    values = values.tolist()
+    rows = []
+    start = 0
+    for w in widths.tolist():
+        rows.append(values[start:start + w])
+        start += w
+    return rows
 
 class ListBuilder(MuiltiLineBlock):
-    def __init__(self, lineblock, endvalue, callback=None):
+    def __init__(self, lineblock, endvalue, callback=None, limit=None, stop_when=None, sink=None):
         self.lineblock = lineblock
         self.endvalue = endvalue
         self.callback = callback
+        self.setLimit(limit, stop_when)
+        self.setSink(sink)
 
         if callback is not None and not callable(callback):
             raise TypeError("Callback must be callable")
@@ -438,40 +1393,105 @@ class ListBuilder(MuiltiLineBlock):
             raise TypeError("Listbuilder needs SingleBlock or MultiLineSpanBuilder got \"%s\"" % type(self.lineblock))
 
     def parse(self, infile, intLine=None):
+        return self.parseUntil(infile, intLine, self.limit, self.stop_when)
+
+    def parseUntil(self, infile, intLine, limit, stop_when):
+        if limit is None and stop_when is None:
+            plan = numericPlan(self)
+            if plan is not None:
+                return self.parseNumeric(infile, intLine, plan)
+
         if intLine == None:
             line = infile.readline().rstrip()
         else:
             line = intLine
         logging.debug("inp: \"%s\"" % line)
         self.list = []
+        self.stopped = False
+        add = self.list.append if self.sink is None else self.sink
+        bounded = limit is not None or stop_when is not None
+        count = 0
         while line != self.endvalue:
-            if isinstance(self.lineblock, SingleBlock):
-                l = self.lineblock.parse(line)
-            elif isinstance(self.lineblock, MultiLineSpanBuilder):
-                l = self.lineblock.parse(infile, line)
-            elif isinstance(self.lineblock, MuiltiLineBlock):
-                l = self.lineblock.parse(infile, line)
-            else:
-                raise Exception("oops")
-
+            l = self.parseRecord(infile, line)
             if l is not None:
-                self.list.append(l)
+                add(l)
+                count += 1
+                if bounded and recordStops(count, l, limit, stop_when):
+                    self.stopped = True
+                    break
 
             line = infile.readline().rstrip()
             logging.debug("inp: \"%s\"" % line)
 
-        if len(self.list) == 1:
-            self.list = self.list[0]
+        self.count = count
+        out = self.complete(self.list)
+        if self.frozen:
+            # The records are kept in the tuple alone
+            self.list = []
+        return out
+
+    def parseNumeric(self, infile, intLine, plan):
+        # The section is read whole and loaded at once by numpy (see numericLoad),
+        # or parsed line by line when it is short or not plain ints after all
+        newline = NEWLINE if isinstance(self.endvalue, str) else NEWLINE.encode()
+        lines = []
+        if intLine is None or intLine != self.endvalue:
+            if intLine is not None:
+                lines.append(intLine + newline)
+            # Lines up to the first blank one, which is read, or the end of input
+            lines.extend(itertools.takewhile(type(self.endvalue).strip, iter(infile.readline, self.endvalue)))
+
+        records = None
+        if len(lines) >= NUMPYMIN:
+            text = self.endvalue.join(lines)
+            if not text.endswith(newline):
+                text += newline
+            block = self.lineblock.lineblock
+            records = numericLoad(text, plan, getattr(block, 'delimiter', None))
+            if records is not None and plan != 'scalar' and block.frozen:
+                records = [tuple(r) for r in records]
+        if records is None:
+            records = [self.parseRecord(infile, l.rstrip()) for l in lines]
+
+        self.list = records
+        self.stopped = False
+        self.count = len(records)
+        out = self.complete(records)
+        if self.frozen:
+            self.list = []
+        return out
+
+    def parseRecord(self, infile, line):
+        # One list item, starting from the line already read
+        if isinstance(self.lineblock, SingleBlock):
+            return self.lineblock.parse(line)
+        elif isinstance(self.lineblock, MultiLineSpanBuilder):
+            return self.lineblock.parse(infile, line)
+        elif isinstance(self.lineblock, MuiltiLineBlock):
+            return self.lineblock.parse(infile, line)
+        else:
+            raise Exception("oops")
+
+    def complete(self, records):
+        if self.sink is not None:
+            return None
+
+        if len(records) == 1:
+            records = records[0]
+        elif self.frozen:
+            records = tuple(records)
 
         if self.callback is not None:
-            return self.callback(self.list)
-        return self.list
+            return self.callback(records)
+        return records
 
 class HashBuilder(MuiltiLineBlock):
-    def __init__(self, hashblock, endvalue, callback=None):
+    def __init__(self, hashblock, endvalue, callback=None, intern=False, limit=None, stop_when=None, sink=None):
         self.hashblock = hashblock
         self.endvalue = endvalue
         self.callback = callback
+        self.setLimit(limit, stop_when)
+        self.setSink(sink)
 
         if callback is not None and not callable(callback):
             raise TypeError("Callback must be callable")
@@ -480,7 +1500,15 @@ class HashBuilder(MuiltiLineBlock):
             not isinstance(self.hashblock, HashLineBlock):
             raise TypeError("Hashbuilder needs HashPairBlock to build")
 
+        # The merged dict keeps the key objects of the line dicts, so interning
+        # is done by the hash block underneath
+        if intern is not False:
+            self.hashblock.setIntern(intern)
+
     def parse(self, infile, intLine=None):
+        return self.parseUntil(infile, intLine, self.limit, self.stop_when)
+
+    def parseUntil(self, infile, intLine, limit, stop_when):
         if intLine == None:
             line = infile.readline().rstrip()
         else:
@@ -489,23 +1517,337 @@ class HashBuilder(MuiltiLineBlock):
         logging.debug("inp: \"%s\"" % line)
 
         self.hash = {}
+        self.stopped = False
+        add = self.hash.update if self.sink is None else self.sink
+        count = 0
+        bounded = limit is not None or stop_when is not None
         while line != self.endvalue:
-            lineH = self.hashblock.parse(line)
+            lineH = self.parseRecord(infile, line)
 
-            self.hash.update(lineH)
+            add(lineH)
+            # Each line is a record
+            count += 1
+            if bounded and recordStops(count, lineH, limit, stop_when):
+                self.stopped = True
+                break
 
             line = infile.readline().rstrip()
 
+        self.count = count
+        if self.sink is not None:
+            return None
+        if self.frozen:
+            self.hash = FrozenDict(self.hash)
         if self.callback is not None:
             return self.callback(self.hash)
         return self.hash
 
+    def parseRecord(self, infile, line):
+        # The dict of one line
+        return self.hashblock.parse(line)
+
+    def complete(self, records):
+        # Merges the line dicts, later lines overriding earlier ones as in parse
+        if self.sink is not None:
+            return None
+        self.hash = {}
+        for r in records:
+            self.hash.update(r)
+        if self.frozen:
+            self.hash = FrozenDict(self.hash)
+
+        if self.callback is not None:
+            return self.callback(self.hash)
+        return self.hash
+
+def graphEdges(value):
+    # The targets and weights of a node's parsed value: a dict of target to weight,
+    # a list of targets (weight 1), a list of lists of alternatives (weighted by
+    # the number of the alternative from 1) or a single target, None for no edges
+    if value is None:
+        return (), ()
+    if isinstance(value, dict):
+        return list(value.keys()), list(value.values())
+    if not isinstance(value, (list, tuple, set, frozenset)):
+        return (value,), (1,)
+
+    for v in value:
+        if isinstance(v, (list, tuple)):
+            break
+    else:
+        return value, [1] * len(value)
+    targets = []
+    weights = []
+    for (alt, group) in enumerate(value, 1):
+        if not isinstance(group, (list, tuple)):
+            group = (group,)
+        targets.extend(group)
+        weights.extend([alt] * len(group))
+    return targets, weights
+
+class Graph:
+    '''
+    Adjacency in compressed sparse row form: the edges of node i go to
+    targets[offsets[i]:offsets[i + 1]], with the same slice of weights. names[i]
+    is the name of node i and ids[name] its id.
+    '''
+    def __init__(self, names, offsets, targets, weights, ids=None):
+        self.names = names
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        if ids is None:
+            ids = {n: i for (i, n) in enumerate(names)}
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.names)
+
+    def __eq__(self, other):
+        return isinstance(other, Graph) and self.names == other.names and \
+            self.offsets == other.offsets and self.targets == other.targets and \
+            self.weights == other.weights
+
+    def __repr__(self):
+        return "Graph(%d nodes, %d edges)" % (len(self.names), len(self.targets))
+
+    def neighbours(self, node):
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def edges(self, node):
+        # (target, weight) pairs of node
+        a = self.offsets[node]
+        b = self.offsets[node + 1]
+        return zip(self.targets[a:b], self.weights[a:b])
+
+    def reverse(self):
+        # The graph with every edge turned around, node ids unchanged
+        counts = [0] * (len(self.names) + 1)
+        for t in self.targets:
+            counts[t + 1] += 1
+        for i in range(len(self.names)):
+            counts[i + 1] += counts[i]
+        offsets = array.array('Q', counts)
+        targets = array.array('Q', bytes(len(self.targets) * offsets.itemsize))
+        weights = array.array(self.weights.typecode, bytes(len(self.weights) * self.weights.itemsize))
+        pos = counts[:-1]
+        for source in range(len(self.names)):
+            for e in range(self.offsets[source], self.offsets[source + 1]):
+                t = self.targets[e]
+                targets[pos[t]] = source
+                weights[pos[t]] = self.weights[e]
+                pos[t] += 1
+        return Graph(self.names, offsets, targets, weights, self.ids)
+
+    def toDict(self):
+        # {name: {target name: weight}}, mostly for checking
+        return {n: {self.names[t]: w for (t, w) in self.edges(i)} for (i, n) in enumerate(self.names)}
+
+class GraphBuild:
+    # Nodes and edges as the records of a GraphBuilder arrive, edges in arrival
+    # order with each node's span of them
+    def __init__(self, distribute):
+        self.distribute = distribute
+        self.names = []
+        self.ids = {}
+        self.starts = []
+        self.ends = []
+        # Further spans of nodes with several lines
+        self.more = {}
+        self.targets = array.array('Q')
+        self.weights = array.array('q')
+
+    def node(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            i = len(self.names)
+            self.ids[name] = i
+            self.names.append(name)
+            self.starts.append(-1)
+            self.ends.append(-1)
+        return i
+
+    def add(self, record):
+        (key, value) = record
+        get = self.ids.get
+        if self.distribute:
+            keys = [self.node(k) for k in key]
+        else:
+            i = get(key, -1)
+            keys = (i if i >= 0 else self.node(key),)
+        (targets, weights) = graphEdges(value)
+        found = [get(t, -1) for t in targets]
+        if -1 in found:
+            found = [i if i >= 0 else self.node(t) for (i, t) in zip(found, targets)]
+
+        start = len(self.targets)
+        self.targets.extend(found)
+        try:
+            self.weights.extend(weights)
+        except TypeError:
+            # Weights are ints until one is not
+            del self.weights[start:]
+            self.weights = array.array('d', self.weights)
+            self.weights.extend(weights)
+        end = start + len(found)
+
+        starts = self.starts
+        for i in keys:
+            if starts[i] < 0:
+                starts[i] = start
+                self.ends[i] = end
+            elif self.ends[i] == start:
+                self.ends[i] = end
+            else:
+                self.more.setdefault(i, []).append((start, end))
+
+    def graph(self):
+        # Each node's spans are copied out in node order
+        offsets = array.array('Q', [0])
+        targets = array.array('Q')
+        weights = array.array(self.weights.typecode)
+        for i in range(len(self.names)):
+            a = self.starts[i]
+            if a >= 0:
+                targets.extend(self.targets[a:self.ends[i]])
+                weights.extend(self.weights[a:self.ends[i]])
+            if i in self.more:
+                for (a, b) in self.more[i]:
+                    targets.extend(self.targets[a:b])
+                    weights.extend(self.weights[a:b])
+            offsets.append(len(targets))
+        return Graph(self.names, offsets, targets, weights, self.ids)
+
+class GraphBuilder(HashBuilder):
+    '''
+    Builds a Graph from lines of key value pairs, the key naming a node and the
+    value its edges (see graphEdges). Nodes are numbered in order of first
+    appearance, as keys or targets, while the lines are parsed.
+    '''
+    def __init__(self, hashblock, endvalue, callback=None, limit=None, stop_when=None, sink=None):
+        super().__init__(hashblock, endvalue, callback, limit=limit, stop_when=stop_when, sink=sink)
+
+        if not isinstance(self.hashblock, HashPairBlock):
+            raise TypeError("GraphBuilder needs HashPairBlock to build")
+
+        if self.hashblock.callback is not None:
+            raise TypeError("GraphBuilder pairs can't have a callback")
+
+    def parseUntil(self, infile, intLine, limit, stop_when):
+        if intLine == None:
+            line = infile.readline().rstrip()
+        else:
+            line = intLine
+        logging.debug("inp: \"%s\"" % line)
+
+        build = GraphBuild(self.hashblock.distribute)
+        self.stopped = False
+        add = build.add if self.sink is None else self.sink
+        bounded = limit is not None or stop_when is not None
+        count = 0
+        while line != self.endvalue:
+            record = self.parseRecord(infile, line)
+            add(record)
+            count += 1
+            if bounded and recordStops(count, record, limit, stop_when):
+                self.stopped = True
+                break
+
+            line = infile.readline().rstrip()
+            logging.debug("inp: \"%s\"" % line)
+
+        self.count = count
+        return self.completeBuild(build)
+
+    def parseRecord(self, infile, line):
+        # The (key, value) of one line
+        return self.hashblock.parsePair(*self.hashblock.split(line))
+
+    def complete(self, records):
+        build = GraphBuild(self.hashblock.distribute)
+        for r in records:
+            build.add(r)
+        return self.completeBuild(build)
+
+    def completeBuild(self, build):
+        if self.sink is not None:
+            return None
+        if self.callback is not None:
+            return self.callback(build.graph())
+        return build.graph()
+
+# Attributes through which blocks and builders hold their nested blocks
+CHILDATTRS = ['parsers', 'blocks', 'block', 'lineblock', 'hashblock', 'hashparser', 'keyblock', 'valueblock']
+
+def blockChildren(block):
+    # Yields (attribute, index, child) for each block directly nested in block,
+    # index is None when the attribute holds the child itself rather than a list
+    for a in CHILDATTRS:
+        c = getattr(block, a, None)
+        if isinstance(c, list):
+            for (i, b) in enumerate(c):
+                if isinstance(b, (SingleBlock, MuiltiLineBlock)):
+                    yield a, i, b
+        elif isinstance(c, (SingleBlock, MuiltiLineBlock)):
+            yield a, None, c
+
+def blockReplaceChild(block, attribute, index, child):
+    if index is None:
+        setattr(block, attribute, child)
+    else:
+        getattr(block, attribute)[index] = child
+
+def blockWalk(block):
+    # Every block in the tree under (and including) block, parents first
+    todo = [block]
+    while todo:
+        b = todo.pop()
+        yield b
+        todo.extend(reversed([c for (a, i, c) in blockChildren(b)]))
+
+# Text attributes of blocks and builders, encoded for bytes mode
+TEXTATTRS = ['delimiter', 'seperator', 'endvalue', 'absolute']
+# Attributes holding parser functions (or blocks) which are given the raw text
+PARSERATTRS = ['parser', 'elementParser', 'elementEvaluator', 'keyblock', 'valueblock']
+
+def bytesFunction(func, encoding):
+    # Parser functions are written for str, so are handed decoded text
+    def decoded(value):
+        return func(value.decode(encoding))
+    return decoded
+
+def bytesTrimmer(func, encoding):
+    # A trimmer's output is parsed further, so goes back to bytes
+    def trimmed(value):
+        out = func(value.decode(encoding))
+        if isinstance(out, str):
+            return out.encode(encoding)
+        return out
+    return trimmed
+
+# How InputDefinition runs its builders (see setExecutor)
+EXECUTORS = ('recursive', 'stack')
+
+# Inputs per task of InputDefinition.parse_many, and tasks queued per worker
+MANYCHUNK = 256
+MANYAHEAD = 4
+
 class InputDefinition:
-    def __init__(self):
+    def __init__(self, frozen=False, executor='recursive'):
         self.builders = []
+        self.frozen = frozen
+        self.executor = executor
         self.functions = {
             'int' : int,
             'str' : str }
+        self.binaryFunctions = set()
+        self.binaryDefinitions = {}
+        self.program = None
+
+        if not isinstance(frozen, bool):
+            raise TypeError("frozen must be a bool")
+        if executor not in EXECUTORS:
+            raise ValueError("executor must be one of %s" % ", ".join(EXECUTORS))
 
     def buildersFromStr(self, stringDef):
         if stringDef is not None:
@@ -527,12 +1869,17 @@ class InputDefinition:
         # of a length greater than 1
         if isinstance(ast, tuple) and len(ast) > 1:
             return SingleLineBuilder(self.strParseBlock(ast))
+        elif self.strIsRegex(ast):
+            # A bare regex block is the one block that comes back as a plain str
+            return SingleLineBuilder(self.strParseBlock(ast))
         elif ast == '((':
             return self.strParseMultiBuilderBuilder()
         elif ast == '[[':
             return self.strParseListBuilder()
         elif ast == '{{':
             return self.strParseHashBuilder()
+        elif ast == '<<':
+            return self.strParseGraphBuilder()
         else:
             raise ValueError("Not a valid builder")
 
@@ -544,25 +1891,30 @@ class InputDefinition:
             return self.strParseBuilder_helper(ast)
 
     def strParseBuilder_closehelper(self, ast):
-        # There are 4 valid close forms for any builder:
-        #   ')',
-        #   (')', "delimiter")
-        #   (')', '/',          callback)
-        #   (')', "delimiter",  '/',        callback)
-        # The first is handled directly, the ast passed here is only after the initial
-        # close symbol, and assumes that is stripped
-
-        if len(ast) == 1:
-            # Can only have a delimiter:
-            return self.strParseUnQuote(ast[0]), None
-        elif len(ast) == 2:
-            # Can only be a callback
-            return None, self.functions[ast[1]]
-        elif len(ast) == 3:
-            # Both!
-            return self.strParseUnQuote(ast[0]), self.functions[ast[2]]
-        else:
-            raise ValueError("Malformed builder close: \"%s\"" % (ast))
+        # After the close symbol a builder takes, each optional but in this order:
+        #   "delimiter"
+        #   '/'     callback
+        #   '->'    sink
+        # The bare close is handled directly, the ast passed here is only after the
+        # initial close symbol, and assumes that is stripped
+        delimiter = EMPTYLINE
+        callback = None
+        sink = None
+
+        i = 0
+        if i < len(ast) and ast[i] not in ('/', '->'):
+            delimiter = self.strParseUnQuote(ast[i])
+            i += 1
+        if i + 1 < len(ast) and ast[i] == '/':
+            callback = self.functions[ast[i + 1]]
+            i += 2
+        if i + 1 < len(ast) and ast[i] == '->':
+            sink = self.functions[ast[i + 1]]
+            i += 2
+        if i != len(ast):
+            raise ValueError("Malformed builder close: \"%s\"" % (ast,))
+
+        return delimiter, callback, sink
 
     def strParseMultiBuilderBuilder(self):
         builders = []
@@ -575,8 +1927,8 @@ class InputDefinition:
                 #Close this Multibuilder
                 return MultiBuilderBuilder(builders, EMPTYLINE)
             elif isinstance(ast, tuple) and ast[0] == '))':
-                delimiter, callback = self.strParseBuilder_closehelper(ast[1:])
-                return MultiBuilderBuilder(builders, delimiter, callback)
+                delimiter, callback, sink = self.strParseBuilder_closehelper(ast[1:])
+                return MultiBuilderBuilder(builders, delimiter, callback, sink=sink)
             else:
                 builders.append(self.strParseBuilder_helper(ast))
 
@@ -590,8 +1942,8 @@ class InputDefinition:
             if isinstance(ast, str) and ast == ']]':
                 return ListBuilder(builder, EMPTYLINE)
             elif isinstance(ast, tuple) and ast[0] == ']]':
-                delimiter, callback = self.strParseBuilder_closehelper(ast[1:])
-                return ListBuilder(builder, delimiter, callback)
+                delimiter, callback, sink = self.strParseBuilder_closehelper(ast[1:])
+                return ListBuilder(builder, delimiter, callback, sink=sink)
             else:
                 if builder is not None:
                     raise ValueError("List Builder can only contain one element")
@@ -607,8 +1959,8 @@ class InputDefinition:
             if isinstance(ast, str) and ast == '}}':
                 return HashBuilder(builder, EMPTYLINE)
             elif isinstance(ast, tuple) and ast[0] == '}}':
-                delimiter, callback = self.strParseBuilder_closehelper(ast[1:])
-                return HashBuilder(builder, delimiter, callback)
+                delimiter, callback, sink = self.strParseBuilder_closehelper(ast[1:])
+                return HashBuilder(builder, delimiter, callback, sink=sink)
             else:
                 # Hash builders can only contain hash builder type elements
                 # This means that the blocks encountered must be either '{', '{*', or '{d'
@@ -621,6 +1973,27 @@ class InputDefinition:
                 else:
                     raise ValueError("Not a valid builder")
 
+    def strParseGraphBuilder(self):
+        builder = None
+        while self.stridx < len(self.stringDef):
+            ast = tatsu.parse(ChallengerGrammar.GRAMMAR, self.stringDef[self.stridx])
+            self.stridx += 1
+            logging.debug("ast: \"%s\"" % str(ast))
+            # Same close forms as above
+            if isinstance(ast, str) and ast == '>>':
+                return GraphBuilder(builder, EMPTYLINE)
+            elif isinstance(ast, tuple) and ast[0] == '>>':
+                delimiter, callback, sink = self.strParseBuilder_closehelper(ast[1:])
+                return GraphBuilder(builder, delimiter, callback, sink=sink)
+            else:
+                # Each line is one node, its key and its edges
+                if isinstance(ast, tuple) and len(ast) > 1 and ast[0] in ('{', '{<'):
+                    if builder is not None:
+                        raise ValueError("Graph Builder can only contain one element")
+                    builder = self.strParseBlock(ast)
+                else:
+                    raise ValueError("Not a valid builder")
+
     def strParseBlock(self, ast):
         logging.debug("ast: \"%s\"" % str(ast))
         if ast[0] == '#':
@@ -631,8 +2004,14 @@ class InputDefinition:
             return self.strParseListBlock(ast)
         elif ast[0] == '[*':
             return self.strParseListMunchBlock(ast)
+        elif ast[0] == '[*=':
+            return self.strParseVocabularyMunch(ast)
         elif ast[0] == '[<':
             return self.strParseSetBlock(ast)
+        elif ast[0] == '[-':
+            return self.strParseRangeBlock(ast)
+        elif ast[0] == '[-<':
+            return self.strParseIntervalBlock(ast)
         elif ast[0] == '{':
             return self.strParseHashPairBlock(ast)
         elif ast[0] == '{*':
@@ -643,9 +2022,38 @@ class InputDefinition:
             return self.strParseOrBlock(ast)
         elif ast[0] == '>':
             return self.strParseEncapBlock(ast)
+        elif self.strIsRegex(ast) or self.strIsRegex(ast[0]):
+            return self.strParseRegexBlock(ast)
         else:
             raise ValueError("Not a valid block")
 
+    def strIsRegex(self, ast):
+        return isinstance(ast, str) and len(ast) > 1 and ast[0] == '/' and ast[-1] == '/'
+
+    def strParseRegexBlock(self, ast):
+        logging.debug("ast: \"%s\"" % str(ast))
+        # Regex blocks have the forms:
+        #  "/pattern/"
+        #  ("/pattern/", '(', [parser|block ...], ')')
+        #  ("/pattern/", '(', [parser|block ...], '/', callback, ')')
+        # The bare form returns the groups as str
+
+        if isinstance(ast, str):
+            return RegexBlock(ast[1:-1])
+
+        parsers = []
+        for p in ast[2]:
+            if isinstance(p, tuple) or self.strIsRegex(p):
+                parsers.append(self.strParseBlock(p))
+            else:
+                parsers.append(self.functions[p])
+
+        callback = None
+        if len(ast) == 6:
+            callback = self.functions[ast[4]]
+
+        return RegexBlock(ast[0][1:-1], parsers, callback)
+
     def strParseLiteralBlock(self, ast):
         logging.debug("ast: \"%s\"" % str(ast))
         # Literals have 3 forms:
@@ -716,6 +2124,27 @@ class InputDefinition:
 
         return SetBlock(elP, delimiter, callback)
 
+    def strParseRangeBlock(self, ast):
+        logging.debug("ast: \"%s\"" % str(ast))
+        # ('[-', elementParser, "delimiter", ...
+
+        elP = self.functions[ast[1]]
+
+        delimiter, callback = self.strParseTrailingArgs_helper(ast[2:])
+
+        return RangeBlock(elP, delimiter, callback)
+
+    def strParseIntervalBlock(self, ast):
+        logging.debug("ast: \"%s\"" % str(ast))
+        # ('[-<', elementParser, "delimiter", "seperator", ...
+
+        elP = self.functions[ast[1]]
+        delimiter = self.strParseUnQuote(ast[2])
+
+        seperator, callback = self.strParseTrailingArgs_helper(ast[3:])
+
+        return IntervalBlock(elP, delimiter, seperator, callback)
+
     def strParseListMunchBlock(self, ast):
         logging.debug("ast: \"%s\"" % str(ast))
 
@@ -730,53 +2159,71 @@ class InputDefinition:
         return ListElementMunch(elEval, elP, delimiter, callback)
 
 
+    def strParseVocabularyMunch(self, ast):
+        logging.debug("ast: \"%s\"" % str(ast))
+
+        # [*= elementParser ("token" ...) "delimiter"...
+
+        elP = self.functions[ast[1]]
+        vocabulary = [self.strParseUnQuote(t) for t in ast[3]]
+
+        delimiter, callback = self.strParseTrailingArgs_helper(ast[5:])
+
+        return VocabularyMunch(vocabulary, elP, delimiter, callback)
+
     def strParseHashTypeKV_helper(self, ast):
         # Hash types allow the key and value to also be blocks
         # So we pull those out of the ast and recursively parse them
         logging.debug("ast: \"%s\"" % str(ast))
 
         # Hash pair blocks take the form:
-        #  ('{', [rev], keyparser|block, valueparser|block, "seperator", '}')
-        #  ('{', [rev], keyparser|block, valueparser|block, "seperator", '\', callback, '}')
+        #  ('{', [rev], [intern], keyparser|block, valueparser|block, "seperator", '}')
+        #  ('{', [rev], [intern], keyparser|block, valueparser|block, "seperator", '\', callback, '}')
         # If key or value are blocks, then they will be nested tuples
 
         # Support the reversed type by detecting revesed, caller will pass enough
         # AST to not have to worry, this function slices the AST to after the KV objects
 
+        reverse = False
+        intern = False
         if type(ast[0]) == str and ast[0] == "rev":
-            astKey = ast[2]
-            astValue = ast[1]
-            astRemaining = ast[3:]
             reverse = True
+            ast = ast[1:]
+        if type(ast[0]) == str and ast[0] == "intern":
+            intern = True
+            ast = ast[1:]
+
+        if reverse:
+            astKey = ast[1]
+            astValue = ast[0]
         else:
             astKey = ast[0]
             astValue = ast[1]
-            astRemaining = ast[2:]
-            reverse = False
+        astRemaining = ast[2:]
 
         if type(astKey) == tuple:
             key = self.strParseBlock(astKey)
         else:
             key = self.functions[astKey]
 
-        if type(astValue) == tuple:
+        if type(astValue) == tuple or self.strIsRegex(astValue):
             value = self.strParseBlock(astValue)
         else:
             value = self.functions[astValue]
 
-        return key, value, reverse, astRemaining
+        return key, value, reverse, intern, astRemaining
 
     def strParseHashPairBlock(self, ast, distribute=False):
         logging.debug("ast: \"%s\"" % str(ast))
 
-        key, value, reverse, ast = self.strParseHashTypeKV_helper(ast[1:])
+        key, value, reverse, intern, ast = self.strParseHashTypeKV_helper(ast[1:])
         # ast is replaces and is now align to after the kv pair
 
         # Incidentally the seperator and optional callback take the same form here
         # As in listblocks, so reuse to make life easier
         seperator, callback = self.strParseTrailingArgs_helper(ast)
 
-        return HashPairBlock(key, value, seperator, distribute, reverse, callback)
+        return HashPairBlock(key, value, seperator, distribute, reverse, callback, intern)
 
     def strParseHashLineBlock(self, ast):
         logging.debug("ast: \"%s\"" % str(ast))
@@ -785,14 +2232,14 @@ class InputDefinition:
         # Seperator is added. The first is always the key/value seperator and the second
         # is always the item seperator. We reuse the trailing arg function as it will work
 
-        key, value, reverse, ast = self.strParseHashTypeKV_helper(ast[1:])
+        key, value, reverse, intern, ast = self.strParseHashTypeKV_helper(ast[1:])
         # ast is replaces and is now align to after the kv pair
 
         seperator = self.strParseUnQuote(ast[0])
 
         itemSeperator, callback = self.strParseTrailingArgs_helper(ast[1:])
 
-        return HashLineBlock(HashPairBlock(key, value, seperator, reverse=reverse), itemSeperator, callback)
+        return HashLineBlock(HashPairBlock(key, value, seperator, reverse=reverse, intern=intern), itemSeperator, callback)
 
 
     def strParseOrBlock(self, ast):
@@ -817,36 +2264,2456 @@ class InputDefinition:
 
         return EncapsulatedLine(self.functions[ast[2]], self.strParseBlock(ast[1]))
 
+    def compile(self):
+        '''
+        Replace every MultiBlockLine subtree built only from fixed delimiters and
+        literals with a single precompiled regular expression (see regexCompile)
+        '''
+        for b in self.builders:
+            self.compile_helper(b)
+        self.binaryDefinitions = {}
+        self.program = None
+
+    def compile_helper(self, builder):
+        todo = [builder]
+        while todo:
+            block = todo.pop()
+            for (a, i, b) in list(blockChildren(block)):
+                compiled = regexCompile(b)
+                if compiled is not None:
+                    blockReplaceChild(block, a, i, compiled)
+                else:
+                    todo.append(b)
+
     def addBuilder(self, builder):
         if not issubclass(type(builder), MuiltiLineBlock):
             raise TypeError("Builders must be MuiltiLineBlocks, use SingleLineBuilder for 1 line")
         self.builders.append(builder)
-
-    def addFunction(self, name, func):
+        if self.frozen:
+            self.setFrozen_helper(builder, True)
+        self.binaryDefinitions = {}
+        self.program = None
+
+    def setFrozen(self, frozen=True):
+        '''
+        Make every block build tuples, frozensets and FrozenDicts (frozen) or
+        lists, sets and dicts, including builders added later
+        '''
+        if not isinstance(frozen, bool):
+            raise TypeError("frozen must be a bool")
+        self.frozen = frozen
+        for b in self.builders:
+            self.setFrozen_helper(b, frozen)
+        self.binaryDefinitions = {}
+        self.program = None
+
+    def setExecutor(self, executor='stack'):
+        '''
+        Run the builders by blocks calling each other ('recursive'), or as one
+        flattened program on explicit stacks ('stack', see StackProgram) for
+        definitions nesting deeper than the recursion limit allows
+        '''
+        if executor not in EXECUTORS:
+            raise ValueError("executor must be one of %s" % ", ".join(EXECUTORS))
+        self.executor = executor
+        self.binaryDefinitions = {}
+
+    def flatten(self):
+        # The StackProgram of the builders, built on first use
+        if self.program is None:
+            self.program = StackProgram(self)
+        return self.program
+
+    def setFrozen_helper(self, builder, frozen):
+        for b in blockWalk(builder):
+            b.frozen = frozen
+            if isinstance(b, CompiledLineBlock):
+                self.setFrozen_helper(b.source, frozen)
+        for b in blockWalk(builder):
+            # Pairs only merged into their line's dict are not worth freezing
+            if isinstance(b, HashLineBlock) and b.hashparser.callback is None:
+                b.hashparser.frozen = False
+
+    def incremental(self, callback=None, binary=False, encoding='utf-8'):
+        '''
+        A parser which is fed the input in chunks as it arrives: feed(data) takes
+        str (bytes if binary), each record is passed to the callback as soon as it
+        is complete and close() returns the output Input.parse would give
+        '''
+        if binary:
+            return IncrementalParser(self.binary(encoding), b"", callback)
+        return IncrementalParser(self, EMPTYLINE, callback)
+
+    def parse_many(self, items, workers=None, executor='thread', ordered=True, binary=False,
+        encoding='utf-8', chunksize=MANYCHUNK, transport='pickle'):
+        '''
+        Parse many inputs with this definition: str items are the text of an input,
+        bytes are parsed in bytes mode and os.PathLike items are files opened by
+        Input.from_path (as bytes if binary). Gives the outputs in the order of the
+        items, or with ordered=False (index, output) pairs as they complete. With
+        workers the items are parsed in chunks by a pool of threads, or of
+        processes forked from this one with executor='process'. Process outputs are
+        pickled back, or with transport='shared' their numeric lists, arrays and
+        grids are sent in shared memory and given as memoryviews of it.
+        '''
+        if executor not in ('thread', 'process'):
+            raise ValueError("executor must be 'thread' or 'process'")
+        if workers is not None and (not isinstance(workers, int) or workers < 1):
+            raise ValueError("workers must be a positive int")
+        if not isinstance(chunksize, int) or chunksize < 1:
+            raise ValueError("chunksize must be a positive int")
+        if transport not in ('pickle', 'shared'):
+            raise ValueError("transport must be 'pickle' or 'shared'")
+        if transport == 'shared' and (executor != 'process' or workers is None):
+            raise ValueError("transport='shared' needs workers and executor='process'")
+
+        return parseMany(self, items, workers, executor, ordered, binary, encoding, chunksize, transport)
+
+    def binary(self, encoding='utf-8'):
+        '''
+        The definition for parsing bytes, as read from a binary file. Delimiters,
+        literals, end values and patterns are encoded once here, so the blocks split
+        and compare bytes. Text is only decoded for the functions: 'str' decodes,
+        'int' (and float) parse bytes directly, other functions are handed decoded
+        text unless added with binary=True or having a true 'binary' attribute.
+        '''
+        if encoding not in self.binaryDefinitions:
+            definition = InputDefinition(self.frozen, self.executor)
+            definition.functions = self.functions
+            definition.binaryFunctions = self.binaryFunctions
+            definition.builders = copy.deepcopy(self.builders)
+            converted = {}
+            for b in definition.builders:
+                self.binary_helper(b, encoding, converted)
+            self.binaryDefinitions[encoding] = definition
+        return self.binaryDefinitions[encoding]
+
+    def isBinaryFunction(self, func):
+        return func in (int, float) or id(func) in self.binaryFunctions or \
+            getattr(func, 'binary', False)
+
+    def binary_function(self, func, encoding, converted):
+        # One replacement per function, so memo caches stay shared between blocks
+        if id(func) in converted:
+            return converted[id(func)][1]
+        if self.isBinaryFunction(func):
+            out = func
+        elif func is str:
+            out = operator.methodcaller('decode', encoding)
+        elif isinstance(func, MemoFunction):
+            # Cache on the bytes, hits then skip decoding too
+            out = MemoFunction(self.binary_function(func.func, encoding, converted), func.maxsize)
+        elif isinstance(func, Categorical):
+            # Coded from the decoded values, so text and bytes share the codes
+            out = Categorical(self.binary_function(func.func, encoding, converted), func.vocabulary)
+        else:
+            out = bytesFunction(func, encoding)
+        converted[id(func)] = (func, out)
+        return out
+
+    def binary_helper(self, builder, encoding, converted):
+        todo = [builder]
+        done = set()
+        while todo:
+            block = todo.pop()
+            if id(block) not in done:
+                done.add(id(block))
+                todo.extend(self.binary_block(block, encoding, converted))
+
+    def binary_block(self, block, encoding, converted):
+        # Encode block itself, returning the blocks nested in it
+        block.encoding = encoding
+        if isinstance(block, VocabularyMunch) or \
+            (isinstance(block, (ListBlock, ListElementMunch)) and block.delimiter is None):
+            # Splits into characters from the decoded line, the elements stay text
+            return []
+        nested = [b for (a, i, b) in blockChildren(block)]
+        for a in TEXTATTRS:
+            v = getattr(block, a, None)
+            if isinstance(v, str):
+                setattr(block, a, v.encode(encoding))
+        for a in PARSERATTRS:
+            v = getattr(block, a, None)
+            if callable(v) and not isinstance(v, SingleBlock):
+                setattr(block, a, self.binary_function(v, encoding, converted))
+        if isinstance(block, EncapsulatedLine) and not self.isBinaryFunction(block.trimmer):
+            block.trimmer = bytesTrimmer(block.trimmer, encoding)
+        elif isinstance(block, CompiledLineBlock):
+            nested.append(block.source)
+            if block.regex.pattern.isascii():
+                block.regex = re.compile(block.regex.pattern.encode('ascii'), re.S)
+            else:
+                # Multi byte delimiters do not fit the character classes
+                block.regex = re.compile(b"(?!)")
+        elif isinstance(block, RegexBlock):
+            block.regex = re.compile(block.regex.pattern.encode(encoding), block.regex.flags & ~re.UNICODE)
+            block.parsers = [p if isinstance(p, SingleBlock) else self.binary_function(p, encoding, converted) for p in block.parsers]
+        return nested
+
+    def addFunction(self, name, func, pure=False, cacheSize=4096, binary=False, categorical=False):
+        # A pure function is memoized, every block using it by name shares the cache
+        # A binary function is given bytes as they are when parsing bytes
+        # A categorical function gives int codes (see Categorical), categorical is
+        # True for a vocabulary of its own or a KeyCodes table to share
         if not callable(func):
             raise TypeError("Parser functions must be callable")
 
+        if binary:
+            self.binaryFunctions.add(id(func))
+
+        if pure:
+            func = MemoFunction(func, cacheSize)
+
+        if categorical is True:
+            func = Categorical(func)
+        elif categorical is not False:
+            func = Categorical(func, categorical)
+
         self.functions[name] = func
 
+# Magic bytes at the start of each compressed format
+COMPRESSIONS = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'BZh', 'bz2'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+    ]
+# Read buffer of the files opened by Input.from_path
+READBUFFER = 1 << 20
+
+def compression(magic):
+    for (m, kind) in COMPRESSIONS:
+        if magic.startswith(m):
+            return kind
+    return None
+
+def decompressor(raw, kind):
+    if kind == 'gzip':
+        return gzip.GzipFile(fileobj=raw, mode='rb')
+    if kind == 'xz':
+        return lzma.LZMAFile(raw)
+    if kind == 'bz2':
+        return bz2.BZ2File(raw)
+    # zstd is only in the standard library from python 3.14
+    try:
+        from compression import zstd
+        return zstd.ZstdFile(raw)
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd input requires python 3.14 or the zstandard module")
+    return zstandard.ZstdDecompressor().stream_reader(raw)
+
+def isBinaryFile(infile):
+    if isinstance(infile, (io.RawIOBase, io.BufferedIOBase)):
+        return True
+    return 'b' in getattr(infile, 'mode', '')
+
+def combineOutputs(definition, outputs):
+    # A single builder gives its own output, several a list of those not None
+    if len(definition.builders) == 1:
+        return outputs[0] if outputs else None
+    out = [o for o in outputs if o is not None]
+    if definition.frozen:
+        return tuple(out)
+    return out
+
+def parseBuilders(definition, infile):
+    # Instrumented builders (see BlockInstrument) are timed per call, so run as usual
+    if definition.executor == 'stack' and not any('parse' in vars(b) for b in definition.builders):
+        return definition.flatten().run(infile)
+    return combineOutputs(definition, [b.parse(infile) for b in definition.builders])
+
+# StackProgram instructions, each (op, a, b)
+(OPCALL, OPLEAF, OPBUILDER, OPCONST, OPLINE, OPNEXT, OPEND, OPRECORDS, OPBEGIN,
+    OPAPPEND, OPADD, OPCOMPLETE, OPSPAN, OPSPLIT, OPMATCH, OPFIELD, OPCOLLECT,
+    OPGATHER, OPTRY, OPTRIED, OPPAIR, OPPAIRKEY, OPPAIRDONE, OPPARTS, OPPART,
+    OPMERGE, OPMERGED, OPJUMP, OPOUT, OPHALT) = range(30)
+
+class Label:
+    # A jump target in a StackProgram, its pc once placed
+    __slots__ = ('pc',)
+
+class StackProgram:
+    '''
+    The builders of a definition flattened into one list of instructions, run by a
+    single loop keeping the values, the partial outputs of open blocks and the
+    'or' alternatives left to try on explicit stacks. Blocks do not call each
+    other, so a definition may nest deeper than python's recursion limit and
+    literals cost a function call rather than a block's parse. Blocks without
+    nested blocks, and builders with limits, sinks or loaded by numpy, are run by
+    their own parse.
+    '''
+    def __init__(self, definition):
+        self.definition = definition
+        self.code = []
+        # Expanded in order from a stack, so compiling is not recursive either
+        todo = []
+        for b in reversed(definition.builders):
+            todo.extend([(OPOUT, None, None), ('builder', b), (OPCONST, None, None)])
+        while todo:
+            item = todo.pop()
+            if isinstance(item, Label):
+                item.pc = len(self.code)
+            elif item[0] == 'builder':
+                todo.extend(reversed(self.builderItems(item[1])))
+            elif item[0] == 'line':
+                todo.extend(reversed(self.lineItems(item[1])))
+            else:
+                self.code.append(item)
+        self.code.append((OPHALT, None, None))
+        self.code = [(op, self.resolve(a), self.resolve(b)) for (op, a, b) in self.code]
+
+    def resolve(self, arg):
+        if isinstance(arg, Label):
+            return arg.pc
+        if isinstance(arg, list) and all(isinstance(l, Label) for l in arg):
+            return [l.pc for l in arg]
+        return arg
+
+    def builderItems(self, b):
+        # Instructions taking the line already read (None to read one) and giving
+        # the builder's output
+        if type(b) is SingleLineBuilder and b.callback is None:
+            return [(OPLINE, None, None), ('line', b.lineblock)]
+        if type(b) is MultiLineSpanBuilder:
+            items = [(OPSPAN, b, None), ('line', b.lineblock)]
+            if b.callback is not None:
+                items.append((OPCALL, b.callback, None))
+            return items
+
+        if type(b) is ListBuilder:
+            lineblock = b.lineblock
+            records = [('line' if isinstance(lineblock, SingleBlock) else 'builder', lineblock), (OPAPPEND, None, None)]
+        elif type(b) is MultiBuilderBuilder:
+            records = []
+            for (i, block) in enumerate(b.blocks):
+                if i > 0:
+                    records.append((OPNEXT, None, None))
+                records.extend([('builder', block), (OPAPPEND, None, None)])
+        elif type(b) is HashBuilder:
+            records = [('line', b.hashblock), (OPADD, None, None)]
+        else:
+            return [(OPBUILDER, b, None)]
+
+        # Records until the end value, each starting from the line already read
+        loop = Label()
+        end = Label()
+        done = Label()
+        return [(OPRECORDS, b, done), (OPBEGIN, None, None), loop, (OPEND, b.endvalue, end)] + records + \
+            [(OPNEXT, loop, None), end, (OPCOMPLETE, b, None), done]
+
+    def lineItems(self, b):
+        # Instructions taking a line of text and giving the block's output
+        if type(b) is LiteralBlock:
+            if b.callback is not None:
+                return [(OPCALL, b.parser, None), (OPCALL, b.callback, None)]
+            return [(OPCALL, b.parser, None)]
+        if type(b) is EncapsulatedLine:
+            return [(OPCALL, b.trimmer, None), ('line', b.block)]
+
+        if type(b) is OrBlock and len(b.parsers) > 0:
+            alternatives = [Label() for p in b.parsers]
+            end = Label()
+            items = [(OPTRY, alternatives, None)]
+            for (label, p) in zip(alternatives, b.parsers):
+                items.extend([label, ('line', p), (OPTRIED, end, None)])
+            return items + [end]
+
+        if type(b) is MultiBlockLine:
+            return self.fieldItems((OPSPLIT, b.delimiter, None), [('line', p) for p in b.blocks], b)
+        if type(b) is RegexBlock and any(isinstance(p, SingleBlock) for p in b.parsers):
+            return self.fieldItems((OPMATCH, b, None),
+                [('line', p) if isinstance(p, SingleBlock) else (OPCALL, p, None) for p in b.parsers], b)
+
+        if self.nestedPair(b):
+            return [(OPPAIR, b, None), self.parserItem(b.keyblock), (OPPAIRKEY, None, None),
+                self.parserItem(b.valueblock), (OPPAIRDONE, b, None)]
+        if type(b) is HashLineBlock and self.nestedPair(b.hashparser):
+            loop = Label()
+            end = Label()
+            return [(OPPARTS, b.delimiter, None), loop, (OPPART, end, None), ('line', b.hashparser),
+                (OPMERGE, None, None), (OPJUMP, loop, None), end, (OPMERGED, b, None)]
+
+        return [(OPLEAF, b, None)]
+
+    def nestedPair(self, b):
+        # Pairs of plain functions are parsed by their own parse
+        return type(b) is HashPairBlock and \
+            (isinstance(b.keyblock, SingleBlock) or isinstance(b.valueblock, SingleBlock))
+
+    def parserItem(self, p):
+        return ('line', p) if isinstance(p, SingleBlock) else (OPCALL, p, None)
+
+    def fieldItems(self, start, parsers, b):
+        # Each field (split text or match group) parsed in turn, the outputs
+        # gathered as MultiBlockLine and RegexBlock do
+        items = [start]
+        for (i, p) in enumerate(parsers):
+            skip = Label()
+            items.extend([(OPFIELD, i, skip), p, (OPCOLLECT, None, None), skip])
+        return items + [(OPGATHER, b, None)]
+
+    def run(self, infile):
+        code = self.code
+        readline = infile.readline
+        stack = []
+        # Lists of the outputs (or fields) of the blocks being parsed
+        frames = []
+        # [stack size, frames size, text, alternative, alternatives] of each open OrBlock
+        tries = []
+        outputs = []
+        pc = 0
+        while True:
+            try:
+                while True:
+                    (op, a, b) = code[pc]
+                    pc += 1
+                    if op == OPCALL:
+                        stack[-1] = a(stack[-1])
+                    elif op == OPLEAF:
+                        stack[-1] = a.parse(stack[-1])
+                    elif op == OPEND:
+                        if stack[-1] == a:
+                            stack.pop()
+                            pc = b
+                    elif op == OPAPPEND:
+                        v = stack.pop()
+                        if v is not None:
+                            frames[-1].append(v)
+                    elif op == OPNEXT:
+                        stack.append(readline().rstrip())
+                        if a is not None:
+                            pc = a
+                    elif op == OPADD:
+                        frames[-1].append(stack.pop())
+                    elif op == OPFIELD:
+                        fields = frames[-1][0]
+                        if a < len(fields) and fields[a] is not None:
+                            stack.append(fields[a])
+                        else:
+                            pc = b
+                    elif op == OPCOLLECT:
+                        v = stack.pop()
+                        if v is not None:
+                            frames[-1][1].append(v)
+                    elif op == OPJUMP:
+                        pc = a
+                    elif op == OPSPLIT:
+                        frames.append((stack.pop().split(a), []))
+                    elif op == OPGATHER:
+                        items = frames.pop()[1]
+                        if len(items) == 1:
+                            items = items[0]
+                        elif a.frozen:
+                            items = tuple(items)
+                        if a.callback is not None:
+                            items = a.callback(items)
+                        stack.append(items)
+                    elif op == OPTRY:
+                        text = stack.pop()
+                        tries.append([len(stack), len(frames), text, 0, a])
+                        stack.append(text)
+                        pc = a[0]
+                    elif op == OPTRIED:
+                        text = tries.pop()[2]
+                        if stack[-1] is None:
+                            raise Exception("No parsers for \"%s\"" % text)
+                        pc = a
+                    elif op == OPMATCH:
+                        text = stack.pop()
+                        m = a.regex.fullmatch(text)
+                        if m is None:
+                            raise ValueError("RegexBlock pattern did not match \"%s\"" % text)
+                        frames.append((m.groups(), []))
+                    elif op == OPLINE:
+                        if stack[-1] is None:
+                            stack[-1] = readline().rstrip()
+                    elif op == OPRECORDS:
+                        # Limits and sinks may be set after flattening
+                        if a.limit is not None or a.stop_when is not None or a.sink is not None or \
+                            (type(a) is ListBuilder and numericPlan(a) is not None):
+                            stack[-1] = a.parse(infile, stack[-1])
+                            pc = b
+                        elif stack[-1] is None:
+                            stack[-1] = readline().rstrip()
+                    elif op == OPBEGIN:
+                        frames.append([])
+                    elif op == OPCOMPLETE:
+                        records = frames.pop()
+                        a.count = len(records)
+                        a.stopped = False
+                        stack.append(a.complete(records))
+                    elif op == OPBUILDER:
+                        stack[-1] = a.parse(infile, stack[-1])
+                    elif op == OPSPAN:
+                        composite = stack[-1]
+                        if composite is None:
+                            composite = a.seperator[:0]
+                        line = readline().rstrip()
+                        while line != a.endvalue:
+                            composite += a.seperator + line
+                            line = readline().rstrip()
+                        stack[-1] = composite
+                    elif op == OPPAIR:
+                        (key, value) = a.split(stack.pop())
+                        frames.append([key, value])
+                        stack.append(key)
+                    elif op == OPPAIRKEY:
+                        frames[-1].append(stack.pop())
+                        stack.append(frames[-1][1])
+                    elif op == OPPAIRDONE:
+                        (key, value, a.key) = frames.pop()
+                        a.value = stack.pop()
+                        stack.append(a.pairHash(key))
+                    elif op == OPPARTS:
+                        text = stack.pop()
+                        frames.append([text.split(a) if a is not None else [text], 0, {}])
+                    elif op == OPPART:
+                        frame = frames[-1]
+                        if frame[1] == len(frame[0]):
+                            pc = a
+                        else:
+                            stack.append(frame[0][frame[1]])
+                            frame[1] += 1
+                    elif op == OPMERGE:
+                        v = stack.pop()
+                        if v is not None:
+                            frames[-1][2].update(v)
+                    elif op == OPMERGED:
+                        a.hash = frames.pop()[2]
+                        if a.frozen:
+                            a.hash = FrozenDict(a.hash)
+                        stack.append(a.hash if a.callback is None else a.callback(a.hash))
+                    elif op == OPCONST:
+                        stack.append(a)
+                    elif op == OPOUT:
+                        outputs.append(stack.pop())
+                    else:
+                        return combineOutputs(self.definition, outputs)
+            except Exception:
+                # The innermost open OrBlock tries its next parser, when it has
+                # none left it fails in turn
+                while True:
+                    if not tries:
+                        raise
+                    t = tries[-1]
+                    del stack[t[0]:]
+                    del frames[t[1]:]
+                    t[3] += 1
+                    if t[3] < len(t[4]):
+                        stack.append(t[2])
+                        pc = t[4][t[3]]
+                        break
+                    tries.pop()
+                    if not tries:
+                        raise Exception("No parsers for \"%s\"" % t[2])
+
+class ValidationError(ValueError):
+    '''
+    An input line which does not conform to the definition, see Input.validate
+    '''
+    def __init__(self, line, message, text=None):
+        super().__init__("line %d: %s" % (line, message))
+        self.line = line
+        self.message = message
+        self.text = text
+
+class ValidationStop(Exception):
+    pass
+
+class ValidationReader:
+    # Counts the lines read, the number of the line being checked is line
+    def __init__(self, infile):
+        self.infile = infile
+        self.line = 0
+        self.eof = False
+
+    def readline(self):
+        l = self.infile.readline()
+        if l:
+            self.line += 1
+        else:
+            self.eof = True
+        return l
+
+def checkFunction(func):
+    # Parser functions are called only for the errors they raise, so str, which
+    # can't raise, isn't called at all. Categorical values aren't coded.
+    if isinstance(func, Categorical):
+        func = func.func
+    if func is str:
+        return None
+    return func
+
+# Patterns of text the builtin parser functions surely accept, whole lists of
+# them are checked by one match before falling back to calling the function
+ACCEPTS = {
+    int: "[+-]?[0-9]+",
+    }
+
+class Validator:
+    '''
+    Checks input against a definition without building its output or calling
+    callbacks and sinks. Each block is compiled once into a check, a function of
+    the text raising when the block's parse would, or None when it never can.
+    Builders read the lines as parse does, recording an error for each record
+    which fails and for sections the input ends in before their end value.
+    '''
+    def __init__(self, definition, maxErrors=10):
+        if not isinstance(maxErrors, int) or maxErrors < 1:
+            raise ValueError("maxErrors must be an int of at least 1")
+
+        self.maxErrors = maxErrors
+        self.checks = {}
+        # Builders are compiled with the reader, which is reset onto each input
+        self.reader = ValidationReader(None)
+        self.builders = [self.builder(b) for b in definition.builders]
+
+    def validate(self, infile):
+        self.reader.__init__(infile)
+        self.errors = []
+        try:
+            for b in self.builders:
+                b(None)
+            # Parse leaves anything after the last builder unread, only blank
+            # lines are expected there
+            line = self.reader.readline()
+            while line:
+                if line.strip():
+                    self.error("Input after the last builder", line.rstrip())
+                line = self.reader.readline()
+        except ValidationStop:
+            pass
+        return self.errors
+
+    def error(self, message, text=None):
+        self.errors.append(ValidationError(self.reader.line, message, text))
+        if len(self.errors) >= self.maxErrors:
+            raise ValidationStop()
+
+    def next(self, line):
+        # The record's first line, read here unless the enclosing builder has
+        if line is None:
+            return self.reader.readline().rstrip()
+        return line
+
+    def ended(self, endvalue):
+        # Parse would read past the end of the input forever
+        if self.reader.eof and endvalue != endvalue[:0]:
+            self.error("Input ended before \"%s\"" % endvalue)
+            return True
+        return False
+
+    def record(self, block):
+        # Check of one record starting at the line already read, which records
+        # its own errors
+        if isinstance(block, SingleBlock):
+            check = self.check(block)
+            def record(line):
+                if check is not None:
+                    try:
+                        check(line)
+                    except Exception as e:
+                        self.error(str(e), line)
+            return record
+        return self.builder(block)
+
+    def builder(self, builder):
+        if isinstance(builder, GraphBuilder) or isinstance(builder, HashBuilder):
+            return self.recordsBuilder(builder, self.record(builder.hashblock))
+        elif isinstance(builder, ListBuilder):
+            plan = numericPlan(builder)
+            if plan is not None:
+                return self.numericBuilder(builder, self.record(builder.lineblock), plan)
+            return self.recordsBuilder(builder, self.record(builder.lineblock))
+        elif isinstance(builder, MultiBuilderBuilder):
+            return self.multiBuilder(builder)
+        elif isinstance(builder, MultiLineSpanBuilder):
+            return self.spanBuilder(builder)
+        elif isinstance(builder, SingleLineBuilderThrowToEnd):
+            return self.throwToEndBuilder(builder)
+        elif isinstance(builder, SingleLineBuilder):
+            record = self.record(builder.lineblock)
+            return lambda line: record(self.next(line))
+
+        # Builders of other types are parsed
+        def parsed(line):
+            try:
+                builder.parse(self.reader, line)
+            except Exception as e:
+                self.error(str(e))
+        return parsed
+
+    def recordsBuilder(self, builder, record):
+        endvalue = builder.endvalue
+        readline = self.reader.readline
+        def records(line):
+            line = self.next(line)
+            while line != endvalue:
+                if self.ended(endvalue):
+                    return
+                record(line)
+                line = readline().rstrip()
+        return records
+
+    def numericBuilder(self, builder, record, plan):
+        # The section is read whole as parse reads it, and checked by numericLoad
+        # without building the records. Its lines are only checked one by one
+        # when the section is short or not plain ints.
+        endvalue = builder.endvalue
+        newline = NEWLINE if isinstance(endvalue, str) else NEWLINE.encode()
+        delimiter = getattr(builder.lineblock.lineblock, 'delimiter', None)
+        strip = type(endvalue).strip
+        def records(line):
+            if line is not None and line == endvalue:
+                return
+            reader = self.reader
+            lines = [] if line is None else [line + newline]
+            # Number of the line before the section's first
+            first = reader.line - len(lines)
+            # The blank line ending the section is read too, the copy of the lines
+            # counts how many were without reading past the end of the input
+            (section, copied) = itertools.tee(iter(reader.infile.readline, endvalue))
+            held = len(lines)
+            lines.extend(itertools.takewhile(strip, section))
+            read = len(list(itertools.islice(copied, len(lines) - held + 1)))
+            reader.line += read
+            if read == len(lines) - held:
+                reader.eof = True
+
+            if len(lines) >= NUMPYMIN:
+                text = endvalue.join(lines)
+                if not text.endswith(newline):
+                    text += newline
+                if numericLoad(text, plan, delimiter, check=True):
+                    return
+            end = reader.line
+            for (i, l) in enumerate(lines):
+                reader.line = first + i + 1
+                record(l.rstrip())
+            reader.line = end
+        return records
+
+    def multiBuilder(self, builder):
+        endvalue = builder.endvalue
+        readline = self.reader.readline
+        blocks = [self.builder(b) for b in builder.blocks]
+        def records(line):
+            line = self.next(line)
+            while line != endvalue:
+                for b in blocks:
+                    if self.ended(endvalue):
+                        return
+                    b(line)
+                    line = readline().rstrip()
+        return records
+
+    def spanBuilder(self, builder):
+        endvalue = builder.endvalue
+        seperator = builder.seperator
+        readline = self.reader.readline
+        check = self.check(builder.lineblock)
+        def span(line):
+            if line is None:
+                line = seperator[:0]
+            first = self.reader.line
+            composite = line
+            line = readline().rstrip()
+            while line != endvalue:
+                if self.ended(endvalue):
+                    return
+                composite += seperator + line
+                line = readline().rstrip()
+            if check is not None:
+                try:
+                    check(composite)
+                except Exception as e:
+                    # Reported against the span's first line
+                    self.errors.append(ValidationError(first, str(e), composite))
+                    if len(self.errors) >= self.maxErrors:
+                        raise ValidationStop()
+        return span
+
+    def throwToEndBuilder(self, builder):
+        endvalue = builder.endvalue
+        readline = self.reader.readline
+        record = self.record(builder.lineblock)
+        def throwToEnd(line):
+            # As in parse the first line is read, then the one checked
+            if line is None:
+                readline()
+            record(readline().rstrip())
+            while readline().rstrip() != endvalue:
+                if self.ended(endvalue):
+                    return
+        return throwToEnd
+
+    def check(self, block):
+        if id(block) not in self.checks:
+            self.checks[id(block)] = self.compile(block)
+        return self.checks[id(block)]
+
+    def compile(self, block):
+        if isinstance(block, OrBlock):
+            return self.compileOr(block)
+        elif isinstance(block, LiteralBlock):
+            return checkFunction(block.parser)
+        elif isinstance(block, LiteralNoParse):
+            return self.compileLiteralNoParse(block)
+        elif isinstance(block, EncapsulatedLine):
+            return self.compileEncapsulated(block)
+        elif type(block) is MultiBlockLine:
+            return self.compileMultiBlock(block)
+        elif isinstance(block, CompiledLineBlock):
+            return self.compileCompiledLine(block)
+        elif isinstance(block, RegexBlock):
+            return self.compileRegex(block)
+        elif isinstance(block, ListBlock):
+            return self.compileList(block)
+        elif isinstance(block, ListElementMunch):
+            return self.compileMunch(block)
+        elif isinstance(block, VocabularyMunch):
+            return self.compileVocabulary(block)
+        elif isinstance(block, IntervalBlock):
+            return self.compileInterval(block)
+        elif isinstance(block, RangeBlock):
+            return block.parseRange
+        elif isinstance(block, HashPairBlock):
+            return self.compileHashPair(block)
+        elif isinstance(block, HashLineBlock):
+            return self.compileHashLine(block)
+        # Blocks of other types are parsed
+        return block.parse
+
+    def compileChild(self, child):
+        # Children are blocks or parser functions
+        if isinstance(child, SingleBlock):
+            return self.check(child)
+        return checkFunction(child)
+
+    def compileOr(self, block):
+        alternatives = [self.check(p) for p in block.parsers]
+        if None in alternatives:
+            return None
+        def check(inp):
+            for a in alternatives:
+                try:
+                    a(inp)
+                    return
+                except Exception:
+                    continue
+            raise ValueError("No parsers for \"%s\"" % inp)
+        return check
+
+    def compileLiteralNoParse(self, block):
+        absolute = block.absolute
+        if absolute is None:
+            return None
+        def check(inp):
+            if inp != absolute:
+                raise ValueError("Expected \"%s\" got \"%s\"" % (absolute, inp))
+        return check
+
+    def compileEncapsulated(self, block):
+        trimmer = block.trimmer
+        inner = self.check(block.block)
+        def check(inp):
+            inp = trimmer(inp)
+            if inner is not None:
+                inner(inp)
+        return check
+
+    def compileMultiBlock(self, block):
+        delimiter = block.delimiter
+        fields = [(i, c) for (i, c) in enumerate(self.check(b) for b in block.blocks) if c is not None]
+        if len(fields) == 0:
+            return None
+        def check(inp):
+            parts = inp.split(delimiter)
+            n = len(parts)
+            for (i, c) in fields:
+                if i < n:
+                    c(parts[i])
+        return check
+
+    def compileCompiledLine(self, block):
+        # Leaves of the layout with a parser which can fail, by group
+        leaves = []
+        def walk(layout):
+            (node, sub) = layout
+            if isinstance(node, LiteralBlock):
+                c = checkFunction(node.parser)
+                if c is not None:
+                    leaves.append((sub, c))
+            elif isinstance(node, FIELDBLOCKS):
+                c = self.check(node)
+                if c is not None:
+                    leaves.append((sub, c))
+            elif isinstance(node, MultiBlockLine):
+                for l in sub:
+                    walk(l)
+        walk(block.layout)
+        fullmatch = block.regex.fullmatch
+        source = self.check(block.source)
+        def check(inp):
+            m = fullmatch(inp)
+            if m is None:
+                if source is not None:
+                    source(inp)
+                return
+            groups = m.groups()
+            for (g, c) in leaves:
+                c(groups[g])
+        return check
+
+    def compileRegex(self, block):
+        fullmatch = block.regex.fullmatch
+        groups = [(i, c) for (i, c) in enumerate(self.compileChild(p) for p in block.parsers) if c is not None]
+        def check(inp):
+            m = fullmatch(inp)
+            if m is None:
+                raise ValueError("RegexBlock pattern did not match \"%s\"" % inp)
+            values = m.groups()
+            for (i, c) in groups:
+                if values[i] is not None:
+                    c(values[i])
+        return check
+
+    def compileList(self, block):
+        delimiter = block.delimiter
+        encoding = block.encoding
+        f = checkFunction(block.elementParser)
+        # Set elements and categorical values are hashed
+        hashed = isinstance(block, SetBlock) or isinstance(block.elementParser, Categorical)
+        if f is None:
+            # str elements can't fail, or fail to hash, only decoding can
+            if delimiter is not None or encoding is None:
+                return None
+            return lambda inp: inp.decode(encoding)
+        accepts = ACCEPTS.get(f)
+        if accepts is not None and isinstance(delimiter, str) and delimiter != "" and \
+            not set(delimiter) & set("+-0123456789"):
+            d = re.escape(delimiter)
+            fullmatch = re.compile("(?:%s%s)*%s" % (accepts, d, accepts)).fullmatch
+        else:
+            fullmatch = None
+        def check(inp):
+            if fullmatch is not None and fullmatch(inp):
+                return
+            if delimiter is None:
+                if encoding is not None:
+                    inp = inp.decode(encoding)
+                parts = inp
+            else:
+                parts = inp.split(delimiter)
+            if hashed:
+                for p in parts:
+                    hash(f(p))
+            else:
+                for p in parts:
+                    f(p)
+        return check
+
+    def compileMunch(self, block):
+        hashed = isinstance(block.elementParser, Categorical)
+        def check(inp):
+            elements = block.munch(inp)
+            if hashed:
+                for e in elements:
+                    hash(e)
+        return check
+
+    def compileVocabulary(self, block):
+        f = checkFunction(block.elementParser)
+        if f is None and block.encoding is None:
+            return None
+        def check(inp):
+            tokens = block.tokens(inp)
+            if f is not None:
+                for t in tokens:
+                    hash(f(t))
+        return check
+
+    def compileInterval(self, block):
+        seperator = block.seperator
+        parseRange = block.parseRange
+        def check(inp):
+            for r in inp.split(seperator):
+                parseRange(r)
+        return check
+
+    def compileHashPair(self, block):
+        split = block.split
+        encoding = block.encoding
+        key = self.compileChild(block.keyblock)
+        value = self.compileChild(block.valueblock)
+        def check(inp):
+            (k, v) = split(inp)
+            if block.distribute:
+                # The elements of the parsed key are the keys
+                keys = block.keyblock.parse(k) if isinstance(block.keyblock, SingleBlock) else block.keyblock(k)
+                for e in keys:
+                    hash(e)
+            else:
+                if encoding is not None:
+                    k.decode(encoding)
+                if key is not None:
+                    key(k)
+            if value is not None:
+                value(v)
+        return check
+
+    def compileHashLine(self, block):
+        delimiter = block.delimiter
+        pair = self.check(block.hashparser)
+        if delimiter is None:
+            return pair
+        def check(inp):
+            for l in inp.split(delimiter):
+                pair(l)
+        return check
+
 class Input:
-    def __init__(self, infile, definition):
+    def __init__(self, infile, definition, binary=None, encoding='utf-8'):
         self.infile = infile
         self.definition = definition
+        self.encoding = encoding
 
         if not isinstance(self.definition, InputDefinition):
             raise TypeError("InputDefinition required")
 
-    def parse(self):
-        if len(self.definition.builders) == 1:
-            self.blockOut = self.definition.builders[0].parse(self.infile)
-        else:
-            self.blockOut = []
-            for b in self.definition.builders:
-                bout = b.parse(self.infile)
-                if bout is not None:
-                    self.blockOut.append(bout)
+        # A binary file is parsed as bytes, without decoding the whole input
+        if binary is None:
+            binary = isBinaryFile(infile)
+        if binary:
+            self.definition = definition.binary(encoding)
+
+    @classmethod
+    def from_path(cls, path, definition, binary=False, encoding='utf-8', buffering=READBUFFER):
+        '''
+        Open a file for parsing, decompressing gzip, xz, bz2 and zstd files (found
+        by their magic bytes) as they are read. The decompressed stream is read
+        through a large buffer, so lines are split from big decompressed chunks.
+        '''
+        raw = open(path, 'rb', buffering=buffering)
+        files = [raw]
+        try:
+            kind = compression(raw.peek(6)[:6])
+            infile = raw
+            if kind is not None:
+                infile = io.BufferedReader(decompressor(raw, kind), buffer_size=buffering)
+                files.insert(0, infile)
+            if not binary:
+                infile = io.TextIOWrapper(infile, encoding=encoding)
+                files.insert(0, infile)
+        except BaseException:
+            raw.close()
+            raise
+
+        inp = cls(infile, definition, binary, encoding)
+        inp.files = files
+        return inp
+
+    def close(self):
+        # Closes the files opened by from_path, outermost first
+        for f in getattr(self, 'files', []):
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
+    def parse(self, profile=None, limit=None, stop_when=None):
+        if profile is not None:
+            return self.parse_instrumented(profile, limit, stop_when)
+
+        if limit is not None or stop_when is not None:
+            return self.parse_limited(limit, stop_when)
+
+        self.blockOut = parseBuilders(self.definition, self.infile)
         return self.blockOut
 
+    def parse_stats(self, stats=None, limit=None, stop_when=None):
+        # The output of parse together with the ParseStats gathered while parsing it
+        if stats is None:
+            stats = ParseStats()
+        return (self.parse(profile=stats, limit=limit, stop_when=stop_when), stats)
+
+    def parse_instrumented(self, instrument, limit=None, stop_when=None):
+        # Instruments only exist for the duration of the parse, so the blocks
+        # are left exactly as they were when no instrument is given
+        infile = self.infile
+        self.infile = instrument.attach(self.definition, infile)
+        try:
+            return self.parse(limit=limit, stop_when=stop_when)
+        finally:
+            self.infile = infile
+            instrument.detach()
+
+    def parse_limited(self, limit, stop_when):
+        # The records of the builders in turn, stopping once limit records are
+        # taken or stop_when is true for one, the rest of the input is not read
+        outputs = []
+        for b in self.definition.builders:
+            if isinstance(b, (ListBuilder, HashBuilder, MultiBuilderBuilder)):
+                out = b.parseUntil(self.infile, None, limit, stop_when)
+                taken = b.count
+                stopped = b.stopped
+            else:
+                out = b.parse(self.infile)
+                taken = 0 if out is None else 1
+                stopped = out is not None and stop_when is not None and stop_when(out)
+            outputs.append(out)
+
+            if limit is not None:
+                limit -= taken
+                stopped = stopped or limit <= 0
+            if stopped:
+                break
+
+        self.blockOut = combineOutputs(self.definition, outputs)
+        return self.blockOut
+
+    def tail(self, state=None):
+        '''
+        Parse only what was appended to the file since state, as returned by the
+        previous call. Returns the output Input.parse would give for the input up to
+        its last completed record, and the new state. If the file has been replaced
+        or the input just before state.offset has changed (checked by crc32 over
+        TAILWINDOW bytes) the parse starts over.
+        '''
+        if not isBinaryFile(self.infile):
+            raise TypeError("tail needs a file opened in binary mode")
+
+        new = TailState()
+        new.identity = fileIdentity(self.infile)
+        if state is not None and (state.identity != new.identity or \
+                crcRange(self.infile, state.window, state.offset) != state.crc):
+            state = None
+            new.restarted = True
+        if state is None:
+            state = TailState()
+
+        inc = IncrementalParser(self.definition, b"", new.added.append)
+        inc.index = state.index
+        inc.block = state.block
+        inc.records = list(state.records)
+        inc.outputs = list(state.outputs)
+
+        self.infile.seek(state.offset)
+        fed = 0
+        data = self.infile.read(TAILCHUNK)
+        while data:
+            inc.feed(data)
+            fed += len(data)
+            data = self.infile.read(TAILCHUNK)
+
+        new.offset = state.offset + fed - inc.pending()
+        new.window = max(0, new.offset - TAILWINDOW)
+        new.crc = crcRange(self.infile, new.window, new.offset)
+        new.index = inc.index
+        new.block = inc.block
+        new.records = inc.records
+        new.outputs = inc.outputs
+
+        self.blockOut = inc.snapshot()
+        return self.blockOut, new
+
+    def index(self, separator=EMPTYLINE, lines=False):
+        # The SectionIndex of the file, built on first use (see SectionIndex.forFile)
+        if isinstance(separator, str):
+            separator = separator.encode(self.encoding)
+        index = getattr(self, 'sectionIndex', None)
+        if index is None or index.separator != separator or (lines and index.lines is None):
+            if not isBinaryFile(self.infile):
+                raise TypeError("Sections need a file opened in binary mode")
+            index = SectionIndex.forFile(self.infile, separator, lines)
+            self.sectionIndex = index
+        return index
+
+    def parse_section(self, i, builder=0):
+        '''
+        Parse section i alone, as though it was the whole input, with the given
+        builder of the definition. Only that section is read.
+        '''
+        (start, end) = self.index().section(i)
+        return self.definition.builders[builder].parse(RangeReader(self.infile, start, end))
+
+    def parse_range(self, a, b, builder=0):
+        # The outputs of sections a to b - 1
+        return [self.parse_section(i, builder) for i in range(*slice(a, b).indices(len(self.index())))]
+
+    def parse_lines(self, a, b, builder=0):
+        # Parse lines a to b - 1 as though they were the whole input
+        lines = self.index(lines=True).lines
+        a = max(0, min(a, len(lines) - 1))
+        b = max(a, min(b, len(lines) - 1))
+        return self.definition.builders[builder].parse(RangeReader(self.infile, lines[a], lines[b]))
+
+    def validate(self, maxErrors=10):
+        '''
+        Check the input conforms to the definition without building its output or
+        calling callbacks. Returns the first maxErrors ValidationErrors, each with
+        its line number, in input order, no errors when the input is valid.
+        '''
+        return Validator(self.definition, maxErrors).validate(self.infile)
+
     def retrieve(self):
-        return self.blockOut
\ No newline at end of file
+        return self.blockOut
+
+class ManyParser:
+    # Parses inputs in turn with one definition, reusing the same readers
+    def __init__(self, definition, binary=False, encoding='utf-8'):
+        self.definition = definition
+        self.binary = binary
+        self.encoding = encoding
+        self.text = io.StringIO()
+        self.data = io.BytesIO()
+
+    def parse(self, item):
+        if isinstance(item, str):
+            # Reset onto the input rather than allocating a reader for each
+            self.text.__init__(item)
+            return parseBuilders(self.definition, self.text)
+        if isinstance(item, (bytes, bytearray, memoryview)):
+            self.data.__init__(item)
+            return parseBuilders(self.definition.binary(self.encoding), self.data)
+        if isinstance(item, os.PathLike):
+            with Input.from_path(item, self.definition, self.binary, self.encoding) as inp:
+                return inp.parse()
+        raise TypeError("parse_many takes str, bytes or os.PathLike inputs got \"%s\"" % type(item))
+
+    def parseChunk(self, chunk):
+        return [self.parse(item) for item in chunk]
+
+# The ManyParser of a parse_many worker process
+MANY = None
+
+def manyInit(definition, binary, encoding):
+    global MANY
+    MANY = ManyParser(definition, binary, encoding)
+
+def manyChunk(chunk):
+    return MANY.parseChunk(chunk)
+
+def manySharedChunk(chunk):
+    return shareOutputs(MANY.parseChunk(chunk))
+
+# Numeric lists and arrays of fewer values, and grids of fewer cells, are sent
+# pickled as they are by the shared transport
+SHAREMIN = 64
+# Values copied as they are when looking for shared ones
+SCALARS = frozenset((str, int, float, bool, bytes, type(None)))
+
+class SharedRef:
+    # Where one shared output is in its chunk's segment, sent in its place
+    __slots__ = ('offset', 'format', 'shape')
+
+    def __init__(self, offset, format, shape):
+        self.offset = offset
+        self.format = format
+        self.shape = shape
+
+    def __reduce__(self):
+        return (SharedRef, (self.offset, self.format, self.shape))
+
+def shareGrid(rows):
+    # The bytes, format and shape of equal length rows of ints, floats or
+    # single ascii characters, None for anything else
+    width = len(rows[0])
+    if width == 0 or len(rows) * width < SHAREMIN:
+        return None
+    if not set(map(type, rows)) <= {list, tuple} or set(map(len, rows)) != {width}:
+        return None
+    shape = (len(rows), width)
+    kind = type(rows[0][0])
+    if kind is str:
+        # Every cell one character, or the joined rows would not split back
+        if set(map(type, itertools.chain.from_iterable(rows))) != {str} or \
+                set(map(len, itertools.chain.from_iterable(rows))) != {1}:
+            return None
+        text = "".join(["".join(r) for r in rows])
+        if not text.isascii():
+            return None
+        return memoryview(text.encode('ascii')), 'c', shape
+    if kind is not int and kind is not float:
+        return None
+    if set(map(type, itertools.chain.from_iterable(rows))) != {kind}:
+        return None
+    try:
+        values = array.array('q' if kind is int else 'd', itertools.chain.from_iterable(rows))
+    except OverflowError:
+        return None
+    return memoryview(values).cast('B'), values.typecode, shape
+
+def shareValues(out):
+    # The bytes, format and shape of a numeric list, array or grid, None otherwise
+    if isinstance(out, array.array):
+        if out.typecode in ('u', 'w') or len(out) < SHAREMIN:
+            return None
+        return memoryview(out).cast('B'), out.typecode, (len(out),)
+    if type(out) not in (list, tuple) or len(out) == 0:
+        return None
+    if type(out[0]) in (list, tuple):
+        return shareGrid(out)
+
+    kind = type(out[0])
+    if len(out) < SHAREMIN or (kind is not int and kind is not float):
+        return None
+    if set(map(type, out)) != {kind}:
+        return None
+    try:
+        values = array.array('q' if kind is int else 'd', out)
+    except OverflowError:
+        return None
+    return memoryview(values).cast('B'), values.typecode, (len(out),)
+
+class ShareWriter:
+    '''
+    Writes the numeric lists, arrays and grids of a parse_many worker's outputs
+    into one shared memory segment, leaving a SharedRef in the place of each
+    '''
+    def __init__(self):
+        self.leaves = []
+        self.size = 0
+
+    def layout(self, out):
+        if type(out) is list or type(out) is tuple:
+            scalars = set(map(type, out)) <= SCALARS
+            # Short lists of scalars, the most common outputs, are never shared
+            if scalars and len(out) < SHAREMIN:
+                return out
+            shared = shareValues(out)
+            if shared is not None:
+                return self.ref(*shared)
+            if scalars:
+                return out
+            # Containers are only copied when something in them was shared
+            before = len(self.leaves)
+            laid = [o if type(o) in SCALARS else self.layout(o) for o in out]
+            if len(self.leaves) == before:
+                return out
+            return laid if type(out) is list else tuple(laid)
+        if type(out) is dict or type(out) is FrozenDict:
+            if set(map(type, out.values())) <= SCALARS:
+                return out
+            before = len(self.leaves)
+            laid = {k: self.layout(v) for (k, v) in out.items()}
+            if len(self.leaves) == before:
+                return out
+            return laid if type(out) is dict else FrozenDict(laid)
+        if isinstance(out, array.array):
+            shared = shareValues(out)
+            if shared is not None:
+                return self.ref(*shared)
+        return out
+
+    def ref(self, data, format, shape):
+        ref = SharedRef(self.size, format, shape)
+        self.leaves.append((self.size, data))
+        # Each value starts 8 byte aligned for the casts
+        self.size += (len(data) + 7) & ~7
+        return ref
+
+    def write(self):
+        # The segment's name, None when nothing was shared
+        if len(self.leaves) == 0:
+            return None
+        shm = shared_memory.SharedMemory(create=True, size=self.size)
+        try:
+            for (offset, data) in self.leaves:
+                shm.buf[offset:offset + len(data)] = data
+        except BaseException:
+            shm.close()
+            shm.unlink()
+            raise
+        shm.close()
+        return shm.name
+
+def shareOutputs(outputs):
+    # The segment name, the outputs with SharedRefs and which of them have any
+    writer = ShareWriter()
+    layouts = []
+    refs = []
+    for (i, out) in enumerate(outputs):
+        before = len(writer.leaves)
+        layouts.append(writer.layout(out))
+        if len(writer.leaves) > before:
+            refs.append(i)
+    return (writer.write(), layouts, refs)
+
+def attachShared(name):
+    '''
+    Map a worker's segment, unlinking it at once. The segment is mapped here from
+    its file in /dev/shm rather than viewed through the SharedMemory, which would
+    close the mapping from under the views once collected, so the memory is freed
+    with the last of them and there is nothing to close. Without /dev/shm the
+    segment is copied out once.
+    '''
+    shm = shared_memory.SharedMemory(name)
+    try:
+        try:
+            fd = os.open(os.path.join("/dev/shm", shm.name.lstrip("/")), os.O_RDWR)
+        except OSError:
+            return memoryview(bytearray(shm.buf))
+        try:
+            return memoryview(mmap.mmap(fd, shm.size))
+        finally:
+            os.close(fd)
+    finally:
+        shm.close()
+        shm.unlink()
+
+def sharedResolve(out, segment):
+    if isinstance(out, SharedRef):
+        size = struct.calcsize(out.format)
+        for n in out.shape:
+            size *= n
+        return segment[out.offset:out.offset + size].cast(out.format, out.shape)
+    if type(out) is list:
+        for (i, o) in enumerate(out):
+            if type(o) not in SCALARS:
+                out[i] = sharedResolve(o, segment)
+        return out
+    if type(out) is tuple:
+        return tuple(o if type(o) in SCALARS else sharedResolve(o, segment) for o in out)
+    if type(out) is dict:
+        for (k, v) in out.items():
+            out[k] = sharedResolve(v, segment)
+        return out
+    if type(out) is FrozenDict:
+        return FrozenDict({k: sharedResolve(v, segment) for (k, v) in out.items()})
+    return out
+
+def sharedOutputs(result):
+    # The outputs of a chunk sent by the shared transport, viewing its segment
+    (name, layouts, refs) = result
+    if name is not None:
+        segment = attachShared(name)
+        for i in refs:
+            layouts[i] = sharedResolve(layouts[i], segment)
+    return layouts
+
+def unshare(out):
+    # Shared output views back to lists, grids of characters to lists of str
+    if isinstance(out, memoryview):
+        values = out.tolist()
+        if out.format == 'c':
+            if out.ndim == 1:
+                return [c.decode('ascii') for c in values]
+            return [[c.decode('ascii') for c in r] for r in values]
+        return values
+    if type(out) is list:
+        return [unshare(o) for o in out]
+    if type(out) is tuple:
+        return tuple(unshare(o) for o in out)
+    if type(out) is dict:
+        return {k: unshare(v) for (k, v) in out.items()}
+    if type(out) is FrozenDict:
+        return FrozenDict({k: unshare(v) for (k, v) in out.items()})
+    return out
+
+def manyChunks(items, size):
+    # (index of the first, inputs) for each chunk of the inputs
+    chunk = []
+    start = 0
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield (start, chunk)
+            start += size
+            chunk = []
+    if chunk:
+        yield (start, chunk)
+
+def manyPool(definition, workers, executor, binary, encoding, transport='pickle'):
+    # Returns the pool and the function parsing a chunk in it
+    if executor == 'process':
+        # Forked workers inherit the definition, its functions need not pickle
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        pool = concurrent.futures.ProcessPoolExecutor(workers, context,
+            initializer=manyInit, initargs=(definition, binary, encoding))
+        if transport == 'shared':
+            # Started before the workers fork so they share it, segments are
+            # then registered by a worker and unregistered here
+            resource_tracker.ensure_running()
+            return (pool, manySharedChunk)
+        return (pool, manyChunk)
+
+    # Blocks keep their state while parsing, so each thread parses with its own copy
+    local = threading.local()
+    def parseChunk(chunk):
+        if getattr(local, 'parser', None) is None:
+            local.parser = ManyParser(copy.deepcopy(definition), binary, encoding)
+        return local.parser.parseChunk(chunk)
+    return (concurrent.futures.ThreadPoolExecutor(workers), parseChunk)
+
+def parseMany(definition, items, workers, executor, ordered, binary, encoding, chunksize, transport='pickle'):
+    if workers is None:
+        parser = ManyParser(definition, binary, encoding)
+        for (i, item) in enumerate(items):
+            out = parser.parse(item)
+            yield out if ordered else (i, out)
+        return
+
+    (pool, parseChunk) = manyPool(definition, workers, executor, binary, encoding, transport)
+    shared = transport == 'shared'
+    # Chunks stay pending until their outputs are taken
+    pending = collections.deque()
+    try:
+        chunks = manyChunks(items, chunksize)
+        for (start, chunk) in chunks:
+            pending.append((start, pool.submit(parseChunk, chunk)))
+            if len(pending) >= workers * MANYAHEAD:
+                break
+
+        while pending:
+            if ordered:
+                done = [pending[0]]
+            else:
+                concurrent.futures.wait([f for (start, f) in pending], return_when=concurrent.futures.FIRST_COMPLETED)
+                done = [p for p in pending if p[1].done()]
+
+            results = []
+            for p in done:
+                out = p[1].result()
+                results.append((p[0], sharedOutputs(out) if shared else out))
+                pending.remove(p)
+
+            # Keep the workers busy while the outputs are taken
+            for (start, chunk) in chunks:
+                pending.append((start, pool.submit(parseChunk, chunk)))
+                if len(pending) >= workers * MANYAHEAD:
+                    break
+
+            for (start, outputs) in results:
+                for (i, out) in enumerate(outputs):
+                    yield out if ordered else (start + i, out)
+    finally:
+        pool.shutdown(cancel_futures=True)
+        if shared:
+            # The segments of chunks parsed but never taken are freed
+            for (start, future) in pending:
+                if not future.cancelled() and future.exception() is None and \
+                    future.result()[0] is not None:
+                    attachShared(future.result()[0])
+
+class IncompleteInput(Exception):
+    # Raised by a LineBuffer which has no more of the lines that have arrived so far
+    pass
+
+class LineBuffer:
+    '''
+    Line source for parsing input as it arrives. Builders read it through readline
+    like a file. Running out of lines before close() raises IncompleteInput, the
+    record being parsed is then retried from its start once more lines are added.
+    '''
+    def __init__(self, empty=EMPTYLINE):
+        self.lines = []
+        self.start = 0
+        self.pos = 0
+        self.empty = empty
+        self.closed = False
+        # The lines which could complete the record that ran out, None for any
+        self.waitFor = None
+        self.matched = True
+        self.ready = True
+        # A record which keeps running out is retried once the buffered lines
+        # have doubled, so a long record is not reparsed for every line
+        self.failures = 0
+        self.retryAt = 0
+
+    def append(self, line):
+        self.extend([line])
+
+    def extend(self, lines):
+        self.lines.extend(lines)
+        if not self.ready:
+            if not self.matched:
+                self.matched = self.waitFor is None or \
+                    any(l.rstrip() in self.waitFor for l in lines)
+            self.ready = self.matched and len(self.lines) >= self.retryAt
+
+    def close(self):
+        self.closed = True
+        self.matched = True
+        self.ready = True
+
+    def readline(self):
+        if self.pos < len(self.lines):
+            line = self.lines[self.pos]
+            self.pos += 1
+            return line
+        if self.closed:
+            return self.empty
+        raise IncompleteInput()
+
+    def commit(self):
+        # The lines read so far belong to completed records and are dropped
+        self.start = self.pos
+        self.failures = 0
+        self.retryAt = 0
+        if self.start > 1024 and self.start * 2 > len(self.lines):
+            del self.lines[:self.start]
+            self.pos -= self.start
+            self.start = 0
+
+    def rewind(self, waitFor=None):
+        self.pos = self.start
+        self.waitFor = waitFor
+        self.failures += 1
+        if self.failures > 2:
+            self.retryAt = self.start + 2 * (len(self.lines) - self.start)
+        self.matched = False
+        self.ready = False
+
+def recordEnd(block):
+    # A builder only completes on reading its end value
+    if isinstance(block, MuiltiLineBlock) and hasattr(block, 'endvalue'):
+        return {block.endvalue}
+    return None
+
+# Size of the reads of AsyncInput
+FEEDCHUNK = 1 << 16
+
+class IncrementalParser:
+    '''
+    Parses a definition from data fed in as it arrives, in chunks of any size (see
+    InputDefinition.incremental). Records are parsed as soon as they are complete:
+    an item of a ListBuilder, a line dict of a HashBuilder, a block of a
+    MultiBuilderBuilder, or the whole output of any other builder. Each is passed
+    to the callback, and result() gives the same output as Input.parse once the
+    input is closed.
+    '''
+    def __init__(self, definition, empty=EMPTYLINE, callback=None):
+        self.definition = definition
+        self.callback = callback
+        self.buffer = LineBuffer(empty)
+        self.empty = empty
+        self.newline = "\n" if isinstance(empty, str) else b"\n"
+        # Data after the last line end, not yet a line
+        self.partial = []
+        # The builder being parsed, and the next block of a MultiBuilderBuilder
+        self.index = 0
+        self.block = 0
+        self.records = []
+        self.outputs = []
+
+        if not isinstance(self.definition, InputDefinition):
+            raise TypeError("InputDefinition required")
+
+        if callback is not None and not callable(callback):
+            raise TypeError("Callback must be callable")
+
+    def feed(self, data):
+        self.addData(data)
+        self.emit()
+
+    def close(self):
+        self.endData()
+        self.emit()
+        return self.result()
+
+    def emit(self):
+        for r in self.run():
+            if self.callback is not None:
+                self.callback(r)
+
+    def addData(self, data):
+        # Only the new data is searched for line ends, a partial line is kept in
+        # pieces until its end arrives
+        lines = data.split(self.newline)
+        if self.partial:
+            self.partial.append(lines[0])
+            lines[0] = self.empty.join(self.partial)
+        last = lines.pop()
+        self.partial = [last] if last else []
+        if lines:
+            self.buffer.extend(lines)
+
+    def endData(self):
+        if self.partial:
+            self.buffer.append(self.empty.join(self.partial))
+            self.partial = []
+        self.buffer.close()
+
+    def done(self):
+        return self.index >= len(self.definition.builders)
+
+    def run(self):
+        builders = self.definition.builders
+        buf = self.buffer
+        while self.index < len(builders) and buf.ready:
+            b = builders[self.index]
+            waitFor = None
+            try:
+                if isinstance(b, (ListBuilder, HashBuilder, MultiBuilderBuilder)):
+                    line = buf.readline().rstrip()
+                    if self.block == 0 and line == b.endvalue:
+                        buf.commit()
+                        self.finish(b.complete(self.records))
+                        continue
+
+                    if isinstance(b, MultiBuilderBuilder):
+                        waitFor = recordEnd(b.blocks[self.block])
+                        record = b.parseRecord(buf, line, self.block)
+                        self.block = (self.block + 1) % len(b.blocks)
+                    else:
+                        waitFor = recordEnd(getattr(b, 'lineblock', None))
+                        record = b.parseRecord(buf, line)
+                    buf.commit()
+                    if record is None:
+                        continue
+                    if b.sink is not None:
+                        b.sink(record)
+                    else:
+                        self.records.append(record)
+                else:
+                    waitFor = recordEnd(b)
+                    record = b.parse(buf)
+                    buf.commit()
+                    self.finish(record)
+                    if record is None:
+                        continue
+            except IncompleteInput:
+                buf.rewind(waitFor)
+                return
+            yield record
+
+    def finish(self, output):
+        self.outputs.append(output)
+        self.records = []
+        self.block = 0
+        self.index += 1
+
+    def result(self):
+        return combineOutputs(self.definition, self.outputs)
+
+    def snapshot(self):
+        # The output as if the input ended after the last completed record
+        outputs = list(self.outputs)
+        if not self.done():
+            b = self.definition.builders[self.index]
+            if isinstance(b, (ListBuilder, HashBuilder, MultiBuilderBuilder)):
+                outputs.append(b.complete(list(self.records)))
+        return combineOutputs(self.definition, outputs)
+
+    def pending(self):
+        # Length of the data fed in after the last completed record
+        buf = self.buffer
+        return sum(len(l) + 1 for l in buf.lines[buf.start:]) + \
+            sum(len(p) for p in self.partial)
+
+# Read size of Input.tail
+TAILCHUNK = 1 << 20
+
+# Length of the input before the tail offset checked for changes
+TAILWINDOW = 1 << 16
+
+class TailState:
+    '''
+    Where Input.tail stopped: the offset just after the last completed record, the
+    crc32 of the input from window to it, the device and inode of the file and
+    the parse up to there
+    '''
+    def __init__(self):
+        self.offset = 0
+        self.window = 0
+        self.crc = 0
+        self.identity = None
+        self.index = 0
+        self.block = 0
+        self.records = []
+        self.outputs = []
+        # The records completed by the call, and whether it had to start over
+        self.added = []
+        self.restarted = False
+
+def fileIdentity(infile):
+    # Device and inode of the file, None when it is not one
+    try:
+        st = os.fstat(infile.fileno())
+    except (AttributeError, OSError, ValueError):
+        return None
+    return (st.st_dev, st.st_ino)
+
+def crcRange(infile, start, end, crc=0):
+    # crc32 of the bytes from start to end, None if the file ends before
+    infile.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        data = infile.read(min(TAILCHUNK, remaining))
+        if not data:
+            return None
+        crc = zlib.crc32(data, crc)
+        remaining -= len(data)
+    return crc
+
+class RangeReader:
+    # File wrapper reading the lines between two offsets, then the end of input
+    def __init__(self, infile, start, end):
+        self.infile = infile
+        self.pos = start
+        self.end = end
+        infile.seek(start)
+
+    def readline(self):
+        if self.pos >= self.end:
+            return b""
+        line = self.infile.readline(self.end - self.pos)
+        self.pos += len(line)
+        return line
+
+# Sidecar index file header: magic, file size, mtime, section and line counts
+INDEXMAGIC = b"CPIDX1\n"
+INDEXHEADER = struct.Struct("<QqQQH")
+
+class SectionIndex:
+    '''
+    Byte offsets of the sections of a file, the runs of lines between separator
+    lines (empty lines by default), and optionally of every line. Built in one pass
+    scanning for the separator without parsing, and stored in a sidecar file which
+    is reused while the size and mtime of the file are unchanged.
+    '''
+    def __init__(self, starts, ends, lines=None, size=0, mtime=0, separator=b""):
+        self.starts = starts
+        self.ends = ends
+        self.lines = lines
+        self.size = size
+        self.mtime = mtime
+        self.separator = separator
+
+    def __len__(self):
+        return len(self.starts)
+
+    def section(self, i):
+        return self.starts[i], self.ends[i]
+
+    @classmethod
+    def build(cls, infile, separator=EMPTYLINE, lines=False, encoding='utf-8'):
+        if isinstance(separator, str):
+            separator = separator.encode(encoding)
+        # A line equal to the separator once stripped, as the builders compare it
+        sepLine = re.compile(b"(?m)^" + re.escape(separator) + b"[ \\t\\r\\x0b\\x0c]*(?:\\n|\\Z)")
+        starts = array.array('Q')
+        ends = array.array('Q')
+        lineStarts = array.array('Q') if lines else None
+
+        infile.seek(0)
+        base = 0
+        start = 0
+        carry = b""
+        while True:
+            chunk = infile.read(TAILCHUNK)
+            data = carry + chunk
+            # Only whole lines are scanned, except at the end of the file
+            cut = len(data) if not chunk else data.rfind(b"\n") + 1
+            for m in sepLine.finditer(data, 0, cut):
+                if m.start() == m.end():
+                    continue
+                if base + m.start() > start:
+                    starts.append(start)
+                    ends.append(base + m.start())
+                start = base + m.end()
+            if lineStarts is not None:
+                lineStarts.extend(base + i + 1 for i in findAll(data, b"\n", cut))
+            if not chunk:
+                break
+            carry = data[cut:]
+            base += cut
+        size = base + len(data)
+        if size > start:
+            starts.append(start)
+            ends.append(size)
+        if lineStarts is not None:
+            if not lineStarts or lineStarts[-1] != size:
+                lineStarts.append(size)
+            lineStarts.insert(0, 0)
+            if len(lineStarts) > 1 and lineStarts[-1] == lineStarts[-2]:
+                lineStarts.pop()
+        return cls(starts, ends, lineStarts, size, 0, separator)
+
+    @classmethod
+    def forFile(cls, infile, separator=EMPTYLINE, lines=False, path=None, encoding='utf-8'):
+        '''
+        The index of an open binary file, loaded from the sidecar (path, by default
+        the file name with '.idx' added) if it matches, otherwise built and saved
+        '''
+        if isinstance(separator, str):
+            separator = separator.encode(encoding)
+        name = getattr(infile, 'name', None)
+        if not isinstance(name, str):
+            return cls.build(infile, separator, lines)
+        if path is None:
+            path = name + ".idx"
+
+        st = os.fstat(infile.fileno())
+        try:
+            index = cls.load(path)
+            if index.size == st.st_size and index.mtime == st.st_mtime_ns and \
+                index.separator == separator and (index.lines is not None or not lines):
+                return index
+        except (OSError, ValueError):
+            pass
+
+        index = cls.build(infile, separator, lines)
+        index.mtime = st.st_mtime_ns
+        try:
+            index.save(path)
+        except OSError:
+            pass
+        return index
+
+    def save(self, path):
+        lines = self.lines if self.lines is not None else array.array('Q')
+        with open(path, "wb") as f:
+            f.write(INDEXMAGIC)
+            f.write(INDEXHEADER.pack(self.size, self.mtime, len(self.starts),
+                len(lines) if self.lines is not None else 0xffffffffffffffff, len(self.separator)))
+            f.write(self.separator)
+            self.starts.tofile(f)
+            self.ends.tofile(f)
+            lines.tofile(f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            if f.read(len(INDEXMAGIC)) != INDEXMAGIC:
+                raise ValueError("Not a section index")
+            (size, mtime, nSections, nLines, nSep) = INDEXHEADER.unpack(f.read(INDEXHEADER.size))
+            separator = f.read(nSep)
+            starts = array.array('Q')
+            starts.fromfile(f, nSections)
+            ends = array.array('Q')
+            ends.fromfile(f, nSections)
+            lines = None
+            if nLines != 0xffffffffffffffff:
+                lines = array.array('Q')
+                lines.fromfile(f, nLines)
+        return cls(starts, ends, lines, size, mtime, separator)
+
+def findAll(data, sub, end):
+    # Offsets of every occurence of sub in data before end
+    i = data.find(sub, 0, end)
+    while i >= 0:
+        yield i
+        i = data.find(sub, i + 1, end)
+
+class AsyncInput:
+    '''
+    Parses the lines of an asyncio.StreamReader as they arrive, without a thread,
+    so one event loop can parse many streams at once (sharing a definition). Async
+    iteration gives the records as they complete (see IncrementalParser), parse()
+    gives the same output as Input.parse. The stream is parsed in bytes mode unless
+    binary is False.
+    '''
+    def __init__(self, reader, definition, binary=True, encoding='utf-8'):
+        self.reader = reader
+        self.definition = definition
+        self.decoder = None
+
+        if not isinstance(self.definition, InputDefinition):
+            raise TypeError("InputDefinition required")
+
+        self.parser = definition.incremental(binary=binary, encoding=encoding)
+        if not binary:
+            self.decoder = codecs.getincrementaldecoder(encoding)()
+
+    async def records(self):
+        buf = self.parser.buffer
+        while not self.parser.done():
+            raw = await self.reader.read(FEEDCHUNK)
+            data = raw
+            if self.decoder is not None:
+                data = self.decoder.decode(raw, not raw)
+            self.parser.addData(data)
+            if not raw:
+                self.parser.endData()
+
+            if buf.ready:
+                for r in self.parser.run():
+                    yield r
+
+    def __aiter__(self):
+        return self.records()
+
+    async def parse(self):
+        async for r in self.records():
+            pass
+        return self.parser.result()
+
+class CountingReader:
+    # File wrapper counting the length of what has been read through it
+    def __init__(self, infile):
+        self.infile = infile
+        self.count = 0
+
+    def readline(self):
+        line = self.infile.readline()
+        self.count += len(line)
+        return line
+
+    def __getattr__(self, name):
+        return getattr(self.infile, name)
+
+def outputItems(out):
+    if out is None:
+        return 0
+    if isinstance(out, (str, bytes)) or not hasattr(out, '__len__'):
+        return 1
+    return len(out)
+
+class BlockInstrument:
+    '''
+    Base for tools observing a parse block by block. attach() gives every block in
+    the definition a wrapped parse as an instance attribute and detach() deletes it,
+    so the block classes, and any parse run without an instrument, are untouched.
+    Subclasses provide node() to make their per block record and wrap(). A block
+    used in several places is recorded by the first of its nodes.
+    '''
+    def attach(self, definition, infile):
+        if getattr(self, 'definition', None) is not definition:
+            self.definition = definition
+            self.names = {}
+            for (name, f) in definition.functions.items():
+                self.names.setdefault(id(f), name)
+            self.roots = [self.attach_helper(b, None) for b in definition.builders]
+
+        self.reader = CountingReader(infile)
+        # A stack of child time accumulators, one per active call, gives self time
+        self.stack = []
+        # A block used in several places is wrapped once, by its first node
+        self.wrapped = {}
+        for n in self.nodes():
+            if id(n.block) not in self.wrapped:
+                self.wrapped[id(n.block)] = n.block
+                n.block.parse = self.wrap(n, n.block.parse)
+        return self.reader
+
+    def attach_helper(self, block, parent):
+        n = self.node(block, parent)
+        n.children = [self.attach_helper(b, n) for (a, i, b) in blockChildren(block)]
+        return n
+
+    def detach(self):
+        for block in self.wrapped.values():
+            del block.parse
+        self.wrapped = {}
+
+    def nodes(self):
+        stack = list(reversed(self.roots))
+        while stack:
+            n = stack.pop()
+            yield n
+            stack.extend(reversed(n.children))
+
+    def functionName(self, f):
+        if id(f) in self.names:
+            return self.names[id(f)]
+        return getattr(f, '__name__', type(f).__name__)
+
+    def notation_helper(self, f):
+        # Nested blocks are their own nodes, so only stand in for them here
+        if isinstance(f, (SingleBlock, MuiltiLineBlock)):
+            return "..."
+        return self.functionName(f)
+
+    def notation(self, block):
+        # The definition notation of block alone, with nested blocks elided
+        def quote(d):
+            return "None" if d is None else repr(d)
+        def cb(b):
+            if getattr(b, 'callback', None) is None:
+                return ""
+            return " / " + self.functionName(b.callback)
+        f = self.notation_helper
+
+        if isinstance(block, CompiledLineBlock):
+            return "/%s/ (compiled)" % block.regex.pattern
+        elif isinstance(block, RegexBlock):
+            return "/%s/(%s%s)" % (block.regex.pattern, " ".join(f(p) for p in block.parsers), cb(block))
+        elif isinstance(block, LiteralBlock):
+            return "#%s%s#" % (f(block.parser), cb(block))
+        elif isinstance(block, LiteralNoParse):
+            if block.absolute is None:
+                return "##"
+            return "#%s#" % quote(block.absolute)
+        elif isinstance(block, SetBlock):
+            return "[<%s %s%s]" % (f(block.elementParser), quote(block.delimiter), cb(block))
+        elif isinstance(block, IntervalBlock):
+            return "[-<%s %s %s%s]" % (f(block.elementParser), quote(block.delimiter), quote(block.seperator), cb(block))
+        elif isinstance(block, RangeBlock):
+            return "[-%s %s%s]" % (f(block.elementParser), quote(block.delimiter), cb(block))
+        elif isinstance(block, ListBlock):
+            return "[%s %s%s]" % (f(block.elementParser), quote(block.delimiter), cb(block))
+        elif isinstance(block, VocabularyMunch):
+            return "[*=%s (%s) %s%s]" % (f(block.elementParser), " ".join(quote(t) for t in block.vocabulary), quote(block.delimiter), cb(block))
+        elif isinstance(block, ListElementMunch):
+            return "[*%s %s %s%s]" % (f(block.elementParser), f(block.elementEvaluator), quote(block.delimiter), cb(block))
+        elif isinstance(block, MultiBlockLine):
+            return "(... %s%s)" % (quote(block.delimiter), cb(block))
+        elif isinstance(block, OrBlock):
+            return " or ".join("..." for p in block.parsers)
+        elif isinstance(block, EncapsulatedLine):
+            return ">... %s<" % f(block.trimmer)
+        elif isinstance(block, HashPairBlock):
+            kind = "{<" if block.distribute else "{"
+            flags = ("rev " if block.reverse else "") + ("intern " if block.intern else "")
+            kv = (block.valueblock, block.keyblock) if block.reverse else (block.keyblock, block.valueblock)
+            return "%s%s%s %s %s%s}" % (kind, flags, f(kv[0]), f(kv[1]), quote(block.seperator), cb(block))
+        elif isinstance(block, HashLineBlock):
+            return "{* ... %s%s}" % (quote(block.delimiter), cb(block))
+        elif isinstance(block, ListBuilder):
+            return "[[ ]] %s%s" % (quote(block.endvalue), cb(block))
+        elif isinstance(block, GraphBuilder):
+            return "<< >> %s%s" % (quote(block.endvalue), cb(block))
+        elif isinstance(block, HashBuilder):
+            return "{{ }} %s%s" % (quote(block.endvalue), cb(block))
+        elif isinstance(block, MultiBuilderBuilder):
+            return "(( )) %s%s" % (quote(block.endvalue), cb(block))
+        elif isinstance(block, MultiLineSpanBuilder):
+            return "span %s %s%s" % (quote(block.seperator), quote(block.endvalue), cb(block))
+        elif isinstance(block, SingleLineBuilder):
+            return "line"
+        return type(block).__name__
+
+class BlockProfile:
+    def __init__(self, block, notation, parent):
+        self.block = block
+        self.notation = notation
+        self.parent = parent
+        self.children = []
+        self.calls = 0
+        self.totalTime = 0.0
+        self.selfTime = 0.0
+        self.bytes = 0
+        self.raised = 0
+        self.swallowed = 0
+        self.items = 0
+
+class ParseProfile(BlockInstrument):
+    '''
+    Per block profile of Input.parse(profile=ParseProfile()): call counts, total and
+    self time, input length consumed, exceptions raised (and swallowed by an OrBlock
+    parent) and output items, reported as a tree following the definition. Running
+    more parses with the same profile and definition adds to the figures.
+    '''
+    def node(self, block, parent):
+        return BlockProfile(block, self.notation(block), parent)
+
+    def wrap(self, node, parse):
+        reader = self.reader
+        builder = isinstance(node.block, MuiltiLineBlock)
+        swallowing = node.parent is not None and isinstance(node.parent.block, OrBlock)
+        clock = time.perf_counter
+
+        def profiled(*args):
+            childTime = [0.0]
+            self.stack.append(childTime)
+            before = reader.count
+            start = clock()
+            try:
+                out = parse(*args)
+            except BaseException:
+                node.raised += 1
+                if swallowing:
+                    node.parent.swallowed += 1
+                raise
+            finally:
+                elapsed = clock() - start
+                self.stack.pop()
+                if self.stack:
+                    self.stack[-1][0] += elapsed
+                node.calls += 1
+                node.totalTime += elapsed
+                node.selfTime += elapsed - childTime[0]
+                if builder:
+                    node.bytes += reader.count - before
+                else:
+                    node.bytes += len(args[0])
+            node.items += outputItems(out)
+            return out
+        return profiled
+
+    def toDict_helper(self, n):
+        return {
+            'block': n.notation,
+            'calls': n.calls,
+            'totalTime': n.totalTime,
+            'selfTime': n.selfTime,
+            'bytes': n.bytes,
+            'raised': n.raised,
+            'swallowed': n.swallowed,
+            'items': n.items,
+            'children': [self.toDict_helper(c) for c in n.children],
+            }
+
+    def toDict(self):
+        return [self.toDict_helper(r) for r in self.roots]
+
+    def toJSON(self, **kwargs):
+        return json.dumps(self.toDict(), **kwargs)
+
+    def report(self):
+        lines = []
+        def report_helper(n, depth):
+            swallowed = " swallowed=%d" % n.swallowed if isinstance(n.block, OrBlock) else ""
+            lines.append("%-50s calls=%d total=%.6fs self=%.6fs bytes=%d items=%d raised=%d%s" % \
+                ("    " * depth + n.notation, n.calls, n.totalTime, n.selfTime,
+                 n.bytes, n.items, n.raised, swallowed))
+            for c in n.children:
+                report_helper(c, depth + 1)
+        for r in self.roots:
+            report_helper(r, 0)
+        return "\n".join(lines)
+
+    def dumpStats(self, path):
+        '''
+        Write the profile in the marshalled format of cProfile, so it can be read
+        with pstats.Stats(path) and the usual profile viewers. Each block is a
+        function named by its notation, its line number is its position in the tree.
+        '''
+        keys = {}
+        for (i, n) in enumerate(self.nodes()):
+            keys[id(n)] = ("<definition>", i + 1, n.notation)
+
+        stats = {}
+        for n in self.nodes():
+            callers = {}
+            if n.parent is not None:
+                callers[keys[id(n.parent)]] = (n.calls, n.calls, n.selfTime, n.totalTime)
+            stats[keys[id(n)]] = (n.calls, n.calls, n.selfTime, n.totalTime, callers)
+
+        with open(path, "wb") as f:
+            marshal.dump(stats, f)
+
+
+MASK64 = (1 << 64) - 1
+
+class HyperLogLog:
+    '''
+    Estimate of the number of distinct values added, in 2 ** precision byte registers
+    whatever the count (standard error about 1.04 / sqrt(2 ** precision)). Up to
+    2 ** precision distinct 64 bit hashes of the values are also held, so small
+    counts are exact (but for hash collisions) whatever the size of the values, and
+    only hashes not among them update the registers. Hashes come from hash(), which
+    is salted per process for str and bytes, so sketches are only comparable within
+    one process.
+    '''
+    def __init__(self, precision=12):
+        if not isinstance(precision, int) or isinstance(precision, bool):
+            raise TypeError("precision must be an int")
+        if not 4 <= precision <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+        self.exact = set()
+        self.overflowed = False
+
+    def update(self, values):
+        hashes = set()
+        for x in map(hash, zip(set(values))):
+            # The tuple hash leaves runs of values in few registers, mixed here
+            x &= MASK64
+            hashes.add(((x ^ (x >> 29)) * 0xbf58476d1ce4e5b9) & MASK64)
+        hashes -= self.exact
+        if not hashes:
+            return
+        if self.overflowed or len(self.exact) + len(hashes) > len(self.registers):
+            self.overflowed = True
+        else:
+            self.exact |= hashes
+
+        registers = self.registers
+        shift = 64 - self.precision
+        low = (1 << shift) - 1
+        for x in hashes:
+            rank = shift + 1 - (x & low).bit_length()
+            if rank > registers[x >> shift]:
+                registers[x >> shift] = rank
+
+    def add(self, value):
+        self.update((value,))
+
+    def count(self):
+        if not self.overflowed:
+            return len(self.exact)
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / math.fsum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is the better estimate while registers are still empty
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+# Output values counted, ranged and sketched by ParseStats
+STATVALUES = frozenset((str, int, float, bool, bytes))
+STATNUMBERS = frozenset((int, float))
+STATCONTAINERS = (list, tuple, set, frozenset, array.array)
+
+class BlockStats:
+    def __init__(self, block, notation, parent, precision):
+        self.block = block
+        self.notation = notation
+        self.parent = parent
+        self.children = []
+        self.calls = 0
+        self.records = 0
+        self.items = 0
+        self.values = 0
+        self.minLength = None
+        self.maxLength = None
+        self.totalLength = 0
+        self.measured = 0
+        self.minValue = None
+        self.maxValue = None
+        self.distinct = HyperLogLog(precision)
+        # Output type name to the type names of its elements
+        self.types = {}
+
+    def length(self, n):
+        self.measured += 1
+        self.totalLength += n
+        if self.minLength is None or n < self.minLength:
+            self.minLength = n
+        if self.maxLength is None or n > self.maxLength:
+            self.maxLength = n
+
+    def numbers(self, lo, hi):
+        if self.minValue is None or lo < self.minValue:
+            self.minValue = lo
+        if self.maxValue is None or hi > self.maxValue:
+            self.maxValue = hi
+
+    def schema(self):
+        return " | ".join(sorted(
+            name + ("[%s]" % ", ".join(sorted(e)) if e else "") for (name, e) in self.types.items()))
+
+class ParseStats(BlockInstrument):
+    '''
+    Statistics of the output of Input.parse(profile=ParseStats()), taken from each
+    block's output as it is returned rather than by a pass over the result: outputs,
+    output items, min/max length (of strings and containers), numeric range and an
+    estimate of distinct values (of scalar outputs and the scalar elements of
+    container outputs), and the output types seen. Builders give the sections read
+    and records in them, their length is records per section. Each block holds a
+    HyperLogLog of 2 ** precision bytes, so memory does not grow with the input.
+    '''
+    def __init__(self, precision=12):
+        HyperLogLog(precision)
+        self.precision = precision
+
+    def node(self, block, parent):
+        return BlockStats(block, self.notation(block), parent, self.precision)
+
+    def wrap(self, node, parse):
+        if isinstance(node.block, MuiltiLineBlock):
+            def counted(*args):
+                out = parse(*args)
+                records = getattr(node.block, 'count', None)
+                if records is None:
+                    records = 0 if out is None else 1
+                node.calls += 1
+                node.records += records
+                node.items += outputItems(out)
+                node.length(records)
+                self.shape(node, out)
+                return out
+        else:
+            def counted(*args):
+                out = parse(*args)
+                self.record(node, out)
+                return out
+        return counted
+
+    def record(self, node, out):
+        node.calls += 1
+        node.items += outputItems(out)
+        (values, kinds, length) = self.shape(node, out)
+        if length is not None:
+            node.length(length)
+        if not kinds:
+            return
+        if kinds <= STATVALUES:
+            scalars = values
+        else:
+            scalars = [v for v in values if type(v) in STATVALUES]
+        if kinds <= STATNUMBERS:
+            node.numbers(min(values), max(values))
+        elif kinds & STATNUMBERS:
+            numbers = [v for v in values if type(v) in STATNUMBERS]
+            node.numbers(min(numbers), max(numbers))
+        node.values += len(scalars)
+        node.distinct.update(scalars)
+
+    def shape(self, node, out):
+        # Note the types of out and its elements, giving the scalar values in it,
+        # their types and the length of out
+        kind = type(out)
+        if kind in STATVALUES:
+            node.types.setdefault(kind.__name__, set())
+            length = len(out) if kind is str or kind is bytes else None
+            return ((out,), {kind}, length)
+        if isinstance(out, dict):
+            node.types.setdefault(kind.__name__, set()).update("%s: %s" % (k.__name__, v.__name__)
+                for (k, v) in set(zip(map(type, out.keys()), map(type, out.values()))))
+            return (out.keys(), set(map(type, out.keys())), len(out))
+        if isinstance(out, STATCONTAINERS):
+            kinds = set(map(type, out))
+            node.types.setdefault(kind.__name__, set()).update(k.__name__ for k in kinds)
+            return (out, kinds, len(out))
+        node.types.setdefault(kind.__name__, set())
+        return ((), set(), None)
+
+    def toDict_helper(self, n):
+        d = {
+            'block': n.notation,
+            'type': n.schema(),
+            'calls': n.calls,
+            'items': n.items,
+            }
+        if isinstance(n.block, MuiltiLineBlock):
+            d['sections'] = n.calls
+            d['records'] = n.records
+        d['length'] = None if not n.measured else \
+            {'min': n.minLength, 'max': n.maxLength, 'mean': n.totalLength / n.measured}
+        d['range'] = None if n.minValue is None else [n.minValue, n.maxValue]
+        d['values'] = n.values
+        d['distinct'] = n.distinct.count()
+        d['children'] = [self.toDict_helper(c) for c in n.children]
+        return d
+
+    def toDict(self):
+        return [self.toDict_helper(r) for r in self.roots]
+
+    def toJSON(self, **kwargs):
+        return json.dumps(self.toDict(), **kwargs)
+
+    def schema(self):
+        # The output types of every block, as a tree following the definition
+        def schema_helper(n):
+            return {'block': n.notation, 'type': n.schema(), 'children': [schema_helper(c) for c in n.children]}
+        return [schema_helper(r) for r in self.roots]
+
+    def report(self):
+        lines = []
+        def report_helper(n, depth):
+            if isinstance(n.block, MuiltiLineBlock):
+                counts = "sections=%d records=%d" % (n.calls, n.records)
+            else:
+                counts = "calls=%d items=%d values=%d distinct~%d" % (n.calls, n.items, n.values, n.distinct.count())
+            length = "" if not n.measured else " length=%d..%d" % (n.minLength, n.maxLength)
+            numbers = "" if n.minValue is None else " range=%r..%r" % (n.minValue, n.maxValue)
+            lines.append("%-40s %s%s%s type=%s" % \
+                ("    " * depth + n.notation, counts, length, numbers, n.schema()))
+            for c in n.children:
+                report_helper(c, depth + 1)
+        for r in self.roots:
+            report_helper(r, 0)
+        return "\n".join(lines)
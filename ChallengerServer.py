@@ -0,0 +1,251 @@
+'''
+Local parse server.
+
+Keeps definitions built (and the parser imported) in a long running process, so a
+tool parsing one input per run does not pay the interpreter start, tatsu import
+and buildersFromStr every time. Requests name a definition and a file, they are
+parsed by a pool of worker processes forked from the server (so the definitions
+are already built in every worker) and the results are returned pickled.
+Requests and errors are JSON, so nothing a client sends is unpickled, and the
+socket is only open to the user running the server.
+
+    python ChallengerServer.py serve /tmp/parser.sock definitions.py --workers 4
+    python ChallengerServer.py parse /tmp/parser.sock tickets input.txt
+
+The definitions file is python defining DEFINITIONS, a dict of name to either an
+InputDefinition or its notation string:
+
+    import ChallengerParser as parser
+    d = parser.InputDefinition()
+    d.addFunction('endTrim', lambda s: s[:-1])
+    d.buildersFromStr(...)
+    DEFINITIONS = {'foods': d, 'numbers': "[[\\n#int#\\n]]"}
+
+From python, ParseClient(socketPath).parse(name, path) returns the parsed data.
+'''
+import os
+import sys
+import copy
+import json
+import runpy
+import pickle
+import struct
+import socket
+import argparse
+import builtins
+import threading
+import socketserver
+import multiprocessing
+import concurrent.futures
+
+import ChallengerParser as parser
+
+# Frames are a 4 byte length then the payload, a response payload starts with
+# one of the status bytes. Requests and errors are JSON, results are pickled
+FRAME = struct.Struct(">I")
+OK = b"o"
+ERROR = b"e"
+
+# The definitions of a forked worker process, set by its pool's initializer
+workerDefinitions = None
+
+def sendFrame(sock, payload):
+    sock.sendall(FRAME.pack(len(payload)) + payload)
+
+def recvExact(sock, n):
+    data = bytearray()
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+def recvFrame(sock):
+    # None once the other end has closed
+    header = recvExact(sock, FRAME.size)
+    if header is None:
+        return None
+    return recvExact(sock, FRAME.unpack(header)[0])
+
+def warmDefinitions(definitions):
+    out = {}
+    for (name, d) in definitions.items():
+        if isinstance(d, str):
+            definition = parser.InputDefinition()
+            definition.buildersFromStr(d)
+            d = definition
+        if not isinstance(d, parser.InputDefinition):
+            raise TypeError("Definitions must be InputDefinitions or notation strings")
+        out[name] = d
+    return out
+
+def errorPayload(e):
+    return ERROR + json.dumps([type(e).__name__, str(e)]).encode()
+
+def initWorker(definitions):
+    # Forked workers inherit the definitions rather than having them pickled
+    global workerDefinitions
+    workerDefinitions = definitions
+
+def parseRequest(request, definitions=None):
+    '''
+    Parse one request in a worker, returning the response payload, the result is
+    pickled here so the server only forwards the bytes. Process workers use the
+    definitions they were started with, threads give their own copy.
+    '''
+    try:
+        if definitions is None:
+            definitions = workerDefinitions
+        if request['definition'] not in definitions:
+            raise KeyError("No definition named \"%s\"" % request['definition'])
+        definition = definitions[request['definition']]
+        with parser.Input.from_path(request['path'], definition, binary=request.get('binary', False)) as inp:
+            out = inp.parse(limit=request.get('limit'))
+        return OK + pickle.dumps(out, pickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        return errorPayload(e)
+
+def noop():
+    return None
+
+class ParseHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # Any number of requests per connection, each answered in turn
+        while True:
+            frame = recvFrame(self.request)
+            if frame is None:
+                return
+            try:
+                request = json.loads(frame)
+                response = self.server.submit(request)
+            except Exception as e:
+                response = errorPayload(e)
+            sendFrame(self.request, response)
+
+class ParseServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    '''
+    Serves parse requests on a unix domain socket. definitions maps names to
+    InputDefinitions (or notation strings), built once here. Requests are parsed
+    by a pool of forked worker processes, or by threads with a copy of the
+    definitions each when processes is False or fork is not available. The
+    socket is made readable and writable by its owner only.
+    '''
+    daemon_threads = True
+
+    def __init__(self, socketPath, definitions, workers=None, processes=True):
+        self.definitions = warmDefinitions(definitions)
+        self.local = threading.local()
+        self.socketPath = socketPath
+        self.threaded = not (processes and 'fork' in multiprocessing.get_all_start_methods())
+        workers = workers or os.cpu_count() or 1
+        if self.threaded:
+            self.pool = concurrent.futures.ThreadPoolExecutor(workers)
+        else:
+            self.pool = concurrent.futures.ProcessPoolExecutor(workers, multiprocessing.get_context('fork'),
+                initializer=initWorker, initargs=(self.definitions,))
+            # The workers fork now, before the server has any threads
+            self.pool.submit(noop).result()
+
+        if os.path.exists(socketPath):
+            os.unlink(socketPath)
+        super().__init__(socketPath, ParseHandler)
+
+    def server_bind(self):
+        super().server_bind()
+        os.chmod(self.socketPath, 0o600)
+
+    def threadDefinitions(self):
+        # Blocks keep their state while parsing, so each thread parses its own copy
+        if getattr(self.local, 'definitions', None) is None:
+            self.local.definitions = copy.deepcopy(self.definitions)
+        return self.local.definitions
+
+    def parseThreaded(self, request):
+        return parseRequest(request, self.threadDefinitions())
+
+    def submit(self, request):
+        if not isinstance(request, dict) or 'definition' not in request or 'path' not in request:
+            raise ValueError("Requests need a definition and a path")
+        if self.threaded:
+            return self.pool.submit(self.parseThreaded, request).result()
+        return self.pool.submit(parseRequest, request).result()
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown()
+        if os.path.exists(self.socketPath):
+            os.unlink(self.socketPath)
+
+class ParseClient:
+    '''
+    Connection to a ParseServer, requests are sent one at a time over it. Results
+    are unpickled, so the socket must belong to the user of this process.
+    '''
+    def __init__(self, socketPath):
+        if os.stat(socketPath).st_uid != os.getuid():
+            raise PermissionError("%s is not owned by this user" % socketPath)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socketPath)
+
+    def parse(self, definition, path, binary=False, limit=None):
+        request = {
+            'definition': definition,
+            'path': os.path.abspath(path),
+            'binary': binary,
+            'limit': limit,
+            }
+        sendFrame(self.sock, json.dumps(request).encode())
+        response = recvFrame(self.sock)
+        if response is None:
+            raise ConnectionError("Parse server closed the connection")
+        if response[:1] == OK:
+            return pickle.loads(response[1:])
+
+        # Errors are raised as their own type when it is a builtin one
+        (kind, message) = json.loads(response[1:])
+        exc = getattr(builtins, kind, None)
+        if not (isinstance(exc, type) and issubclass(exc, Exception)):
+            exc = RuntimeError
+            message = "%s: %s" % (kind, message)
+        raise exc(message)
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description="Local parse server")
+    commands = args.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="run the server")
+    serve.add_argument("socket", help="unix socket path")
+    serve.add_argument("definitions", help="python file defining DEFINITIONS")
+    serve.add_argument("--workers", type=int, default=None, help="worker count, cpu count by default")
+    serve.add_argument("--threads", action="store_true", help="parse in threads rather than processes")
+    request = commands.add_parser("parse", help="parse a file through a running server")
+    request.add_argument("socket", help="unix socket path")
+    request.add_argument("definition", help="definition name")
+    request.add_argument("path", help="input file")
+    request.add_argument("--binary", action="store_true", help="parse in bytes mode")
+    args = args.parse_args(argv)
+
+    if args.command == "serve":
+        definitions = runpy.run_path(args.definitions)['DEFINITIONS']
+        with ParseServer(args.socket, definitions, args.workers, not args.threads) as server:
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+        return 0
+
+    with ParseClient(args.socket) as client:
+        print(repr(client.parse(args.definition, args.path, args.binary)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,10 +2,29 @@ import unittest
 import logging
 import sys
 import re
+import io
+import os
+import stat
+import json
+import pstats
+import tempfile
+import tracemalloc
+import random
+import asyncio
+import socket
+import threading
+import gzip
+import lzma
+import bz2
+import pathlib
+import pickle
+import array
 
 import testCaseSoT
 
 import ChallengerParser as parser
+import ChallengerBenchmark
+import ChallengerServer
 import ChallengerGrammar
 import tatsu
 
@@ -32,9 +51,19 @@ class DayTest():
     def testParse(self):
         par = parser.Input(self.infile, self.definition)
         outData = par.parse()
+        self.assertSoT(outData)
+
+    def testValidate(self):
+        assert parser.Input(self.infile, self.definition).validate() == []
+
+    def testStack(self):
+        self.definition.setExecutor('stack')
+        self.assertSoT(parser.Input(self.infile, self.definition).parse())
+
+    def assertSoT(self, outData):
         logging.debug(outData)
 
-        SoT = eval("testCaseSoT.%s" % type(self).__name__.replace("_Strings",""))
+        SoT = eval("testCaseSoT.%s" % type(self).__name__.split("_")[0])
         logging.debug(SoT)
 
         assert self.deepCompare(SoT, outData)
@@ -83,6 +112,20 @@ class Day2Test_Strings(DayTest, unittest.TestCase):
 ]]''')
         self.infile = open("testfiles/day2-testInput", "r")
 
+class Day2Test_Compiled(Day2Test_Strings):
+    def setUp(self):
+        super().setUp()
+        self.definition.compile()
+        assert isinstance(self.definition.builders[0].lineblock.lineblock, parser.CompiledLineBlock)
+
+class Day2Test_Regex(DayTest, unittest.TestCase):
+    def setUp(self):
+        self.definition = parser.InputDefinition()
+        self.definition.buildersFromStr('''[[
+/(\d+-\d+) (\w): (\w+)/([int '-'] str str)
+]]''')
+        self.infile = open("testfiles/day2-testInput", "r")
+
 class Day3Test(DayTest, unittest.TestCase):
     def setUp(self):
         self.definition = parser.InputDefinition()
@@ -128,6 +171,40 @@ class Day4Test_Strings(DayTest, unittest.TestCase):
 ]]''')
         self.infile = open("testfiles/day4-testInput", "r")
 
+class Day4Test_Intern(DayTest, unittest.TestCase):
+    def setUp(self):
+        self.definition = parser.InputDefinition()
+        self.definition.buildersFromStr('''[[
+{{
+{* intern str str ':' ' '}
+}}
+]]''')
+        self.infile = open("testfiles/day4-testInput", "r")
+
+    def testParse(self):
+        super().testParse()
+
+        self.infile.seek(0)
+        outData = parser.Input(self.infile, self.definition).parse()
+        keys = {}
+        for passport in outData:
+            for k in passport:
+                assert keys.setdefault(k, k) is k
+
+class HashPairBlockTest(unittest.TestCase):
+    def testSeperatorInValue(self):
+        assert parser.HashPairBlock(str, str, ':').parse("a:b:c") == {'a': 'b:c'}
+        assert parser.HashPairBlock(str, str, ':', reverse=True).parse("b:c:a") == {'a': 'b:c'}
+
+    def testKeyCodes(self):
+        codes = parser.KeyCodes()
+        builder = parser.HashBuilder(parser.HashLineBlock( \
+                parser.HashPairBlock(str, int, ':'), ' '), \
+            parser.EMPTYLINE, intern=codes)
+        out = builder.parse(io.StringIO("x:1 y:2\ny:3 z:4\n"))
+        assert out == {0: 1, 1: 3, 2: 4}
+        assert codes.names == ['x', 'y', 'z']
+
 class Day5Test(DayTest, unittest.TestCase):
     def setUp(self):
         self.definition = parser.InputDefinition()
@@ -232,6 +309,17 @@ class Day8Test_Strings(DayTest, unittest.TestCase):
 
         self.infile = open("testfiles/day8-testInput", "r")
 
+class Day8Test_Compiled(DayTest, unittest.TestCase):
+    def setUp(self):
+        self.definition = parser.InputDefinition()
+        self.definition.buildersFromStr('''[[
+(#str# #int# ' ')
+]]''')
+        self.definition.compile()
+        assert isinstance(self.definition.builders[0].lineblock.lineblock, parser.CompiledLineBlock)
+
+        self.infile = open("testfiles/day8-testInput", "r")
+
 class Day13Test(DayTest, unittest.TestCase):
     def setUp(self):
         def busParser(b):
@@ -379,6 +467,48 @@ class Day16Test_Strings(DayTest, unittest.TestCase):
 
         self.infile = open("testfiles/day16-testInput", "r")
 
+class Day16Test_Compiled(Day16Test):
+    def setUp(self):
+        super().setUp()
+        self.definition.compile()
+        assert isinstance(self.definition.builders[0].hashblock.valueblock, parser.CompiledLineBlock)
+
+class RegexCompileTest(unittest.TestCase):
+    def testFallback(self):
+        block = parser.MultiBlockLine([parser.LiteralNoParse("Tile"), parser.LiteralBlock(int)], ' ')
+        compiled = parser.regexCompile(block)
+        assert compiled.parse("Tile 12") == 12
+        # Fewer fields than blocks is left to the original tree
+        assert compiled.parse("Tile") == []
+        with self.assertRaises(ValueError):
+            compiled.parse("Tyle 12")
+
+    def testNotCompilable(self):
+        block = parser.MultiBlockLine([parser.EncapsulatedLine(str.strip, parser.LiteralBlock(int)), parser.LiteralBlock(int)], ' ')
+        assert parser.regexCompile(block) is None
+
+    def testListFields(self):
+        block = parser.MultiBlockLine([ \
+                parser.ListBlock(int, ','), \
+                parser.MultiBlockLine([parser.SetBlock(str, None), parser.ListBlock(int, ' ', len)], ':'), \
+                parser.RangeBlock(int, '-') \
+            ], ' | ')
+        compiled = parser.regexCompile(block)
+        assert compiled is not None
+        for line in ["1,2,3 | ab:1 2 3 | 4-6", "1 | :7 | 1-1", "1,2 | a:1 | 2-3 | x"]:
+            assert compiled.parse(line) == block.parse(line)
+        with self.assertRaises(ValueError):
+            compiled.parse("1,x | a:1 | 2-3")
+
+    def testExtraFields(self):
+        block = parser.MultiBlockLine([ \
+                parser.MultiBlockLine([parser.LiteralBlock(int), parser.LiteralBlock(int)], '-'), \
+                parser.LiteralBlock(str) \
+            ], ' = ')
+        compiled = parser.regexCompile(block)
+        for line in ["1-2 = a", "1-2-3 = a = b", "1-2 = "]:
+            assert compiled.parse(line) == block.parse(line)
+
 class Day19Test(DayTest, unittest.TestCase):
     def setUp(self):
         self.definition = parser.InputDefinition()
@@ -422,6 +552,91 @@ class Day19Test_Strings(DayTest, unittest.TestCase):
 
         self.infile = open("testfiles/day19-testInput", "r")
 
+class Day19Test_Profile(Day19Test_Strings):
+    def testParse(self):
+        profile = parser.ParseProfile()
+        outData = parser.Input(self.infile, self.definition).parse(profile=profile)
+        assert self.deepCompare(testCaseSoT.Day19Test, outData)
+
+        # Instrumentation is removed once the parse is done
+        for b in self.definition.builders:
+            for block in parser.blockWalk(b):
+                assert 'parse' not in block.__dict__
+
+        hashNode = profile.roots[0]
+        orNode = hashNode.children[0].children[0].children[0]
+        assert isinstance(orNode.block, parser.OrBlock)
+        assert orNode.calls == 6 and orNode.swallowed == 2
+        assert hashNode.items == 6
+        assert profile.roots[1].notation == "[[ ]] ''"
+        assert json.loads(profile.toJSON())[1]['children'][0]['children'][0]['block'] == "[str None]"
+
+        with tempfile.TemporaryDirectory() as d:
+            profile.dumpStats(os.path.join(d, "profile"))
+            stats = pstats.Stats(os.path.join(d, "profile"))
+            assert stats.total_calls == sum(n.calls for n in profile.nodes())
+
+    def testShared(self):
+        # One block in two places is wrapped, counted and removed once
+        number = parser.LiteralBlock(int)
+        definition = parser.InputDefinition()
+        definition.addBuilder(parser.ListBuilder(parser.MultiBlockLine([number, number], ' '), ""))
+        for instrument in (parser.ParseProfile(), parser.ParseStats()):
+            assert parser.Input(io.StringIO("1 2\n3 4\n"), definition).parse(profile=instrument) == [[1, 2], [3, 4]]
+            assert 'parse' not in number.__dict__
+            (first, second) = instrument.roots[0].children[0].children
+            assert first.calls == 4 and second.calls == 0
+
+class Day19Test_Stats(Day19Test_Strings):
+    def testParse(self):
+        (outData, stats) = parser.Input(self.infile, self.definition).parse_stats()
+        assert self.deepCompare(testCaseSoT.Day19Test, outData)
+        for b in self.definition.builders:
+            for block in parser.blockWalk(b):
+                assert 'parse' not in block.__dict__
+
+        hashNode = stats.roots[0]
+        assert hashNode.calls == 1 and hashNode.records == 6
+        orNode = hashNode.children[0].children[0].children[0]
+        assert orNode.calls == 6 and orNode.items == 11
+        assert (orNode.minValue, orNode.maxValue) == (1, 5)
+        assert (orNode.minLength, orNode.maxLength) == (1, 3)
+        assert orNode.distinct.count() == 7
+        assert orNode.schema() == "list[int] | str"
+
+        strNode = stats.roots[1].children[0].children[0]
+        assert strNode.values == 31 and strNode.distinct.count() == 2
+        assert stats.roots[1].records == 5
+        d = json.loads(stats.toJSON())
+        assert d[1]['sections'] == 1 and d[1]['type'] == "list[list]"
+        assert d[1]['children'][0]['children'][0]['length'] == {'min': 6, 'max': 7, 'mean': 31 / 5}
+        assert stats.schema()[0]['type'] == "dict[str: list, str: str]"
+
+class HyperLogLogTest(unittest.TestCase):
+    def testCount(self):
+        h = parser.HyperLogLog(10)
+        h.update(range(500))
+        h.update(range(1000))
+        assert h.count() == 1000 and not h.overflowed
+
+        # Long values are held as their hashes
+        h = parser.HyperLogLog()
+        h.update("x" * 100000 + str(i) for i in range(100))
+        h.add("x" * 100000 + "0")
+        assert h.count() == 100 and all(type(x) is int and 0 <= x <= parser.MASK64 for x in h.exact)
+
+        for values in (range(100000), [str(i) for i in range(100000)], [i / 7 for i in range(100000)]):
+            h = parser.HyperLogLog()
+            for i in range(0, 100000, 10):
+                h.update(values[i:i + 10])
+            assert h.overflowed and len(h.exact) <= 4096 and len(h.registers) == 4096
+            assert abs(h.count() - 100000) < 5000
+
+    def testErrors(self):
+        self.assertRaises(TypeError, parser.HyperLogLog, 12.0)
+        self.assertRaises(ValueError, parser.HyperLogLog, 3)
+        self.assertRaises(ValueError, parser.ParseStats, 19)
+
 class Day20Test(DayTest, unittest.TestCase):
     def setUp(self):
         self.definition = parser.InputDefinition()
@@ -613,6 +828,53 @@ class Day24Test(DayTest, unittest.TestCase):
 
         self.infile = open("testfiles/day24-testInput", "r")
 
+class Day24Test_Memo(DayTest, unittest.TestCase):
+    def setUp(self):
+        def isDir(d):
+            directions = ['ne','e','se','sw','w','nw']
+            if d in directions:
+                return parser.GACCEPT
+            else:
+                return parser.GCONTINUE
+        self.definition = parser.InputDefinition()
+        self.definition.addFunction('Day24Test_validator', isDir, pure=True)
+        self.definition.addFunction('str', str, pure=True)
+        self.definition.buildersFromStr('''[[
+        [* str Day24Test_validator None]
+    ]]''')
+
+        self.infile = open("testfiles/day24-testInput", "r")
+
+    def testParse(self):
+        super().testParse()
+
+        info = self.definition.functions['Day24Test_validator'].cacheInfo()
+        # Only the 6 directions and the incomplete 's' and 'n' are ever seen
+        assert info['misses'] == 8 and info['hits'] > 0
+
+class MemoFunctionTest(unittest.TestCase):
+    def testCache(self):
+        calls = []
+        def parse(s):
+            calls.append(s)
+            return [s]
+        memo = parser.MemoFunction(parse, 2)
+        block = parser.ListBlock(memo, ' ')
+        out = block.parse("a b a c a")
+        assert out == [['a'], ['b'], ['a'], ['c'], ['a']]
+        assert out[0] is out[2]
+        # 'b' is the least recently used when 'c' arrives
+        assert calls == ['a', 'b', 'c']
+        assert memo.cacheInfo() == {'hits': 2, 'misses': 3, 'evictions': 1, 'size': 2, 'maxsize': 2}
+
+    def testErrorsNotCached(self):
+        memo = parser.MemoFunction(int)
+        with self.assertRaises(ValueError):
+            memo("x")
+        with self.assertRaises(ValueError):
+            memo("x")
+        assert memo.cacheInfo()['size'] == 0
+
 class Day24Test_Strings(DayTest, unittest.TestCase):
     def setUp(self):
         def isDir(d):
@@ -629,6 +891,1159 @@ class Day24Test_Strings(DayTest, unittest.TestCase):
 
         self.infile = open("testfiles/day24-testInput", "r")
 
+class Day24Test_Vocabulary(DayTest, unittest.TestCase):
+    def setUp(self):
+        self.definition = parser.InputDefinition()
+        self.definition.buildersFromStr('''[[
+        [*= str ('ne' 'e' 'se' 'sw' 'w' 'nw') None]
+    ]]''')
+
+        self.infile = open("testfiles/day24-testInput", "r")
+
+class BytesDayTest(DayTest):
+    # Reopens the input as a binary file, which parses it in bytes mode
+    def setUp(self):
+        super().setUp()
+        name = self.infile.name
+        self.infile.close()
+        self.infile = open(name, "rb")
+
+class Day2Test_Bytes(BytesDayTest, Day2Test_Strings):
+    pass
+
+class Day4Test_Bytes(BytesDayTest, Day4Test_Strings):
+    pass
+
+class Day7Test_Bytes(BytesDayTest, Day7Test_Strings):
+    pass
+
+class Day8Test_Bytes(BytesDayTest, Day8Test_Compiled):
+    pass
+
+class Day16Test_Bytes(BytesDayTest, Day16Test_Strings):
+    pass
+
+class Day19Test_Bytes(BytesDayTest, Day19Test_Strings):
+    pass
+
+class Day20Test_Bytes(BytesDayTest, Day20Test_Strings):
+    pass
+
+class Day21Test_Bytes(BytesDayTest, Day21Test_Strings):
+    pass
+
+class Day24Test_Bytes(BytesDayTest, Day24Test_Memo):
+    pass
+
+class Day24Test_VocabularyBytes(BytesDayTest, Day24Test_Vocabulary):
+    pass
+
+class BytesModeTest(unittest.TestCase):
+    def testDefinition(self):
+        definition = parser.InputDefinition()
+        definition.buildersFromStr('''[[
+    ([int '-'] #str# ' ')
+]]''')
+        binary = definition.binary()
+        assert binary is definition.binary()
+        assert binary.builders[0].lineblock.lineblock.delimiter == b' '
+        # The text definition is left as it was
+        assert definition.builders[0].lineblock.lineblock.delimiter == ' '
+        out = [[[1, 3], 'a'], [[2, 4], 'b']]
+        assert parser.Input(io.BytesIO(b"1-3 a\n2-4 b\n"), definition).parse() == out
+        assert parser.Input(io.StringIO("1-3 a\n2-4 b\n"), definition, binary=False).parse() == out
+
+    def testBinaryFunction(self):
+        seen = []
+        def raw(b):
+            seen.append(b)
+            return b
+        definition = parser.InputDefinition()
+        definition.addFunction('raw', raw, binary=True)
+        definition.buildersFromStr('''[[
+    [raw ',']
+]]''')
+        assert parser.Input(io.BytesIO(b"a,b\nc\n"), definition).parse() == [[b'a', b'b'], [b'c']]
+        assert seen == [b'a', b'b', b'c']
+
+class FromPathTest(unittest.TestCase):
+    def setUp(self):
+        self.definition = parser.InputDefinition()
+        self.definition.buildersFromStr('''[[
+    ([int '-'] #str# ' ')
+]]''')
+        with open("testfiles/day2-testInput", "rb") as f:
+            self.content = f.read()
+        with open("testfiles/day2-testInput", "r") as f:
+            self.expected = parser.Input(f, self.definition).parse()
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def testCompressed(self):
+        for (name, compress) in [('plain', bytes), ('gz', gzip.compress), ('xz', lzma.compress), ('bz2', bz2.compress)]:
+            path = os.path.join(self.tmp.name, "input.%s" % name)
+            with open(path, "wb") as f:
+                f.write(compress(self.content))
+            for binary in (False, True):
+                with parser.Input.from_path(path, self.definition, binary=binary) as inp:
+                    assert inp.parse() == self.expected
+                    assert parser.isBinaryFile(inp.infile) == binary
+                assert all(f.closed for f in inp.files)
+
+    def testCompression(self):
+        assert parser.compression(gzip.compress(b"x")[:6]) == 'gzip'
+        assert parser.compression(lzma.compress(b"x")[:6]) == 'xz'
+        assert parser.compression(bz2.compress(b"x")[:6]) == 'bz2'
+        assert parser.compression(b'\x28\xb5\x2f\xfd\x00\x00') == 'zstd'
+        assert parser.compression(b'1-3 a:') is None
+
+async def sendChunks(sock, data, size):
+    # Writes data to a socket in pieces, letting the reader run in between
+    loop = asyncio.get_running_loop()
+    for i in range(0, len(data), size):
+        await loop.sock_sendall(sock, data[i:i + size])
+        await asyncio.sleep(0)
+    sock.close()
+
+async def parseSocket(definition, data, size=7):
+    rsock, wsock = socket.socketpair()
+    wsock.setblocking(False)
+    reader, writer = await asyncio.open_connection(sock=rsock)
+    sender = asyncio.ensure_future(sendChunks(wsock, data, size))
+    out = await parser.AsyncInput(reader, definition).parse()
+    await sender
+    writer.close()
+    return out
+
+class AsyncDayTest(DayTest):
+    # Parses the input as it arrives in small pieces over a socket
+    def testParse(self):
+        data = self.infile.read().encode()
+        self.assertSoT(asyncio.run(parseSocket(self.definition, data)))
+
+class Day4Test_Async(AsyncDayTest, Day4Test_Strings):
+    pass
+
+class Day6Test_Async(AsyncDayTest, Day6Test_Strings):
+    pass
+
+class Day16Test_Async(AsyncDayTest, Day16Test_Strings):
+    pass
+
+class Day20Test_Async(AsyncDayTest, Day20Test_Strings):
+    pass
+
+class Day22Test_Async(AsyncDayTest, Day22Test_Strings):
+    pass
+
+class AsyncInputTest(unittest.TestCase):
+    def setUp(self):
+        self.definition = parser.InputDefinition()
+        self.definition.buildersFromStr('''[[
+    [[
+        #int#
+    ]]
+]]''')
+
+    def testRecords(self):
+        # Each group is given as soon as the blank line ending it arrives
+        async def run():
+            reader = asyncio.StreamReader()
+            records = parser.AsyncInput(reader, self.definition).records()
+            reader.feed_data(b"1\n2\n")
+            pending = asyncio.ensure_future(records.__anext__())
+            await asyncio.sleep(0)
+            assert not pending.done()
+            reader.feed_data(b"\n3\n")
+            assert await pending == [1, 2]
+            reader.feed_eof()
+            assert await records.__anext__() == 3
+        asyncio.run(run())
+
+    def testConcurrent(self):
+        async def run():
+            data = [("".join("%d\n" % (i * j) for j in range(1, 20)) + "\n").encode() * 3 for i in range(100)]
+            outs = await asyncio.gather(*[parseSocket(self.definition, d, 5) for d in data])
+            for (i, out) in enumerate(outs):
+                assert out == [[i * j for j in range(1, 20)]] * 3
+        asyncio.run(run())
+
+class IncrementalParserTest(unittest.TestCase):
+    def testRetry(self):
+        definition = parser.InputDefinition()
+        definition.buildersFromStr('''[[
+    [[
+        #int#
+    ]]
+]]''')
+        inc = parser.IncrementalParser(definition)
+        buf = inc.buffer
+        buf.append("1\n")
+        assert list(inc.run()) == []
+        # The group can only end on a blank line, so is not retried before one
+        assert not buf.ready
+        buf.append("2\n")
+        assert not buf.ready
+        buf.append("\n")
+        assert list(inc.run()) == [[1, 2]]
+        buf.close()
+        assert list(inc.run()) == []
+        assert inc.done() and inc.result() == [1, 2]
+
+    def testFeed(self):
+        # Any chunking gives the output of parsing the whole input
+        for case in ChallengerBenchmark.CASES:
+            text = case.generate(random.Random(1), 60)
+            definition = case.definition()
+            expected = parser.Input(io.StringIO(text), definition).parse()
+            for size in (1, 3, 64, len(text)):
+                inc = definition.incremental()
+                for i in range(0, len(text), size):
+                    inc.feed(text[i:i + size])
+                assert inc.close() == expected, (case.name, size)
+            data = text.encode()
+            inc = definition.incremental(binary=True)
+            for i in range(0, len(data), 5):
+                inc.feed(data[i:i + 5])
+            assert inc.close() == expected, case.name
+
+    def testCallback(self):
+        definition = parser.InputDefinition()
+        definition.buildersFromStr('''{{
+    {*str int ':' ' '}
+}}
+[[
+    #int#
+]]''')
+        records = []
+        inc = definition.incremental(records.append)
+        inc.feed("a:1 b:2\nc:")
+        assert records == [{'a': 1, 'b': 2}]
+        inc.feed("3\n\n4\n5")
+        assert records == [{'a': 1, 'b': 2}, {'c': 3}, 4]
+        assert inc.close() == [{'a': 1, 'b': 2, 'c': 3}, [4, 5]]
+        assert records[-1] == 5
+
+class TailTest(unittest.TestCase):
+    def setUp(self):
+        self.definition = parser.InputDefinition()
+        self.definition.buildersFromStr('''[[
+    (#str# #int# ' ')
+]]''')
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "log")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def append(self, data, mode="ab"):
+        with open(self.path, mode) as f:
+            f.write(data)
+
+    def tail(self, state=None):
+        with open(self.path, "rb") as f:
+            return parser.Input(f, self.definition).tail(state)
+
+    def testAppend(self):
+        self.append(b"acc 1\nnop 2\njmp")
+        out, state = self.tail()
+        assert out == [['acc', 1], ['nop', 2]]
+        # The partial last line is parsed again once complete
+        assert state.offset == len(b"acc 1\nnop 2\n")
+        self.append(b" -3\nacc 4\n")
+        out, state = self.tail(state)
+        assert out == [['acc', 1], ['nop', 2], ['jmp', -3], ['acc', 4]]
+        assert state.added == [['jmp', -3], ['acc', 4]] and not state.restarted
+        out, state = self.tail(state)
+        assert state.added == [] and len(out) == 4
+
+    def testRewrite(self):
+        self.append(b"acc 1\nnop 2\n")
+        out, state = self.tail()
+        self.append(b"acc 5\nnop 2\nacc 3\n", "wb")
+        out, state = self.tail(state)
+        assert state.restarted
+        assert out == [['acc', 5], ['nop', 2], ['acc', 3]]
+
+    def testWindow(self):
+        # Only the input just before the offset is read again to check it
+        lines = b"".join(b"acc %d\n" % i for i in range(100))
+        self.append(lines)
+        window = parser.TAILWINDOW
+        try:
+            parser.TAILWINDOW = 64
+            out, state = self.tail()
+            assert state.window == len(lines) - 64 and len(out) == 100
+            self.append(b"nop 1\n")
+            out, state = self.tail(state)
+            assert state.added == [['nop', 1]] and not state.restarted
+            # A change within the window starts over, a file put in its place too
+            self.append(lines[:-3] + b"77\nnop 2\n", "wb")
+            out, state = self.tail(state)
+            assert state.restarted and out[-2:] == [['acc', 77], ['nop', 2]]
+            with open(self.path, "rb") as f, open(self.path + ".new", "wb") as g:
+                g.write(f.read())
+            os.replace(self.path + ".new", self.path)
+            out, state = self.tail(state)
+            assert state.restarted and len(out) == 101
+        finally:
+            parser.TAILWINDOW = window
+
+    def testSections(self):
+        self.definition = parser.InputDefinition()
+        self.definition.buildersFromStr('''[[
+    [[
+        #int#
+    ]]
+]]''')
+        self.append(b"1\n2\n\n3\n")
+        out, state = self.tail()
+        assert out == [1, 2] and state.offset == 5
+        self.append(b"4\n\n")
+        out, state = self.tail(state)
+        assert out == [[1, 2], [3, 4]] and state.added == [[3, 4]]
+        with open(self.path, "rb") as f:
+            assert parser.Input(f, self.definition).parse() == out
+
+class SectionIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.definition = parser.InputDefinition()
+        self.definition.buildersFromStr('''[[
+[[
+[<str None]
+]]
+]]''')
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "input")
+        with open("testfiles/day6-testInput", "rb") as f:
+            self.content = f.read()
+        with open(self.path, "wb") as f:
+            f.write(self.content)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def testSections(self):
+        with open(self.path, "rb") as f:
+            expected = parser.Input(f, self.definition).parse()
+        with open(self.path, "rb") as f:
+            inp = parser.Input(f, self.definition)
+            assert len(inp.index()) == len(expected)
+            assert inp.parse_section(3) == expected[3]
+            assert inp.parse_range(1, 4) == expected[1:4]
+            assert inp.parse_range(0, len(expected)) == expected
+
+    def testSidecar(self):
+        built = []
+        build = parser.SectionIndex.build
+        def counted(*args):
+            built.append(args)
+            return build(*args)
+        parser.SectionIndex.build = counted
+        try:
+            for i in range(2):
+                with open(self.path, "rb") as f:
+                    parser.Input(f, self.definition).parse_section(0)
+            assert len(built) == 1 and os.path.exists(self.path + ".idx")
+            with open(self.path, "ab") as f:
+                f.write(b"\nxyz\n")
+            with open(self.path, "rb") as f:
+                assert parser.Input(f, self.definition).parse_section(-1) == set("xyz")
+            assert len(built) == 2
+        finally:
+            parser.SectionIndex.build = build
+
+    def testLines(self):
+        data = b"1\n2\n\n3\n  \n\n4\n5"
+        definition = parser.InputDefinition()
+        definition.buildersFromStr('''[[
+    #int#
+]]''')
+        inp = parser.Input(io.BytesIO(data), definition)
+        index = inp.index(lines=True)
+        assert list(index.starts) == [0, 5, 11] and list(index.ends) == [4, 7, 14]
+        assert list(index.lines) == [0, 2, 4, 5, 7, 10, 11, 13, 14]
+        assert inp.parse_lines(0, 2) == [1, 2]
+        assert inp.parse_lines(6, 8) == [4, 5]
+
+class LimitTest(unittest.TestCase):
+    def testLimit(self):
+        definition = parser.InputDefinition()
+        definition.buildersFromStr('''[[
+    #int#
+]]''')
+        infile = io.StringIO("".join("%d\n" % i for i in range(1000)))
+        assert parser.Input(infile, definition).parse(limit=3) == [0, 1, 2]
+        # Nothing after the last record taken is read
+        assert infile.tell() == len("0\n1\n2\n")
+        infile.seek(0)
+        assert parser.Input(infile, definition).parse(stop_when=lambda r: r > 4) == [0, 1, 2, 3, 4, 5]
+        infile.seek(0)
+        assert len(parser.Input(infile, definition).parse()) == 1000
+
+    def testBuilders(self):
+        definition = parser.InputDefinition()
+        definition.buildersFromStr('''{{
+    {*str int ':' ' '}
+}}
+[[
+    #int#
+]]''')
+        text = "a:1 b:2\nc:3\n\n4\n5\n6\n"
+        assert parser.Input(io.StringIO(text), definition).parse(limit=1) == [{'a': 1, 'b': 2}]
+        assert parser.Input(io.StringIO(text), definition).parse(limit=4) == [{'a': 1, 'b': 2, 'c': 3}, [4, 5]]
+        definition.builders[1].setLimit(2)
+        assert parser.Input(io.StringIO(text), definition).parse() == [{'a': 1, 'b': 2, 'c': 3}, [4, 5]]
+        with self.assertRaises(ValueError):
+            definition.builders[1].setLimit(0)
+
+    def testThrowToEnd(self):
+        definition = parser.InputDefinition()
+        definition.addBuilder(parser.SingleLineBuilderThrowToEnd(parser.SingleBlock(), "--"))
+        definition.addBuilder(parser.ListBuilder(parser.SingleBlock(), parser.EMPTYLINE))
+        skipped = "".join("x" * (i % 50) + "\n" for i in range(200))
+        text = "first\n" + "head\n" + skipped + "-- \r\n" + "a\nb\n"
+        chunk = parser.SKIPCHUNK
+        try:
+            # Small chunks so lines and the end value fall across them
+            for size in (7, 64, chunk):
+                parser.SKIPCHUNK = size
+                assert parser.Input(io.StringIO(text), definition).parse() == ["head", ["a", "b"]]
+                assert parser.Input(io.BytesIO(text.encode()), definition).parse() == [b"head", [b"a", b"b"]]
+                with tempfile.TemporaryFile("w+") as f:
+                    f.write(text)
+                    f.seek(0)
+                    assert parser.Input(f, definition).parse() == ["head", ["a", "b"]]
+            # One long line then the end value, at every alignment with the chunks
+            for size in (7, 16):
+                parser.SKIPCHUNK = size
+                for n in range(1, 4 * size):
+                    longLine = "first\n" + "head\n" + "x" * n + "\n--\n" + "a\nb\n"
+                    assert parser.Input(io.StringIO(longLine), definition).parse() == ["head", ["a", "b"]]
+                    assert parser.Input(io.BytesIO(longLine.encode()), definition).parse() == [b"head", [b"a", b"b"]]
+        finally:
+            parser.SKIPCHUNK = chunk
+        longLine = "first\n" + "head\n" + "x" * (2 * chunk - 2) + "\n--\n" + "a\nb\n"
+        assert parser.Input(io.StringIO(longLine), definition).parse() == ["head", ["a", "b"]]
+
+        # Decompressing streams are skipped line by line, seeking back would
+        # decompress again from the start
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "input.gz")
+            with gzip.open(path, "wt") as f:
+                f.write(text)
+            with gzip.open(path, "rt") as f:
+                assert not parser.skipPast(f, "--") and f.tell() == 0
+            for binary in (False, True):
+                with parser.Input.from_path(path, definition, binary=binary) as inp:
+                    out = inp.parse()
+                assert out == (["head", ["a", "b"]] if not binary else [b"head", [b"a", b"b"]])
+
+class SinkTest(unittest.TestCase):
+    def testList(self):
+        counts = {}
+        def count(r):
+            counts[r[0]] = counts.get(r[0], 0) + r[1]
+        definition = parser.InputDefinition()
+        definition.addFunction('count', count)
+        definition.buildersFromStr('''[[
+    (#str# #int# ' ')
+]] -> count''')
+        text = "".join("%s %d\n" % (["acc", "nop", "jmp"][i % 3], 1) for i in range(30000))
+        infile = io.StringIO(text)
+        tracemalloc.start()
+        out = parser.Input(infile, definition).parse()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert out is None
+        assert counts == {'acc': 10000, 'nop': 10000, 'jmp': 10000}
+        # Nothing is kept, the records parsed into lists alone would take megabytes
+        assert peak < 100000
+
+    def testBuilders(self):
+        lines = []
+        definition = parser.InputDefinition()
+        definition.addFunction('keep', lines.append)
+        definition.buildersFromStr('''{{
+    {*str int ':' ' '}
+}} -> keep
+((
+    ##
+    [[
+        #int#
+    ]]
+)) "end" -> keep''')
+        text = "a:1 b:2\nc:3\n\nhead\n1\n2\n\nend\n"
+        assert parser.Input(io.StringIO(text), definition).parse() == []
+        assert lines == [{'a': 1, 'b': 2}, {'c': 3}, [1, 2]]
+        del lines[:]
+        inc = definition.incremental()
+        inc.feed(text)
+        assert inc.close() == [] and lines == [{'a': 1, 'b': 2}, {'c': 3}, [1, 2]]
+
+class CategoricalTest(unittest.TestCase):
+    def testLiteral(self):
+        codes = parser.KeyCodes()
+        definition = parser.InputDefinition()
+        definition.addFunction('op', str, categorical=codes)
+        definition.buildersFromStr('''[[
+    (#op# #int# ' ')
+]]''')
+        with open("testfiles/day8-testInput", "r") as f:
+            out = parser.Input(f, definition).parse()
+        assert codes.names == ['nop', 'acc', 'jmp']
+        assert [[codes.names[c], v] for (c, v) in out] == testCaseSoT.Day8Test
+        with open("testfiles/day8-testInput", "rb") as f:
+            assert parser.Input(f, definition).parse() == out
+
+    def testLists(self):
+        definition = parser.InputDefinition()
+        definition.addFunction('dir', str, categorical=True)
+        definition.addFunction('isDir', ChallengerBenchmark.isDir)
+        definition.buildersFromStr('''[[
+    [* dir isDir None]
+]]''')
+        with open("testfiles/day24-testInput", "r") as f:
+            out = parser.Input(f, definition).parse()
+        names = definition.functions['dir'].vocabulary.names
+        assert sorted(names) == ['e', 'ne', 'nw', 'se', 'sw', 'w']
+        assert all(isinstance(l, array.array) and l.typecode == 'B' for l in out)
+        assert [[names[c] for c in l] for l in out] == testCaseSoT.Day24Test
+
+        block = parser.ListBlock(parser.Categorical(int), ' ')
+        out = block.parse(" ".join(str(i) for i in range(300)))
+        assert out.typecode == 'H' and list(out) == list(range(300))
+        block.frozen = True
+        assert block.parse("299 5") == (299, 5)
+
+class ListElementMunchTest(unittest.TestCase):
+    def testReject(self):
+        # After a reject the search starts again one value after the candidate's first
+        def evaluator(d):
+            if d == 'bc':
+                return parser.GACCEPT
+            if d in ('a', 'ab', 'b'):
+                return parser.GCONTINUE
+            return parser.GREJECT
+        block = parser.ListElementMunch(evaluator, str, None)
+        assert block.parse("abc") == ['bc']
+        assert block.parse("abcxbc") == ['bc', 'bc']
+        block = parser.ListElementMunch(lambda d: parser.GACCEPT if d == 'b,c' else \
+            parser.GCONTINUE if d in ('a', 'a,b', 'b') else parser.GREJECT, str, ',')
+        assert block.parse("a,b,c,a,b,c") == ['b,c', 'b,c']
+
+class VocabularyTest(unittest.TestCase):
+    def testSameAsEvaluator(self):
+        rand = random.Random(0)
+        for delimiter in [None, ',']:
+            for i in range(500):
+                vocabulary = list({"".join(rand.choice("abc") for j in range(rand.randint(1, 3))) \
+                    for k in range(rand.randint(1, 5))})
+                inp = (delimiter or "").join(rand.choice("abc") for j in range(rand.randint(0, 15)))
+                expect = parser.ListElementMunch(parser.vocabularyEvaluator(vocabulary, delimiter), \
+                    str, delimiter).parse(inp)
+                assert parser.VocabularyMunch(vocabulary, str, delimiter).parse(inp) == expect
+
+    def testMunch(self):
+        block = parser.VocabularyMunch(['a', 'ab', 'abc'], str, None)
+        # A trailing 'ab' could still grow into 'abc', so it is left like the evaluator would
+        assert block.parse("xabcab") == ['a', 'a']
+        block = parser.VocabularyMunch(['a', 'ab', 'abc'], str, None, longest=True)
+        assert block.parse("xabcab") == ['abc', 'ab']
+        # Tokens may span delimited fields
+        block = parser.VocabularyMunch(['1,2', '3'], str, ',', len)
+        assert block.parse("1,2,3,4,1") == 2
+        with self.assertRaises(TypeError):
+            parser.VocabularyMunch([], str, None)
+
+    def testCategorical(self):
+        definition = parser.InputDefinition()
+        definition.addFunction('dir', str, categorical=True)
+        definition.buildersFromStr('''[[
+    [*= dir ('ne' 'e' 'se' 'sw' 'w' 'nw') None]
+]]''')
+        with open("testfiles/day24-testInput", "rb") as f:
+            out = parser.Input(f, definition).parse()
+        names = definition.functions['dir'].vocabulary.names
+        assert all(isinstance(l, array.array) for l in out)
+        assert [[names[c] for c in l] for l in out] == testCaseSoT.Day24Test
+
+class ValidateTest(unittest.TestCase):
+    def setUp(self):
+        self.definition = parser.InputDefinition()
+        self.definition.buildersFromStr('''[[
+(#str# #int# ' ')
+]]''')
+
+    def testErrors(self):
+        text = "nop +0\nacc x\njmp -4\nacc +3\nnop 1.5\n"
+        errors = parser.Input(io.StringIO(text), self.definition).validate()
+        assert [(e.line, e.text) for e in errors] == [(2, "acc x"), (5, "nop 1.5")]
+        assert isinstance(errors[0], ValueError) and "line 2" in str(errors[0])
+        # The same lines are found in bytes mode
+        errors = parser.Input(io.BytesIO(text.encode()), self.definition).validate()
+        assert [e.line for e in errors] == [2, 5]
+        with self.assertRaises(ValueError):
+            parser.Input(io.StringIO(text), self.definition).parse()
+
+        errors = parser.Input(io.StringIO(text), self.definition).validate(maxErrors=1)
+        assert [e.line for e in errors] == [2]
+        with self.assertRaises(ValueError):
+            parser.Input(io.StringIO(text), self.definition).validate(maxErrors=0)
+
+    def testNoOutput(self):
+        calls = []
+        def record(r):
+            calls.append(r)
+            return r
+        definition = parser.InputDefinition()
+        definition.addBuilder(parser.ListBuilder( \
+            parser.OrBlock([parser.LiteralBlock(int, record), parser.LiteralNoParse("skip")]), \
+            parser.EMPTYLINE, record, sink=record))
+        errors = parser.Input(io.StringIO("1\nskip\n2\nskip it\n"), definition).validate()
+        assert [(e.line, e.message) for e in errors] == [(4, "No parsers for \"skip it\"")]
+        assert calls == []
+
+    def testStructure(self):
+        definition = parser.InputDefinition()
+        definition.buildersFromStr('''((
+    #"your ticket:"#
+    [int ',']
+))''')
+        inp = parser.Input(io.StringIO("your ticket:\n7,1,14\n"), definition)
+        assert inp.validate() == []
+        errors = parser.Input(io.StringIO("your tickets:\n7,1,x\n\n3,4\n"), definition).validate()
+        assert [e.line for e in errors] == [1, 2, 4]
+        assert errors[2].message == "Input after the last builder"
+
+        definition = parser.InputDefinition()
+        definition.addBuilder(parser.ListBuilder(parser.LiteralBlock(int), "end"))
+        assert parser.Input(io.StringIO("1\n2\nend\n"), definition).validate() == []
+        errors = parser.Input(io.StringIO("1\n2\n"), definition).validate()
+        assert [(e.line, e.message) for e in errors] == [(2, "Input ended before \"end\"")]
+
+    def testSpans(self):
+        # Errors in records of several lines are reported at their first line
+        with open("testfiles/day4-testInput", "r") as f:
+            lines = f.read().split("\n")
+        lines[4] = lines[4].replace(":", " ", 1)
+        text = "\n".join(lines)
+        definition = parser.InputDefinition()
+        definition.addBuilder(parser.ListBuilder( \
+            parser.MultiLineSpanBuilder( \
+                parser.HashLineBlock(parser.HashPairBlock(str, str, ':'), ' '), \
+                ' ', parser.EMPTYLINE), \
+            parser.EMPTYLINE))
+        errors = parser.Input(io.StringIO(text), definition).validate()
+        assert [e.line for e in errors] == [4]
+        # Line by line the line itself is
+        definition = parser.InputDefinition()
+        definition.buildersFromStr('''[[
+{{
+{*str str ':' ' '}
+}}
+]]''')
+        errors = parser.Input(io.StringIO(text), definition).validate()
+        assert [e.line for e in errors] == [5]
+
+class RangeTest(unittest.TestCase):
+    def testRanges(self):
+        block = parser.RangeBlock(int)
+        assert block.parse("1-3") == range(1, 4)
+        assert block.parse("-5--2") == range(-5, -1)
+        assert block.parse("7") == range(7, 8)
+        self.assertRaises(ValueError, block.parse, "3-1")
+        self.assertRaises(TypeError, parser.RangeBlock, int, None)
+
+    def testIntervalSet(self):
+        s = parser.IntervalSet([range(5, 8), range(1, 4), range(2, 5), range(10, 10), range(12, 14)])
+        assert s.ranges() == [range(1, 8), range(12, 14)]
+        assert [v for v in range(16) if v in s] == [1, 2, 3, 4, 5, 6, 7, 12, 13]
+        assert len(s) == 9
+        assert (s | parser.IntervalSet([range(8, 12)])).ranges() == [range(1, 14)]
+        assert {s: 1}[parser.IntervalSet(s.ranges())] == 1
+        self.assertRaises(ValueError, parser.IntervalSet, [range(0, 10, 2)])
+
+    def testTickets(self):
+        definition = parser.InputDefinition()
+        definition.buildersFromStr('''{{
+{str [-< int '-' ' or '] ':'}
+}}
+((
+    #"your ticket:"#
+    [int ',']
+))
+((
+    #"nearby tickets:"#
+    [[
+        [int ',']
+    ]]
+))''')
+        for mode in ("r", "rb"):
+            with open("testfiles/day16-testInput", mode) as f:
+                (rules, mine, nearby) = parser.Input(f, definition).parse()
+            (expected, expectedMine, expectedNearby) = testCaseSoT.Day16Test
+            assert {k: [[r[0], r[-1]] for r in v.ranges()] for (k, v) in rules.items()} == expected
+            assert (mine, nearby) == (expectedMine, expectedNearby)
+
+            valid = parser.IntervalSet.union(*rules.values())
+            inRules = lambda v: any(lo <= v <= hi for r in expected.values() for (lo, hi) in r)
+            for ticket in nearby:
+                assert [v in valid for v in ticket] == [inRules(v) for v in ticket]
+
+class GraphTest(unittest.TestCase):
+    def setUp(self):
+        def bags(b):
+            if b == "no other bags.":
+                return None
+            return {m.group(2): int(m.group(1)) for m in re.finditer(r"(\d+) (.+?) bags?", b)}
+        self.definition = parser.InputDefinition()
+        self.definition.addFunction('bags', bags)
+        self.definition.buildersFromStr('''<<
+{str bags " bags contain "}
+>>''')
+
+    def testBags(self):
+        with open("testfiles/day7-testInput", "r") as f:
+            graph = parser.Input(f, self.definition).parse()
+        expected = {k.strip(): v or {} for (k, v) in testCaseSoT.Day7Test.items()}
+        assert graph.toDict() == expected
+        assert len(graph) == 9 and len(graph.targets) == 13
+        gold = graph.ids['shiny gold']
+        assert [graph.names[t] for t in graph.neighbours(gold)] == ['dark olive', 'vibrant plum']
+        assert graph.offsets.typecode == 'Q' and graph.weights.typecode == 'q'
+        assert sorted(graph.names[t] for t in graph.reverse().neighbours(gold)) == ['bright white', 'muted yellow']
+        assert graph.reverse().reverse() == graph
+
+        with open("testfiles/day7-testInput", "rb") as f:
+            assert parser.Input(f, self.definition).parse() == graph
+        inc = self.definition.incremental()
+        with open("testfiles/day7-testInput", "r") as f:
+            inc.feed(f.read())
+        assert inc.close() == graph
+
+    def testRules(self):
+        definition = parser.InputDefinition()
+        definition.addFunction('quoteTrim', lambda s: s[1])
+        definition.buildersFromStr('''<<
+{int ([int ' '] or #quoteTrim# [int ' '] ' | ') ': '}
+>>
+[[
+[str None]
+]]''')
+        with open("testfiles/day19-testInput", "r") as f:
+            (graph, messages) = parser.Input(f, definition).parse()
+        assert messages == testCaseSoT.Day19Test[1]
+        edges = lambda name: [(graph.names[t], w) for (t, w) in graph.edges(graph.ids[name])]
+        # Sequences weigh 1, alternatives are numbered, terminals are nodes without edges
+        assert edges(0) == [(4, 1), (1, 1), (5, 1)]
+        assert edges(1) == [(2, 1), (3, 1), (3, 2), (2, 2)]
+        assert edges(4) == [('a', 1)] and edges('a') == []
+
+    def testRepeatsAndWeights(self):
+        definition = parser.InputDefinition()
+        definition.addFunction('edges', lambda s: {t: float(w) for (t, w) in (e.split('=') for e in s.split(','))})
+        definition.buildersFromStr('''<<
+{<[str ','] edges ' -> '}
+>>''')
+        graph = parser.Input(io.StringIO("a,b -> c=1\nc -> a=0.5\na -> d=2\n"), definition).parse()
+        assert graph.weights.typecode == 'd'
+        assert graph.toDict() == {'a': {'c': 1.0, 'd': 2.0}, 'b': {'c': 1.0}, 'c': {'a': 0.5}, 'd': {}}
+        self.assertRaises(TypeError, parser.GraphBuilder, parser.HashLineBlock(parser.HashPairBlock(str, str, '='), ' '), '')
+
+class FrozenTest(unittest.TestCase):
+    def testCases(self):
+        for case in ChallengerBenchmark.CASES:
+            text = case.generate(random.Random(1), 60)
+            frozen = case.definition()
+            frozen.setFrozen()
+            out = parser.Input(io.StringIO(text), frozen).parse()
+            assert parser.thaw(out) == parser.Input(io.StringIO(text), case.definition()).parse()
+            assert parser.Input(io.BytesIO(text.encode()), frozen).parse() == out
+            inc = frozen.incremental()
+            inc.feed(text)
+            assert inc.close() == out
+
+    def testTypes(self):
+        definition = parser.InputDefinition(frozen=True)
+        definition.buildersFromStr('''{{
+    {*str int ':' ' '}
+}}
+[[
+    ([int '-'] [<str None] ' ')
+]]''')
+        out = parser.Input(io.StringIO("a:1 b:2\nc:3\n\n1-3 ab\n2-4 c\n"), definition).parse()
+        assert out == ({'a': 1, 'b': 2, 'c': 3}, (((1, 3), frozenset('ab')), ((2, 4), frozenset('c'))))
+        assert isinstance(out, tuple) and isinstance(out[0], parser.FrozenDict)
+        assert {out: 1}[out] == 1
+        self.assertRaises(TypeError, out[0].update, {'d': 4})
+        self.assertRaises(TypeError, out[0].__setitem__, 'd', 4)
+        assert pickle.loads(pickle.dumps(out)) == out
+
+        definition.setFrozen(False)
+        out = parser.Input(io.StringIO("a:1\n\n1-3 ab\n"), definition).parse()
+        assert out == [{'a': 1}, [[1, 3], {'a', 'b'}]]
+        self.assertRaises(TypeError, parser.InputDefinition, frozen=1)
+
+@unittest.skipIf(parser.numpyModule() is None, "numpy is not installed")
+class NumericLoadTest(unittest.TestCase):
+    def setUp(self):
+        self.numpyMin = parser.NUMPYMIN
+        rand = random.Random(0)
+        self.inputs = {
+            "[[\n#int#\n]]": "".join("%d\n" % rand.randint(-10**17, 10**17) for i in range(200)),
+            "[[\n[int ' ']\n]]": "".join("%d %d +%d\n" % (rand.randint(-99, 99), i, i) for i in range(200)),
+            "[[\n[int ',']\n]]": "".join(",".join("0%d" % j for j in range(i % 5 + 1)) + "\n" for i in range(200)),
+            "[[\n[int None]\n]]": "".join("%08d\n" % rand.randint(0, 10**8 - 1) for i in range(200)),
+            }
+
+    def tearDown(self):
+        parser.NUMPYMIN = self.numpyMin
+
+    def parseBoth(self, notation, text, binary=False, frozen=False):
+        # The outputs loaded by numpy and parsed line by line
+        definition = parser.InputDefinition(frozen=frozen)
+        definition.buildersFromStr(notation)
+        make = (lambda: io.BytesIO(text.encode())) if binary else (lambda: io.StringIO(text))
+        parser.NUMPYMIN = self.numpyMin
+        loaded = parser.Input(make(), definition).parse()
+        parser.NUMPYMIN = float('inf')
+        return (loaded, parser.Input(make(), definition).parse())
+
+    def testPlans(self):
+        plans = []
+        for notation in list(self.inputs) + ["[[\n[str ' ']\n]]", "[[\n[int '-']\n]]", "[[\n#int#\n]] \"end\""]:
+            definition = parser.InputDefinition()
+            definition.buildersFromStr(notation)
+            plans.append(parser.numericPlan(definition.builders[0]))
+        assert plans == ['scalar', 'row', 'row', 'chars', None, None, None]
+
+        # Without numpy every section is parsed line by line
+        numpy = parser.NUMPY
+        parser.NUMPY = False
+        try:
+            definition = parser.InputDefinition()
+            definition.buildersFromStr("[[\n#int#\n]]")
+            assert parser.numericPlan(definition.builders[0]) is None
+            (loaded, parsed) = self.parseBoth("[[\n#int#\n]]", self.inputs["[[\n#int#\n]]"])
+            assert loaded == parsed
+        finally:
+            parser.NUMPY = numpy
+
+    def testSameValues(self):
+        for (notation, text) in self.inputs.items():
+            for binary in (False, True):
+                for frozen in (False, True):
+                    (loaded, parsed) = self.parseBoth(notation, text + "\n" + text, binary, frozen)
+                    assert loaded == parsed and type(loaded) == type(parsed)
+                    assert all(type(r) == type(parsed[0]) for r in loaded)
+        (loaded, parsed) = self.parseBoth("[[\n#int#\n]]", self.inputs["[[\n#int#\n]]"].rstrip())
+        assert loaded == parsed and all(type(v) is int for v in loaded)
+
+    def testFallback(self):
+        # Anything but plain ints is left to int(), which may take it or raise
+        text = self.inputs["[[\n#int#\n]]"]
+        for odd in ["1_000", " 7", "99999999999999999999", "٣", "+0"]:
+            (loaded, parsed) = self.parseBoth("[[\n#int#\n]]", text + odd + "\n" + text)
+            assert loaded == parsed
+        for odd in ["1.5", "+", "4-"]:
+            self.assertRaises(ValueError, self.parseBoth, "[[\n#int#\n]]", text + odd + "\n" + text)
+        self.assertRaises(ValueError, self.parseBoth, "[[\n[int ' ']\n]]", "1  2\n" * 100)
+
+    def testNested(self):
+        text = "Player 1:\n" + self.inputs["[[\n#int#\n]]"] + "\nPlayer 2:\n" + self.inputs["[[\n#int#\n]]"]
+        (loaded, parsed) = self.parseBoth("((\n##\n[[\n#int#\n]]\n))", text)
+        assert loaded == parsed and len(loaded) == 2
+
+    def testValidate(self):
+        # Sections checked whole by numpy give the errors, and lines, of checking
+        # them line by line
+        text = self.inputs["[[\n#int#\n]]"]
+        notation = "((\n##\n[[\n#int#\n]]\n))\n[[\n[int ' ']\n]]"
+        rows = self.inputs["[[\n[int ' ']\n]]"]
+        inputs = [
+            "Player 1:\n" + text + "\nPlayer 2:\n" + text + "\n\n" + rows,
+            "Player 1:\n" + text + "1_000\n" + text + "\n\n" + rows.rstrip(),
+            "Player 1:\n" + text[:20] + "\n\n" + rows + "\n5 6\n",
+            "Player 1:\n" + text + "\nPlayer 2:\n" + text + "x\n" + text + "\n\n" + rows + "1 x\n" + rows,
+            ]
+        definition = parser.InputDefinition()
+        definition.buildersFromStr(notation)
+        for inp in inputs:
+            for make in (io.StringIO, lambda t: io.BytesIO(t.encode())):
+                errors = parser.Input(make(inp), definition).validate()
+                numpy = parser.NUMPY
+                parser.NUMPY = False
+                try:
+                    expected = parser.Input(make(inp), definition).validate()
+                finally:
+                    parser.NUMPY = numpy
+                assert [(e.line, e.message) for e in errors] == [(e.line, e.message) for e in expected]
+        assert [e.line for e in errors] == [404, 807]
+
+class StackExecutorTest(unittest.TestCase):
+    def parseBoth(self, definition, text):
+        # The outputs (or errors) of the recursive and stack executors
+        outs = []
+        for executor in parser.EXECUTORS:
+            definition.setExecutor(executor)
+            try:
+                outs.append(parser.Input(io.StringIO(text), definition).parse())
+            except Exception as e:
+                outs.append((type(e), str(e)))
+        return outs
+
+    def testSameOutputs(self):
+        cases = [
+            ("[[\n([int '-'] #str# ' ')\n]]", "1-3 a\n2-4 b\n\n"),
+            ("{{\n{int ([int ' '] or #quoteTrim# [int ' '] ' | ') ': '}\n}}", '0: 4 1 5\n1: 2 3 | 3 2\n4: "a"\n'),
+            ("{{\n{str [-< int '-' ' or '] ':'}\n}}", "class: 1-3 or 5-7\nrow: 6-11 or 33-44\n"),
+            ("[[\n((\n(#\"Tile\"# #tileId# ' ')\n[[\n[str None]\n]]\n))\n]]", "Tile 12:\n#.\n.#\n\nTile 7:\n..\n##\n"),
+            ("[[\n{< rev [<str ' '] >[str ', '] endTrim< ' (contains ' }\n]]", "a b (contains x, y)\nc (contains z)\n"),
+            ("[[\n#int# or #str#\n]]", "1\nx\n"),
+            ("[[\n#int#\n]]", "1\nx\n"),
+            ]
+        for (notation, text) in cases:
+            definition = parser.InputDefinition()
+            definition.addFunction('quoteTrim', lambda s: s[1])
+            definition.addFunction('tileId', lambda s: int(s[:-1]))
+            definition.addFunction('rev', lambda s: s)
+            definition.addFunction('endTrim', lambda s: s[:-1])
+            definition.buildersFromStr(notation)
+            (recursive, stack) = self.parseBoth(definition, text)
+            assert recursive == stack
+
+    def testDeep(self):
+        # Far deeper than the recursion limit, the 'or' chain only matches at the end
+        block = parser.LiteralBlock(str)
+        for i in range(sys.getrecursionlimit() * 2):
+            block = parser.OrBlock([parser.LiteralBlock(int), parser.EncapsulatedLine(str.strip, block)])
+        definition = parser.InputDefinition(executor='stack')
+        definition.addBuilder(parser.ListBuilder(block, ""))
+        assert parser.Input(io.StringIO("x\n12\n"), definition).parse() == ["x", 12]
+        # Copies for threads, the bytes definition and compiling walk the tree
+        # without recursing too
+        assert list(definition.parse_many(["x\n12\n"] * 4, workers=2)) == [["x", 12]] * 4
+        assert parser.Input(io.BytesIO(b"x\n12\n"), definition).parse() == ["x", 12]
+        definition.compile()
+        assert parser.Input(io.StringIO("x\n12\n"), definition).parse() == ["x", 12]
+        # Checks are nested functions, so validate is still limited by recursion
+        self.assertRaises(RecursionError, parser.Input(io.StringIO("x\n"), definition).validate)
+
+        block = parser.LiteralBlock(int)
+        for i in range(sys.getrecursionlimit() * 2):
+            block = parser.MultiBlockLine([block, parser.LiteralNoParse()], ',')
+        definition = parser.InputDefinition(executor='stack')
+        definition.addBuilder(parser.ListBuilder(block, ""))
+        assert parser.Input(io.StringIO("7" + "," * sys.getrecursionlimit() * 2), definition).parse() == 7
+        definition.compile()
+        assert parser.Input(io.StringIO("7" + "," * sys.getrecursionlimit() * 2), definition).parse() == 7
+        self.assertRaises(ValueError, parser.Input(io.StringIO("y,"), definition).parse)
+
+    def testLimits(self):
+        definition = parser.InputDefinition(executor='stack')
+        definition.buildersFromStr("[[\n#int#\n]]\n[[\n#str#\n]]")
+        assert parser.Input(io.StringIO("1\n2\n3\n\na\nb\n"), definition).parse() == [[1, 2, 3], ['a', 'b']]
+        # Limits and sinks set after the program is built are still applied
+        seen = []
+        definition.builders[1].setSink(seen.append)
+        definition.builders[0].setLimit(2)
+        assert parser.Input(io.StringIO("1\n2\n3\n\na\nb\n"), definition).parse() == [[1, 2]]
+        assert seen == ['3']
+
+    def testErrors(self):
+        self.assertRaises(ValueError, parser.InputDefinition, executor='loop')
+        self.assertRaises(ValueError, parser.InputDefinition().setExecutor, 'loop')
+
+class ParseManyTest(unittest.TestCase):
+    def setUp(self):
+        self.definition = parser.InputDefinition()
+        self.definition.buildersFromStr('''[[
+    ([int '-'] #str# ' ')
+]]''')
+        self.items = ["%d-%d a\n%d-3 b\n" % (i, i + 1, i) for i in range(1000)] + ["5-6 c\n"]
+        self.expected = [parser.Input(io.StringIO(t), self.definition).parse() for t in self.items]
+
+    def testSerial(self):
+        assert list(self.definition.parse_many(self.items)) == self.expected
+        assert list(self.definition.parse_many(iter(self.items), ordered=False)) == list(enumerate(self.expected))
+        assert list(self.definition.parse_many(t.encode() for t in self.items[:3])) == \
+            [parser.Input(io.BytesIO(t.encode()), self.definition).parse() for t in self.items[:3]]
+
+    def testPools(self):
+        for executor in ('thread', 'process'):
+            out = self.definition.parse_many(self.items, workers=3, executor=executor, chunksize=7)
+            assert list(out) == self.expected
+            out = self.definition.parse_many(self.items, workers=3, executor=executor, ordered=False, chunksize=7)
+            assert sorted(out) == list(enumerate(self.expected))
+
+    def testPaths(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for (i, t) in enumerate(self.items[:4]):
+                paths.append(pathlib.Path(tmp, "input%d.gz" % i))
+                with gzip.open(paths[-1], "wt") as f:
+                    f.write(t)
+            assert list(self.definition.parse_many(paths)) == self.expected[:4]
+            assert list(self.definition.parse_many(paths, workers=2, binary=True)) == self.expected[:4]
+
+    def testErrors(self):
+        self.assertRaises(ValueError, self.definition.parse_many, self.items, executor='fiber')
+        self.assertRaises(ValueError, self.definition.parse_many, self.items, workers=0)
+        self.assertRaises(TypeError, list, self.definition.parse_many([1]))
+        self.assertRaises(ValueError, list, self.definition.parse_many(["a-b c\n"], workers=2))
+
+class SharedTransportTest(unittest.TestCase):
+    def setUp(self):
+        self.definition = parser.InputDefinition()
+        self.definition.buildersFromStr('''[[
+[str None]
+]]
+[[
+#int#
+]]''')
+        rand = random.Random(0)
+        self.items = []
+        for i in range(40):
+            grid = "".join("".join(rand.choice(".#") for x in range(12)) + "\n" for y in range(8))
+            # Every other input has too few numbers to be shared
+            numbers = "".join("%d\n" % rand.randint(-10**12, 10**12) for n in range(100 if i % 2 else 5))
+            self.items.append(grid + "\n" + numbers)
+        self.expected = [parser.Input(io.StringIO(t), self.definition).parse() for t in self.items]
+
+    def segments(self):
+        return set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+    def testShared(self):
+        before = self.segments()
+        out = list(self.definition.parse_many(self.items, workers=2, executor='process', chunksize=3, transport='shared'))
+        assert [parser.unshare(o) for o in out] == self.expected
+        (grid, numbers) = out[1]
+        assert isinstance(grid, memoryview) and grid.format == 'c' and grid.shape == (8, 12)
+        assert isinstance(numbers, memoryview) and numbers.format == 'q' and numbers.tolist() == self.expected[1][1]
+        assert out[0][1] == self.expected[0][1]
+        out = self.definition.parse_many(self.items, workers=2, executor='process', ordered=False, transport='shared')
+        assert sorted((i, parser.unshare(o)) for (i, o) in out) == list(enumerate(self.expected))
+        assert self.segments() <= before
+
+    def testClose(self):
+        before = self.segments()
+        out = self.definition.parse_many(self.items, workers=2, executor='process', chunksize=2, transport='shared')
+        assert parser.unshare(next(out)) == self.expected[0]
+        out.close()
+        assert self.segments() <= before
+
+    def testShareValues(self):
+        assert parser.shareValues([1] * (parser.SHAREMIN - 1)) is None
+        assert parser.shareValues([1, 2.5] * parser.SHAREMIN) is None
+        assert parser.shareValues([True] * parser.SHAREMIN) is None
+        assert parser.shareValues([2**70] * parser.SHAREMIN) is None
+        assert parser.shareValues([["ab", "c"]] * parser.SHAREMIN) is None
+        # Cells of other lengths adding up to the width would come back split
+        assert parser.shareValues([["ab", ""]] * parser.SHAREMIN) is None
+        assert parser.shareValues([["a", "", "bc"]] * parser.SHAREMIN) is None
+        (data, format, shape) = parser.shareValues([[1.5, 2.5]] * parser.SHAREMIN)
+        assert format == 'd' and shape == (parser.SHAREMIN, 2) and len(data) == 16 * parser.SHAREMIN
+        (data, format, shape) = parser.shareValues(array.array('i', range(parser.SHAREMIN)))
+        assert format == 'i' and shape == (parser.SHAREMIN,)
+
+    def testErrors(self):
+        self.assertRaises(ValueError, self.definition.parse_many, self.items, transport='mmap')
+        self.assertRaises(ValueError, self.definition.parse_many, self.items, workers=2, transport='shared')
+        self.assertRaises(ValueError, self.definition.parse_many, self.items, transport='shared')
+
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.socketPath = os.path.join(self.tmp.name, "parser.sock")
+        self.definitions = {
+            'passwords': "[[\n([int '-'] #str# ' ')\n]]",
+            'numbers': "[[\n#int#\n]]",
+            }
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def serve(self, processes):
+        server = ChallengerServer.ParseServer(self.socketPath, self.definitions, 2, processes)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def expected(self, name, path):
+        definition = parser.InputDefinition()
+        definition.buildersFromStr(self.definitions[name])
+        with open(path) as f:
+            return parser.Input(f, definition).parse()
+
+    def testParse(self):
+        for processes in (True, False):
+            with self.serve(processes) as server:
+                with ChallengerServer.ParseClient(self.socketPath) as client:
+                    for i in range(3):
+                        assert client.parse('passwords', "testfiles/day2-testInput") == \
+                            self.expected('passwords', "testfiles/day2-testInput")
+                        assert client.parse('numbers', "testfiles/day1-testInput", binary=True) == \
+                            self.expected('numbers', "testfiles/day1-testInput")
+                    assert client.parse('numbers', "testfiles/day1-testInput", limit=2) == \
+                        self.expected('numbers', "testfiles/day1-testInput")[:2]
+                server.shutdown()
+            assert not os.path.exists(self.socketPath)
+
+    def testErrors(self):
+        with self.serve(True) as server:
+            with ChallengerServer.ParseClient(self.socketPath) as client:
+                self.assertRaises(KeyError, client.parse, 'tickets', "testfiles/day2-testInput")
+                self.assertRaises(FileNotFoundError, client.parse, 'numbers', "testfiles/missing")
+                self.assertRaises(ValueError, client.parse, 'numbers', "testfiles/day2-testInput")
+                # The connection is still usable after errors
+                assert client.parse('numbers', "testfiles/day1-testInput") == \
+                    self.expected('numbers', "testfiles/day1-testInput")
+            server.shutdown()
+
+    def testRequests(self):
+        with self.serve(True) as server:
+            assert stat.S_IMODE(os.stat(self.socketPath).st_mode) == 0o600
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.socketPath)
+            # Requests are JSON, a pickle is refused rather than loaded
+            ChallengerServer.sendFrame(sock, pickle.dumps({'definition': 'numbers', 'path': "x"}))
+            response = ChallengerServer.recvFrame(sock)
+            assert response[:1] == ChallengerServer.ERROR
+            assert json.loads(response[1:])[0] == "UnicodeDecodeError"
+            sock.close()
+            server.shutdown()
+
+    def testServers(self):
+        # Each server keeps its own definitions
+        for processes in (True, False):
+            other = os.path.join(self.tmp.name, "other.sock")
+            with self.serve(processes) as server:
+                with ChallengerServer.ParseServer(other, {'numbers': "[[\n#str#\n]]"}, 1, processes) as second:
+                    threading.Thread(target=second.serve_forever, daemon=True).start()
+                    with ChallengerServer.ParseClient(self.socketPath) as client:
+                        assert client.parse('numbers', "testfiles/day1-testInput") == \
+                            self.expected('numbers', "testfiles/day1-testInput")
+                    with ChallengerServer.ParseClient(other) as client:
+                        assert client.parse('numbers', "testfiles/day1-testInput")[0] == "1721"
+                        self.assertRaises(KeyError, client.parse, 'passwords', "testfiles/day2-testInput")
+                    second.shutdown()
+                server.shutdown()
+
+class BenchmarkTest(unittest.TestCase):
+    def testCases(self):
+        # Every generator must produce input its definition accepts
+        for case in ChallengerBenchmark.CASES:
+            r = ChallengerBenchmark.measure(case, lines=50, repeat=1)
+            assert r['lines'] > 0 and r['lines_per_s'] > 0 and r['peak_kib'] > 0
+
+    def testCompare(self):
+        baseline = {'list': {'lines_per_s': 1000, 'peak_kib': 100}}
+        assert ChallengerBenchmark.compare({'list': {'lines_per_s': 900, 'peak_kib': 110}}, baseline, 0.2) == []
+        assert len(ChallengerBenchmark.compare({'list': {'lines_per_s': 700, 'peak_kib': 130}}, baseline, 0.2)) == 2
+        assert ChallengerBenchmark.compare({'grid': {'lines_per_s': 1, 'peak_kib': 1}}, baseline, 0.2) == []
+
 class GrammarTest():
     def testGrammar(self):
         #print(self.TESTSTR)
@@ -656,6 +2071,30 @@ class GrammarTest_Builders(GrammarTest, unittest.TestCase):
             ('}}', '","'),
             ]
 
+class GrammarTest_BuilderSink(GrammarTest, unittest.TestCase):
+    def setUp(self):
+        self.TESTSTR = \
+''')) -> consume
+]] "." / call -> consume
+}} / call -> consume'''
+        self.expect = [
+            ('))', '->', 'consume'),
+            (']]', '"."', '/', 'call', '->', 'consume'),
+            ('}}', '/', 'call', '->', 'consume'),
+            ]
+
+class GrammarTest_GraphBuilder(GrammarTest, unittest.TestCase):
+    def setUp(self):
+        self.TESTSTR = \
+'''<<
+>>
+>> "." / call -> consume'''
+        self.expect = [
+            ('<<'),
+            ('>>'),
+            ('>>', '"."', '/', 'call', '->', 'consume'),
+            ]
+
 class GrammarTest_LiteralBlock(GrammarTest, unittest.TestCase):
     def setUp(self):
         self.TESTSTR = \
@@ -696,6 +2135,26 @@ class GrammarTest_SetBlock(GrammarTest, unittest.TestCase):
             ('[<', 'int', '\'.\'', '/', 'call', ']'),
             ]
 
+class GrammarTest_RangeBlock(GrammarTest, unittest.TestCase):
+    def setUp(self):
+        self.TESTSTR = \
+'''[-int '-']
+[-<int '-' ' or ' /call]'''
+        self.expect = [
+            ('[-', 'int', '\'-\'', ']'),
+            ('[-<', 'int', '\'-\'', '\' or \'', '/', 'call', ']'),
+            ]
+
+class GrammarTest_VocabularyMunch(GrammarTest, unittest.TestCase):
+    def setUp(self):
+        self.TESTSTR = \
+'''[*=str ('e' 'se' 'w') None]
+[*=str ('a' 'b') ',' /call]'''
+        self.expect = [
+            ('[*=', 'str', '(', ["'e'", "'se'", "'w'"], ')', 'None', ']'),
+            ('[*=', 'str', '(', ["'a'", "'b'"], ')', "','", '/', 'call', ']'),
+            ]
+
 class GrammarTest_HashPair(GrammarTest, unittest.TestCase):
     def setUp(self):
         self.TESTSTR = \
@@ -710,4 +2169,16 @@ class GrammarTest_HashPair(GrammarTest, unittest.TestCase):
             ('{', ('#', 'func', '#'), ('#', 'func', '#'), '\' \'', '}'),
             ]
 
+class GrammarTest_RegexBlock(GrammarTest, unittest.TestCase):
+    def setUp(self):
+        self.TESTSTR = \
+'''/(\d+) (.*)/
+/(\d+)-(\d+)/(int int /call)
+([int ' '] /a\/b/ ' ')'''
+        self.expect = [
+            ('/(\\d+) (.*)/'),
+            ('/(\\d+)-(\\d+)/', '(', ['int', 'int'], '/', 'call', ')'),
+            ('(', [('[', 'int', '\' \'', ']'), '/a\\/b/'], '\' \'', ')'),
+            ]
+
 unittest.main()
\ No newline at end of file